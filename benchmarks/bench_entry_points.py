@@ -0,0 +1,327 @@
+"""
+Benchmarks for every public sparse_dot_mkl entry point against the equivalent scipy or numpy operation,
+across matrix size, density, data type, MKL integer width, and MKL threads
+
+These follow the airspeed velocity (asv) conventions (time_ and peakmem_ benchmarks; see asv.conf.json),
+and can also be run directly to print the speedup over scipy/numpy and the peak memory for each entry point
+(the increase in process resident memory while it runs, so memory allocated inside MKL is included):
+
+    python -m benchmarks.bench_entry_points
+
+The int64 index parameter dispatches every call to the ILP64 (_64) MKL functions.
+Benchmarks for parameters which can't be run with the loaded MKL (e.g. int64 indices without ILP64 functions)
+are skipped.
+"""
+
+import os
+import sys
+import time
+import subprocess
+import numpy as np
+import scipy.sparse as _spsparse
+import scipy.sparse.linalg as _spsparse_linalg
+from sparse_dot_mkl import dot_product_mkl, gram_matrix_mkl, sparse_qr_solve_mkl, prepare_mkl, release_memory
+from sparse_dot_mkl._mkl_interface import MKL, MKL64, _mkl_init
+
+SEED = 50
+
+SIZES = [2000, 20000]
+DENSITIES = [0.0005, 0.005]
+DTYPES = ["float32", "float64"]
+INDEX_TYPES = ["int32", "int64"]
+THREADS = [1, 4]
+
+# Resident memory is sampled from /proc while a function runs for peak memory
+RSS_FILE = "/proc/self/statm"
+RSS_INTERVAL = 0.001
+
+# Number of columns in dense right-hand matrices and in sparse gram matrix inputs
+DENSE_COLUMNS = 64
+GRAM_COLUMNS = 1000
+
+
+def _set_index_type(index):
+    """
+    Make every call use the LP64 (int32) or ILP64 (int64) interface
+
+    :param index: "int32" or "int64"
+    :type index: str
+    """
+
+    _mkl_init()
+
+    if index == "int64" and MKL.MKL_INT_NUMPY != np.int64:
+        if MKL64.MKL_INT is None:
+            raise NotImplementedError("This MKL does not have ILP64 (_64) functions")
+
+        MKL.MKL_LP64_MAX = 0
+
+    elif index == "int32" and MKL.MKL_INT_NUMPY == np.int64:
+        raise NotImplementedError("MKL is using the ILP64 interface for every call")
+
+
+def _reset_index_type():
+    MKL.MKL_LP64_MAX = np.iinfo(np.int32).max
+
+
+def _sparse(rows, cols, density, dtype, seed=SEED):
+    matrix = _spsparse.random(rows, cols, density=density, format="csr", dtype=dtype, random_state=seed)
+
+    # Cast indices up front so that index casting isn't timed
+    return prepare_mkl(matrix)
+
+
+class _EntryPoint:
+    """
+    Compare a sparse_dot_mkl call (mkl) to the scipy or numpy call which gives the same result (reference)
+    """
+
+    params = [SIZES, DENSITIES, DTYPES, INDEX_TYPES, THREADS]
+    param_names = ["n", "density", "dtype", "index", "threads"]
+
+    def setup(self, n, density, dtype, index, threads):
+        _set_index_type(index)
+        self.make_operands(n, density, np.dtype(dtype))
+
+    def teardown(self, *args):
+        _reset_index_type()
+
+    def make_operands(self, n, density, dtype):
+        raise NotImplementedError
+
+    def mkl(self, threads):
+        raise NotImplementedError
+
+    def reference(self):
+        raise NotImplementedError
+
+    def time_mkl(self, *args):
+        self.mkl(args[-1])
+
+    def time_reference(self, *args):
+        self.reference()
+
+    def peakmem_mkl(self, *args):
+        self.mkl(args[-1])
+
+    def peakmem_reference(self, *args):
+        self.reference()
+
+
+class SparseSparse(_EntryPoint):
+
+    def make_operands(self, n, density, dtype):
+        self.matrix_a = _sparse(n, n, density, dtype)
+        self.matrix_b = _sparse(n, n, density, dtype, seed=SEED + 1)
+
+    def mkl(self, threads):
+        return dot_product_mkl(self.matrix_a, self.matrix_b, threads=threads)
+
+    def reference(self):
+        return self.matrix_a.dot(self.matrix_b)
+
+
+class SparseDenseC(_EntryPoint):
+
+    order = "C"
+
+    def make_operands(self, n, density, dtype):
+        self.matrix_a = _sparse(n, n, density, dtype)
+        self.matrix_b = np.asarray(np.random.default_rng(SEED).random((n, DENSE_COLUMNS), dtype=dtype),
+                                   order=self.order)
+
+    def mkl(self, threads):
+        return dot_product_mkl(self.matrix_a, self.matrix_b, threads=threads)
+
+    def reference(self):
+        return self.matrix_a.dot(self.matrix_b)
+
+
+class SparseDenseF(SparseDenseC):
+
+    order = "F"
+
+
+class SparseVector(_EntryPoint):
+
+    def make_operands(self, n, density, dtype):
+        self.matrix_a = _sparse(n, n, density, dtype)
+        self.vector_b = np.random.default_rng(SEED).random(n, dtype=dtype)
+
+    def mkl(self, threads):
+        return dot_product_mkl(self.matrix_a, self.vector_b, threads=threads)
+
+    def reference(self):
+        return self.matrix_a.dot(self.vector_b)
+
+
+class DenseDense(_EntryPoint):
+
+    # Density and index type have no effect on dense products
+    params = [[500, 2000], DTYPES, THREADS]
+    param_names = ["n", "dtype", "threads"]
+
+    def setup(self, n, dtype, threads):
+        rng = np.random.default_rng(SEED)
+        self.matrix_a = rng.random((n, n), dtype=dtype)
+        self.matrix_b = rng.random((n, n), dtype=dtype)
+
+    def mkl(self, threads):
+        return dot_product_mkl(self.matrix_a, self.matrix_b, threads=threads)
+
+    def reference(self):
+        return np.dot(self.matrix_a, self.matrix_b)
+
+
+class GramSparse(_EntryPoint):
+
+    def make_operands(self, n, density, dtype):
+        self.matrix_a = _sparse(n, GRAM_COLUMNS, density * 10, dtype)
+
+    def mkl(self, threads):
+        return gram_matrix_mkl(self.matrix_a, threads=threads)
+
+    def reference(self):
+        return _spsparse.triu(self.matrix_a.T.dot(self.matrix_a), format="csr")
+
+
+class GramDense(GramSparse):
+
+    def mkl(self, threads):
+        return gram_matrix_mkl(self.matrix_a, dense=True, threads=threads)
+
+    def reference(self):
+        return np.triu(self.matrix_a.T.dot(self.matrix_a).toarray())
+
+
+class QRSolve(_EntryPoint):
+
+    def make_operands(self, n, density, dtype):
+        # MKL has no ILP64 QR functions
+        if MKL.MKL_LP64_MAX == 0:
+            raise NotImplementedError("The sparse QR solver only uses the LP64 interface")
+
+        # Diagonally dominant so that the system is well conditioned
+        matrix_a = _spsparse.random(n, n, density=density, format="csr", dtype=dtype, random_state=SEED)
+        self.matrix_a = (matrix_a + _spsparse.identity(n, dtype=dtype, format="csr") * n).tocsr()
+        self.matrix_b = np.random.default_rng(SEED).random((n, 1), dtype=dtype)
+
+    def mkl(self, threads):
+        return sparse_qr_solve_mkl(self.matrix_a, self.matrix_b, threads=threads)
+
+    def reference(self):
+        return _spsparse_linalg.spsolve(self.matrix_a.tocsc(), self.matrix_b)
+
+
+# Samples the resident pages of a process until its stdin is closed, and then prints the largest sample
+# This runs in another process so that calls which hold the GIL (e.g. some scipy sparse operations) are sampled too
+_RSS_SAMPLER = """
+import select, sys
+peak = 0
+print("ready", flush=True)
+while True:
+    with open("/proc/{pid}/statm") as statm_fh:
+        peak = max(peak, int(statm_fh.read().split()[1]))
+    if select.select([sys.stdin], [], [], {interval})[0]:
+        break
+print(peak)
+"""
+
+
+def _peak_memory(func):
+    """
+    Measure the peak increase in resident memory while a function runs.
+    This includes memory allocated inside MKL, which tracemalloc can't see, so scipy, numpy, and MKL calls
+    are measured the same way. MKL buffers are released first so that memory MKL already holds is not reused.
+
+    :return: Peak resident bytes over the resident bytes before the call, or None if there is no /proc
+    :rtype: int, None
+    """
+
+    if not os.path.exists(RSS_FILE):
+        return None
+
+    with release_memory():
+        pass
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+
+    with open(RSS_FILE) as statm_fh:
+        baseline = int(statm_fh.read().split()[1])
+
+    sampler = subprocess.Popen([sys.executable, "-c", _RSS_SAMPLER.format(pid=os.getpid(), interval=RSS_INTERVAL)],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    try:
+        sampler.stdout.readline()
+        func()
+    finally:
+        peak, _ = sampler.communicate()
+
+    return max(int(peak) - baseline, 0) * page_size
+
+
+def _measure(func, repeats=3):
+    """
+    Time a function and measure the peak memory the process uses while it runs
+
+    :return: Best time in seconds and peak bytes (None if memory can't be measured)
+    :rtype: float, int
+    """
+
+    peak = _peak_memory(func)
+
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    return min(times), peak
+
+
+def compare(bench_class, n=20000, density=0.0005, dtype="float64", index="int32", threads=1):
+    """
+    Compare one entry point to scipy or numpy
+
+    :return: Reference time, MKL time, speedup, reference peak bytes, MKL peak bytes (None if memory can't be
+    measured)
+    :rtype: float, float, float, int, int
+    """
+
+    bench = bench_class()
+
+    if bench_class is DenseDense:
+        bench.setup(min(n, 2000), dtype, threads)
+    else:
+        bench.setup(n, density, dtype, index, threads)
+
+    try:
+        ref_time, ref_mem = _measure(bench.reference)
+        mkl_time, mkl_mem = _measure(lambda: bench.mkl(threads))
+    finally:
+        bench.teardown()
+
+    return ref_time, mkl_time, ref_time / mkl_time, ref_mem, mkl_mem
+
+
+if __name__ == '__main__':
+    _header = "{:>14} {:>6} {:>8} {:>8} {:>12} {:>12} {:>9} {:>10} {:>10}"
+    _row = "{:>14} {:>6} {:>8} {:>8} {:>12.6f} {:>12.6f} {:>9.2f} {:>10} {:>10}"
+
+    print(_header.format("entry point", "index", "dtype", "threads", "reference (s)", "mkl (s)", "speedup",
+                         "ref (MB)", "mkl (MB)"))
+
+    for _bench in (SparseSparse, SparseDenseC, SparseDenseF, SparseVector, DenseDense, GramSparse, GramDense,
+                   QRSolve):
+        for _index in INDEX_TYPES[:1] if _bench is DenseDense else INDEX_TYPES:
+            for _dtype in DTYPES:
+                for _threads in THREADS:
+                    try:
+                        _res = compare(_bench, dtype=_dtype, index=_index, threads=_threads)
+                    except NotImplementedError:
+                        continue
+
+                    _mem = ["n/a" if _m is None else "{:.1f}".format(_m / 1e6) for _m in _res[3:]]
+
+                    print(_row.format(_bench.__name__, _index, _dtype, _threads, _res[0], _res[1], _res[2], *_mem))
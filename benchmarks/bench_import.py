@@ -0,0 +1,51 @@
+"""
+Benchmarks for the time it takes to import sparse_dot_mkl and to make the first call, each in a fresh interpreter
+
+These follow the airspeed velocity (asv) conventions (timeraw_ benchmarks are run in a new process),
+and can also be run directly to print the import and first call times alongside the numpy and scipy imports:
+
+    python -m benchmarks.bench_import
+"""
+
+import subprocess
+import sys
+
+_DEPENDENCIES = "import numpy, scipy.sparse"
+_IMPORT = "import sparse_dot_mkl"
+_FIRST_CALL = "sparse_dot_mkl.dot_product_mkl(scipy.sparse.random(100, 100, density=0.1, format='csr'), " \
+              "numpy.ones(100))"
+
+
+class ImportTime:
+
+    def timeraw_import_dependencies(self):
+        return _DEPENDENCIES
+
+    def timeraw_import(self):
+        return _IMPORT
+
+    def timeraw_import_and_first_call(self):
+        return "\n".join((_DEPENDENCIES, _IMPORT, _FIRST_CALL))
+
+
+def _time_in_new_process(setup, statement, repeats=5):
+    """
+    Time a statement after some setup in a new python process
+
+    :return: Best time in seconds
+    :rtype: float
+    """
+
+    script = "\n".join((setup, "import time", "_t0 = time.perf_counter()", statement,
+                        "print(time.perf_counter() - _t0)"))
+
+    return min(float(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                    check=True).stdout) for _ in range(repeats))
+
+
+if __name__ == '__main__':
+    print("{:>24} {:>12}".format("", "time (s)"))
+    print("{:>24} {:>12.4f}".format("numpy & scipy import", _time_in_new_process("", _DEPENDENCIES)))
+    print("{:>24} {:>12.4f}".format("sparse_dot_mkl import", _time_in_new_process(_DEPENDENCIES, _IMPORT)))
+    print("{:>24} {:>12.4f}".format("first call", _time_in_new_process("\n".join((_DEPENDENCIES, _IMPORT)),
+                                                                        _FIRST_CALL)))
@@ -0,0 +1,99 @@
+"""
+Benchmarks for MKL inspector-executor optimization hints (MKLSparseMatrix.optimize / dot_product_mkl(optimize=N))
+
+These follow the airspeed velocity (asv) conventions, and can also be run directly to print the crossover point:
+the number of calls after which the one-time cost of mkl_sparse_optimize has been paid back.
+
+    python -m benchmarks.bench_optimize_hints
+"""
+
+import time
+import numpy as np
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import dot_product_mkl, MKLSparseMatrix
+
+SEED = 50
+
+
+def _make_operands(n=20000, density=0.0005, dense_columns=1):
+    matrix = _spsparse.random(n, n, density=density, format="csr", dtype=np.float64, random_state=SEED)
+    rng = np.random.default_rng(SEED)
+    dense = rng.random(n) if dense_columns == 1 else rng.random((n, dense_columns))
+    return matrix, dense
+
+
+class OptimizeHints:
+
+    params = ([1, 10, 100, 1000], [1, 16])
+    param_names = ["calls", "dense_columns"]
+
+    def setup(self, calls, dense_columns):
+        self.matrix, self.dense = _make_operands(dense_columns=dense_columns)
+
+    def time_scipy_handle(self, calls, dense_columns):
+        for _ in range(calls):
+            dot_product_mkl(self.matrix, self.dense)
+
+    def time_persistent_handle(self, calls, dense_columns):
+        mkl_matrix = MKLSparseMatrix(self.matrix)
+        for _ in range(calls):
+            dot_product_mkl(mkl_matrix, self.dense)
+        mkl_matrix.close()
+
+    def time_optimized_handle(self, calls, dense_columns):
+        mkl_matrix = MKLSparseMatrix(self.matrix)
+        for _ in range(calls):
+            dot_product_mkl(mkl_matrix, self.dense, optimize=calls)
+        mkl_matrix.close()
+
+
+def _best_of(func, repeats=5):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def crossover(n=20000, density=0.0005, dense_columns=1, expected_calls=1000, per_call_repeats=50):
+    """
+    Measure the one-time cost of optimizing a handle and the per-call cost with and without optimization
+
+    :return: Optimization cost, unoptimized per-call time, optimized per-call time, and break-even number of calls
+    :rtype: float, float, float, float
+    """
+
+    matrix, dense = _make_operands(n=n, density=density, dense_columns=dense_columns)
+    operation = "mv" if dense_columns == 1 else "mm"
+
+    def _optimize_cost():
+        with MKLSparseMatrix(matrix) as mkl_matrix:
+            t0 = time.perf_counter()
+            mkl_matrix.optimize(expected_calls, operation=operation, dense_columns=dense_columns)
+            return time.perf_counter() - t0
+
+    optimize_cost = min(_optimize_cost() for _ in range(5))
+
+    with MKLSparseMatrix(matrix) as mkl_matrix:
+        plain = _best_of(lambda: [dot_product_mkl(mkl_matrix, dense) for _ in range(per_call_repeats)])
+
+    with MKLSparseMatrix(matrix) as mkl_matrix:
+        mkl_matrix.optimize(expected_calls, operation=operation, dense_columns=dense_columns)
+        optimized = _best_of(lambda: [dot_product_mkl(mkl_matrix, dense) for _ in range(per_call_repeats)])
+
+    plain, optimized = plain / per_call_repeats, optimized / per_call_repeats
+    savings = plain - optimized
+    break_even = optimize_cost / savings if savings > 0 else float("inf")
+
+    return optimize_cost, plain, optimized, break_even
+
+
+if __name__ == '__main__':
+    print("{:>8} {:>10} {:>14} {:>14} {:>14} {:>12}".format("columns", "density", "optimize (s)", "plain (s)",
+                                                           "optimized (s)", "break-even"))
+
+    for _columns in (1, 16):
+        for _density in (0.0001, 0.0005, 0.002):
+            _res = crossover(density=_density, dense_columns=_columns)
+            print("{:>8} {:>10} {:>14.6f} {:>14.6f} {:>14.6f} {:>12.1f}".format(_columns, _density, *_res))
@@ -0,0 +1,66 @@
+"""
+Benchmarks for reusing the sparse (dot) sparse product structure with SparseProductPlan
+
+    python -m benchmarks.bench_product_plan
+"""
+
+import time
+import numpy as np
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import dot_product_mkl, SparseProductPlan
+
+SEED = 50
+
+
+def _make_operands(n=20000, density=0.0005):
+    matrix_a = _spsparse.random(n, n, density=density, format="csr", dtype=np.float64, random_state=SEED)
+    matrix_b = _spsparse.random(n, n, density=density, format="csr", dtype=np.float64, random_state=SEED + 1)
+    return matrix_a, matrix_b
+
+
+class ProductPlan:
+
+    params = [1, 10, 100]
+    param_names = ["calls"]
+
+    def setup(self, calls):
+        self.matrix_a, self.matrix_b = _make_operands()
+        self.values = [np.random.default_rng(i).random(self.matrix_a.nnz) for i in range(calls)]
+
+    def time_dot_product_mkl(self, calls):
+        for values in self.values:
+            self.matrix_a.data = values
+            dot_product_mkl(self.matrix_a, self.matrix_b)
+
+    def time_product_plan(self, calls):
+        with SparseProductPlan(self.matrix_a, self.matrix_b) as plan:
+            for values in self.values:
+                plan.execute(values_a=values)
+
+
+def compare(n=20000, density=0.0005, calls=100):
+    """
+    Time repeated products with new values for A using dot_product_mkl and using a SparseProductPlan
+
+    :return: Total dot_product_mkl time and total SparseProductPlan time (including plan creation)
+    :rtype: float, float
+    """
+
+    bench = ProductPlan()
+    bench.matrix_a, bench.matrix_b = _make_operands(n=n, density=density)
+    bench.values = [np.random.default_rng(i).random(bench.matrix_a.nnz) for i in range(calls)]
+
+    t0 = time.perf_counter()
+    bench.time_dot_product_mkl(calls)
+    t1 = time.perf_counter()
+    bench.time_product_plan(calls)
+    t2 = time.perf_counter()
+
+    return t1 - t0, t2 - t1
+
+
+if __name__ == '__main__':
+    print("{:>8} {:>10} {:>18} {:>18}".format("calls", "density", "dot_product (s)", "plan (s)"))
+
+    for _density in (0.0001, 0.0005, 0.002):
+        print("{:>8} {:>10} {:>18.6f} {:>18.6f}".format(100, _density, *compare(density=_density)))
@@ -1,2 +1,10 @@
 from sparse_dot_mkl.sparse_dot import (dot_product_mkl, dot_product_transpose_mkl, get_version_string, gram_matrix_mkl,
-                                       sparse_qr_solve_mkl, set_debug_mode)
+                                       triple_product_mkl, sparse_qr_solve_mkl, set_debug_mode, MKLSparseMatrix,
+                                       SparseQR, GramAccumulator, covariance_mkl, correlation_mkl,
+                                       SparseProductPlan, estimate_product_nnz, set_dense_threshold,
+                                       set_num_threads, get_max_threads, set_dynamic, mkl_threads,
+                                       mkl_threadpool_controller, set_oversubscription_mode,
+                                       set_threading_layer, get_threading_layer, get_interface_layer, prepare_mkl,
+                                       add_event_callback, remove_event_callback, record_events,
+                                       set_copy_audit_mode, get_copy_audit, reset_copy_audit, memory_stats,
+                                       release_memory, set_peak_memory_tracking)
@@ -1,10 +1,12 @@
-from sparse_dot_mkl._mkl_interface import (MKL, _type_check, _sanity_check, _empty_output_check, _get_numpy_layout,
-                                           LAYOUT_CODE_C, LAYOUT_CODE_F, _out_matrix, debug_print)
+from sparse_dot_mkl._mkl_interface import (_choose_interface, _type_check, _sanity_check, _empty_output_check,
+                                           _get_numpy_layout, LAYOUT_CODE_C, LAYOUT_CODE_F, _out_matrix, debug_print)
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase
 
 import numpy as np
 import ctypes as _ctypes
 
 
+@_timed_phase("compute")
 def _dense_matmul(matrix_a, matrix_b, double_precision, scalar=1., out=None, out_scalar=None):
 
     # Reshape matrix_b to a column instead of a vector if it's 1d
@@ -16,7 +18,8 @@ def _dense_matmul(matrix_a, matrix_b, double_precision, scalar=1., out=None, out
     output_shape = (m, n)
 
     # Set the MKL function for precision
-    func = MKL._cblas_dgemm if double_precision else MKL._cblas_sgemm
+    mkl = _choose_interface(matrix_a, matrix_b)
+    func = mkl._cblas_dgemm if double_precision else mkl._cblas_sgemm
 
     # Get the memory order for arrays
     layout_a, ld_a = _get_numpy_layout(matrix_a)
@@ -1,73 +1,104 @@
-from sparse_dot_mkl._mkl_interface import (MKL, sparse_matrix_t, _create_mkl_sparse,
+from sparse_dot_mkl._mkl_interface import (_choose_interface, _handle_interface, _new_handle, _create_mkl_sparse,
                                            _export_mkl, _order_mkl_handle, _destroy_mkl_handle, _type_check,
                                            _get_numpy_layout, _convert_to_csr, _empty_output_check, LAYOUT_CODE_C,
-                                           _out_matrix, _check_return_value, debug_print)
+                                           _out_matrix, _check_return_value, debug_print, MKL, _track_handle,
+                                           _csc_as_csr_transpose, _pack_without_copy, get_max_threads,
+                                           LAYOUT_CODE_F)
+from sparse_dot_mkl._sparse_sparse import _inner_nnz, _sparse_dot_sparse
+from sparse_dot_mkl._triple_product import _triple_product_sparse
+from sparse_dot_mkl._mkl_sparse_matrix import _unwrap_mkl_sparse
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase, _instrumented_call, _audit_copy, _nbytes
 
 import scipy.sparse as _sps
 import ctypes as _ctypes
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
+# Which triangles of the symmetric gram matrix are returned
+SYMMETRIC_OUTPUTS = ("upper", "lower", "full")
 
-def _gram_matrix_sparse(matrix_a, aat=False, reorder_output=False):
+# Rows in each band when a triangle of a dense gram matrix is zeroed or mirrored in place
+_TRIANGLE_BAND_ROWS = 256
+
+
+@_timed_phase("compute")
+def _gram_matrix_sparse(matrix_a, aat=False, reorder_output=False, zero_copy=False, lower=False):
     """
     Calculate the gram matrix aTa for sparse matrix and return a sparse matrix
 
     :param matrix_a: Sparse matrix
-    :type matrix_a: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix
+    :type matrix_a: scipy.sparse.csr_matrix
     :param aat: Return A (dot) AT instead of AT (dot) A
     :type aat: bool
     :param reorder_output:
     :type reorder_output: bool
+    :param zero_copy: Return a sparse matrix which uses the memory allocated by MKL instead of a copy
+    :type zero_copy: bool
+    :param lower: Return the lower triangle instead of the upper triangle
+    :type lower: bool
     :return: Sparse matrix
     :rtype: scipy.sparse.csr_matrix
     """
 
-    sp_ref_a, double_prec = _create_mkl_sparse(matrix_a)
+    # Bound the output non-zeros by the non-zero pairs which share an inner index if the output could be too large
+    out_dim = matrix_a.shape[0] if aat else matrix_a.shape[1]
+    output_size = out_dim * out_dim
 
-    if _sps.isspmatrix_csc(matrix_a):
-        sp_ref_a = _convert_to_csr(sp_ref_a)
+    if output_size > MKL.MKL_LP64_MAX:
+        inner = _inner_nnz(matrix_a, 1 if aat else 0).astype(np.float64)
+        output_size = min(output_size, int(np.dot(inner, inner)))
 
+    sp_ref_a, double_prec = _create_mkl_sparse(matrix_a, mkl=_choose_interface(matrix_a, output_size=output_size))
     _order_mkl_handle(sp_ref_a)
 
-    ref_handle = sparse_matrix_t()
+    mkl = _handle_interface(sp_ref_a)
+    ref_handle = _new_handle(mkl)
 
-    ret_val = MKL._mkl_sparse_syrk(10 if aat else 11,
+    ret_val = mkl._mkl_sparse_syrk(10 if aat else 11,
                                    sp_ref_a,
                                    _ctypes.byref(ref_handle))
 
     # Check return
     _check_return_value(ret_val, "mkl_sparse_syrk")
+    _track_handle(ref_handle)
+
+    # The transpose of the upper triangle of a symmetric matrix is its lower triangle
+    if lower:
+        ref_handle = _convert_to_csr(ref_handle, destroy_original=True, transpose=True)
 
     if reorder_output:
         _order_mkl_handle(ref_handle)
 
-    output_arr = _export_mkl(ref_handle, double_prec, output_type="csr")
+    # Destroy the handles even if the export raises (e.g. because an export copy isn't allowed)
+    try:
+        output_arr = _export_mkl(ref_handle, double_prec, output_type="csr", copy=not zero_copy)
+    finally:
+        _destroy_mkl_handle(sp_ref_a)
 
-    _destroy_mkl_handle(sp_ref_a)
-    _destroy_mkl_handle(ref_handle)
+        if not zero_copy:
+            _destroy_mkl_handle(ref_handle)
 
     return output_arr
 
 
-def _gram_matrix_sparse_to_dense(matrix_a, aat=False, scalar=1., out=None, out_scalar=None):
+@_timed_phase("compute")
+def _gram_matrix_sparse_to_dense(matrix_a, aat=False, scalar=1., out=None, out_scalar=None, symmetric="upper"):
     """
     Calculate the gram matrix aTa for sparse matrix and return a dense matrix
 
     :param matrix_a: Sparse matrix
-    :type matrix_a: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix
+    :type matrix_a: scipy.sparse.csr_matrix
     :param aat: Return A (dot) AT instead of AT (dot) A
     :type aat: bool
     :param scalar: Multiply output by a scalar value
     :type scalar: float
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" matrix
+    :type symmetric: str
     :return: Dense matrix
     :rtype: numpy.ndarray
     """
 
     sp_ref_a, double_prec = _create_mkl_sparse(matrix_a)
-
-    if _sps.isspmatrix_csc(matrix_a):
-        sp_ref_a = _convert_to_csr(sp_ref_a, destroy_original=True)
-
     _order_mkl_handle(sp_ref_a)
 
     out_dtype = np.float64 if double_prec else np.float32
@@ -80,14 +111,17 @@ def _gram_matrix_sparse_to_dense(matrix_a, aat=False, scalar=1., out=None, out_s
     if _empty_output_check(matrix_a, matrix_a):
         return output_arr
 
-    func = MKL._mkl_sparse_d_syrkd if double_prec else MKL._mkl_sparse_s_syrkd
+    mkl = _handle_interface(sp_ref_a)
+    func = mkl._mkl_sparse_d_syrkd if double_prec else mkl._mkl_sparse_s_syrkd
 
+    # syrkd fills the upper triangle; the upper triangle of a column-major symmetric matrix is the lower triangle
+    # of the same row-major matrix, so the lower triangle is computed by telling MKL the output is column-major
     ret_val = func(10 if aat else 11,
                    sp_ref_a,
                    scalar,
                    float(out_scalar) if out_scalar is not None else 1.,
                    output_arr.ctypes.data_as(_ctypes.POINTER(output_ctype)),
-                   LAYOUT_CODE_C,
+                   LAYOUT_CODE_F if symmetric == "lower" else LAYOUT_CODE_C,
                    output_ld)
 
     # Check return
@@ -95,16 +129,21 @@ def _gram_matrix_sparse_to_dense(matrix_a, aat=False, scalar=1., out=None, out_s
 
     _destroy_mkl_handle(sp_ref_a)
 
+    # Copy the upper triangle into the lower triangle for a full symmetric matrix
+    if symmetric == "full":
+        _fill_lower_triangle(output_arr, mirror=True)
+
     # This fixes a specific bug in mkl_sparse_d_syrkd which returns a full matrix
     # This stupid thing only happens with specific flags
     # I could probably leave it but it's pretty annoying
-    if not aat and out is None:
-        output_arr[np.tril_indices(output_arr.shape[0], k=-1)] = 0.
+    elif not aat and out is None:
+        _fill_lower_triangle(output_arr.T if symmetric == "lower" else output_arr, mirror=False)
 
     return output_arr
 
 
-def _gram_matrix_dense_to_dense(matrix_a, aat=False, scalar=1., out=None, out_scalar=None):
+@_timed_phase("compute")
+def _gram_matrix_dense_to_dense(matrix_a, aat=False, scalar=1., out=None, out_scalar=None, symmetric="upper"):
     """
     Calculate the gram matrix aTa for dense matrix and return a dense matrix
 
@@ -118,6 +157,8 @@ def _gram_matrix_dense_to_dense(matrix_a, aat=False, scalar=1., out=None, out_sc
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" matrix
+    :type symmetric: str
     :return: Dense matrix
     :rtype: numpy.ndarray
     """
@@ -130,14 +171,15 @@ def _gram_matrix_dense_to_dense(matrix_a, aat=False, scalar=1., out=None, out_sc
     double_precision = matrix_a.dtype == np.float64
 
     # Set the MKL function for precision
-    func = MKL._cblas_dsyrk if double_precision else MKL._cblas_ssyrk
+    mkl = _choose_interface(matrix_a)
+    func = mkl._cblas_dsyrk if double_precision else mkl._cblas_ssyrk
     output_ctype = _ctypes.c_double if double_precision else _ctypes.c_float
 
     # Allocate an array for outputs and set functions and types for float or doubles
     output_arr = _out_matrix((n, n), matrix_a.dtype, order="C" if layout_a == LAYOUT_CODE_C else "F", out_arr=out)
 
     func(layout_a,
-         121,
+         122 if symmetric == "lower" else 121,
          111 if aat else 112,
          n,
          k,
@@ -148,18 +190,219 @@ def _gram_matrix_dense_to_dense(matrix_a, aat=False, scalar=1., out=None, out_sc
          output_arr.ctypes.data_as(_ctypes.POINTER(output_ctype)),
          n)
 
+    if symmetric == "full":
+        _fill_lower_triangle(output_arr, mirror=True)
+
+    return output_arr
+
+
+def _gram_matrix_sparse_full(matrix_a, aat=False, reorder_output=False, zero_copy=False):
+    """
+    Calculate the full (both triangles) gram matrix aTa for sparse matrix and return a sparse matrix.
+    This is a sparse (dot) sparse product with MKL transposing A, so no triangle is created and then mirrored.
+
+    :param matrix_a: Sparse matrix
+    :type matrix_a: scipy.sparse.csr_matrix
+    :param aat: Return A (dot) AT instead of AT (dot) A
+    :type aat: bool
+    :param reorder_output:
+    :type reorder_output: bool
+    :param zero_copy: Return a sparse matrix which uses the memory allocated by MKL instead of a copy
+    :type zero_copy: bool
+    :return: Sparse matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+
+    return _sparse_dot_sparse(matrix_a, matrix_a, reorder_output=reorder_output, zero_copy=zero_copy,
+                              transpose_a=not aat, transpose_b=aat)
+
+
+def _weight_matrix(matrix_a, weights, aat=False):
+    """
+    Scale the rows of A (or the columns for A (dot) AT) by the square roots of the diagonal weights W,
+    so that the gram matrix of the scaled matrix is AT (dot) W (dot) A. Only the values are copied.
+
+    :param matrix_a: Sparse or dense matrix
+    :type matrix_a: scipy.sparse.csr_matrix, np.ndarray
+    :param weights: Non-negative weights
+    :type weights: np.ndarray
+    :param aat: Scale for A (dot) W (dot) AT instead of AT (dot) W (dot) A
+    :type aat: bool
+    :return: Scaled matrix
+    :rtype: scipy.sparse.csr_matrix, np.ndarray
+    """
+
+    if np.any(weights < 0):
+        raise ValueError("Negative weights are only supported for a sparse upper triangular gram matrix")
+
+    sqrt_weights = np.sqrt(weights)
+
+    if _sps.isspmatrix(matrix_a):
+        _audit_copy("copy of values scaled by gram matrix weights", matrix_a.data.nbytes)
+        scale = sqrt_weights[matrix_a.indices] if aat else np.repeat(sqrt_weights, np.diff(matrix_a.indptr))
+        return _pack_without_copy(_sps.csr_matrix(matrix_a.shape, dtype=matrix_a.dtype),
+                                  matrix_a.data * scale, matrix_a.indices, matrix_a.indptr)
+
+    _audit_copy("copy of values scaled by gram matrix weights", matrix_a.nbytes)
+    return matrix_a * (sqrt_weights[None, :] if aat else sqrt_weights[:, None])
+
+
+def _fill_lower_triangle(output_arr, mirror=False):
+    """
+    Set the strict lower triangle of a square dense array in place, either to zero or to the transpose of the strict
+    upper triangle. Bands of rows are filled in parallel (one python thread for each MKL thread), and nothing larger
+    than a mask for one band's diagonal block is allocated. Pass the transpose of the array to fill the upper triangle.
+
+    :param output_arr: Square dense array
+    :type output_arr: np.ndarray
+    :param mirror: Copy the upper triangle into the lower triangle if True, set the lower triangle to zero if False
+    :type mirror: bool
+    """
+
+    def _fill_band(start, stop):
+        diagonal_block = output_arr[start:stop, start:stop]
+        block_mask = np.tri(stop - start, k=-1, dtype=bool)
+
+        # Every band only writes its own rows below the diagonal, so bands can be filled concurrently
+        if mirror:
+            output_arr[start:stop, :start] = output_arr[:start, start:stop].T
+            np.copyto(diagonal_block, diagonal_block.T, where=block_mask)
+        else:
+            output_arr[start:stop, :start] = 0.
+            diagonal_block[block_mask] = 0.
+
+    _for_each_band(output_arr.shape[0], _fill_band)
+
+
+def _center_upper_triangle(output_arr, n_observations, means, ddof=1, normalize=False):
+    """
+    Turn the upper triangle of a gram matrix AT (dot) A into the upper triangle of the covariance matrix of the
+    columns of A in place by applying the rank-1 mean correction (AT (dot) A - n * mean (dot) meanT) / (n - ddof).
+    If normalize is set, the covariance is also divided by the outer product of the standard deviations to give
+    the correlation matrix. Bands of rows are corrected in parallel and A is not needed.
+
+    :param output_arr: Square dense array with the gram matrix in the upper triangle
+    :type output_arr: np.ndarray
+    :param n_observations: Number of observations (rows of A)
+    :type n_observations: int
+    :param means: Mean of each column of A
+    :type means: np.ndarray
+    :param ddof: Delta degrees of freedom for the covariance
+    :type ddof: int
+    :param normalize: Calculate the correlation matrix instead of the covariance matrix
+    :type normalize: bool
+    """
+
+    scale = 1. / (n_observations - ddof)
+    means = means.astype(output_arr.dtype)
+
+    # The correlation of a column without any variance is NaN (rounding can also make its variance negative)
+    if normalize:
+        variance = (np.diagonal(output_arr) - n_observations * means * means) * scale
+        std = np.sqrt(np.where(variance > 0, variance, np.nan))
+
+    # Each row is corrected with one scratch row so no outer product as large as a band is allocated
+    def _center_band(start, stop):
+        scratch = np.empty(output_arr.shape[1] - start, dtype=output_arr.dtype)
+
+        for i in range(start, stop):
+            row, row_scratch = output_arr[i, i:], scratch[:output_arr.shape[1] - i]
+
+            np.multiply(means[i:], n_observations * means[i], out=row_scratch)
+            row -= row_scratch
+            row *= scale
+
+            # Rounding can put a correlation slightly outside [-1, 1]
+            if normalize:
+                np.multiply(std[i:], std[i], out=row_scratch)
+                row /= row_scratch
+                np.clip(row, -1., 1., out=row)
+
+    _for_each_band(output_arr.shape[0], _center_band)
+
+
+def _for_each_band(n, band_func):
+    """
+    Call a function on every band of rows of a square array, in parallel (one python thread for each MKL thread)
+    if there is more than one band. Each call must only write to its own band of rows.
+
+    :param n: Number of rows in the array
+    :type n: int
+    :param band_func: Function which takes the first row and the end row of a band
+    :type band_func: callable
+    """
+
+    bands = [(start, min(start + _TRIANGLE_BAND_ROWS, n)) for start in range(0, n, _TRIANGLE_BAND_ROWS)]
+    n_threads = min(get_max_threads(), len(bands))
+
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            list(pool.map(lambda band: band_func(*band), bands))
+    else:
+        for start, stop in bands:
+            band_func(start, stop)
+
+
+def _covariance(matrix, transpose=False, ddof=1, cast=False, symmetric="full", normalize=False):
+    """
+    Calculate the covariance (or correlation) matrix of the columns of a matrix from its gram matrix, without
+    centering (and densifying) a sparse matrix.
+
+    :param matrix: Sparse matrix in CSR or CSC format or numpy array, with observations in rows
+    :type matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, np.ndarray
+    :param transpose: Observations are in columns instead of rows
+    :type transpose: bool
+    :param ddof: Delta degrees of freedom; the covariance is divided by the number of observations minus ddof
+    :type ddof: int
+    :param cast: Make internal copies to convert matrix to a float matrix if necessary
+    :type cast: bool
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" matrix
+    :type symmetric: str
+    :param normalize: Calculate the correlation matrix instead of the covariance matrix
+    :type normalize: bool
+    :return: Covariance or correlation matrix
+    :rtype: np.ndarray
+    """
+
+    if symmetric not in SYMMETRIC_OUTPUTS:
+        raise ValueError("symmetric must be one of {s}; {p} provided".format(s=SYMMETRIC_OUTPUTS, p=symmetric))
+
+    n_observations = matrix.shape[1] if transpose else matrix.shape[0]
+
+    if n_observations - ddof <= 0:
+        err_msg = "{n} observations are not enough for a covariance with ddof={d}".format(n=n_observations, d=ddof)
+        raise ValueError(err_msg)
+
+    matrix = _type_check(matrix, cast=cast)
+
+    # Summing the observations doesn't change the sparsity structure
+    means = np.asarray(matrix.sum(axis=1 if transpose else 0, dtype=np.float64)).ravel() / n_observations
+
+    output_arr = _gram_matrix(matrix, transpose=transpose, dense=True)
+    _center_upper_triangle(output_arr, n_observations, means, ddof=ddof, normalize=normalize)
+
+    # The lower triangle of the gram matrix can be anything, so it is always replaced or zeroed
+    if symmetric == "upper":
+        _fill_lower_triangle(output_arr, mirror=False)
+    else:
+        _fill_lower_triangle(output_arr, mirror=True)
+
+    if symmetric == "lower":
+        _fill_lower_triangle(output_arr.T, mirror=False)
+
     return output_arr
 
 
-def _gram_matrix(matrix, transpose=False, cast=False, dense=False, reorder_output=False, out=None, out_scalar=None):
+def _gram_matrix(matrix, transpose=False, cast=False, dense=False, reorder_output=False, out=None, out_scalar=None,
+                 zero_copy=False, symmetric="upper", weights=None):
     """
     Calculate a gram matrix (AT (dot) A) from a sparse matrix.
 
-    :param matrix: Sparse matrix (CSR format is required but will convert if cast is True)
-    :type matrix: scipy.sparse.csr_matrix
+    :param matrix: Sparse matrix in CSR or CSC format or numpy array
+    :type matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, np.ndarray
     :param transpose: Calculate A (dot) AT instead
     :type transpose: bool
-    :param cast: Make internal copies to convert matrix to a float matrix or convert to a CSR matrix if necessary
+    :param cast: Make internal copies to convert matrix to a float matrix if necessary
     :type cast: bool
     :param dense: Produce a dense matrix output instead of a sparse matrix
     :type dense: bool
@@ -167,30 +410,257 @@ def _gram_matrix(matrix, transpose=False, cast=False, dense=False, reorder_outpu
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param zero_copy: Return a sparse matrix which uses the memory allocated by MKL instead of a copy
+    :type zero_copy: bool
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" matrix
+    :type symmetric: str
+    :param weights: Calculate AT (dot) W (dot) A for the diagonal matrix W with these weights if provided
+    :type weights: np.ndarray, None
     :return: Gram matrix
     :rtype: scipy.sparse.csr_matrix, np.ndarray
     """
 
+    if symmetric not in SYMMETRIC_OUTPUTS:
+        raise ValueError("symmetric must be one of {s}; {p} provided".format(s=SYMMETRIC_OUTPUTS, p=symmetric))
+
     # Check for edge condition inputs which result in empty outputs
     if _empty_output_check(matrix, matrix):
         debug_print("Skipping multiplication because AT (dot) A must yield an empty matrix")
-        output_shape = (matrix.shape[1], matrix.shape[1]) if transpose else (matrix.shape[0], matrix.shape[0])
-        output_func = _sps.csr_matrix if _sps.isspmatrix(matrix) else np.zeros
+        output_shape = (matrix.shape[0], matrix.shape[0]) if transpose else (matrix.shape[1], matrix.shape[1])
+        output_func = _sps.csr_matrix if _sps.isspmatrix(matrix) and not dense else np.zeros
         return output_func(output_shape, dtype=matrix.dtype)
 
     matrix = _type_check(matrix, cast=cast)
 
     if _sps.isspmatrix(matrix) and not (_sps.isspmatrix_csr(matrix) or _sps.isspmatrix_csc(matrix)):
         raise ValueError("gram_matrix requires sparse matrix to be CSR or CSC format")
-    if _sps.isspmatrix_csc(matrix) and not cast:
-        raise ValueError("gram_matrix cannot use a CSC matrix unless cast=True")
-    elif not _sps.isspmatrix(matrix):
-        return _gram_matrix_dense_to_dense(matrix, aat=transpose, out=out, out_scalar=out_scalar)
+
+    # The CSC arrays of A are the CSR arrays of AT, so AT (dot) A is calculated as (AT) (dot) (AT)T without a copy
+    if _sps.isspmatrix_csc(matrix):
+        matrix, transpose = _csc_as_csr_transpose(matrix), not transpose
+
+    if weights is not None:
+        weights = np.asarray(weights, dtype=matrix.dtype).ravel()
+        inner_dim = matrix.shape[1] if transpose else matrix.shape[0]
+
+        if weights.shape[0] != inner_dim:
+            raise ValueError("weights must have {n} values; {w} provided".format(n=inner_dim, w=weights.shape[0]))
+
+        # A sparse upper triangle is calculated as the triple product with a sparse diagonal matrix without copying A
+        # Every other output is the gram matrix of a copy of A scaled by the square roots of the weights
+        if _sps.isspmatrix(matrix) and not dense and out is None and symmetric == "upper":
+            return _triple_product_sparse(matrix, _sps.diags(weights, format="csr"), abat=transpose,
+                                          reorder_output=reorder_output, zero_copy=zero_copy)
+
+        matrix = _weight_matrix(matrix, weights, aat=transpose)
+
+    if not _sps.isspmatrix(matrix):
+        return _gram_matrix_dense_to_dense(matrix, aat=transpose, out=out, out_scalar=out_scalar, symmetric=symmetric)
     elif dense:
-        return _gram_matrix_sparse_to_dense(matrix, aat=transpose,  out=out, out_scalar=out_scalar)
+        return _gram_matrix_sparse_to_dense(matrix, aat=transpose, out=out, out_scalar=out_scalar,
+                                            symmetric=symmetric)
     elif out is not None:
         raise ValueError("out argument cannot be used with sparse (dot) sparse matrix multiplication")
+    elif symmetric == "full":
+        return _gram_matrix_sparse_full(matrix, aat=transpose, reorder_output=reorder_output, zero_copy=zero_copy)
     else:
-        return _gram_matrix_sparse(matrix, aat=transpose, reorder_output=reorder_output)
+        return _gram_matrix_sparse(matrix, aat=transpose, reorder_output=reorder_output, zero_copy=zero_copy,
+                                   lower=symmetric == "lower")
+
+
+# Marks the end of the blocks when the next block is loaded on a background thread
+_NO_BLOCK = object()
+
+
+class GramAccumulator:
+    """
+    Accumulate the gram matrix AT (dot) A of a matrix A which is provided as blocks of rows,
+    as the sum of the gram matrices of the blocks (AT (dot) A = sum(Ai.T (dot) Ai)).
+    Only the output and the current block need to be held in memory.
+
+    A dense output is allocated once and every block's gram matrix is added into it by MKL.
+    A sparse output is the sum of the sparse gram matrices of the blocks.
+
+    :param n_columns: Number of columns in every block
+    :type n_columns: int
+    :param dense: Accumulate a dense output instead of a sparse output. Dense blocks require a dense output.
+    :type dense: bool
+    :param dtype: Output data type (np.float32 or np.float64)
+    :type dtype: np.dtype
+    :param cast: Convert blocks to the output data type by making an internal copy if necessary
+    :type cast: bool
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" matrix
+    :type symmetric: str
+    """
+
+    def __init__(self, n_columns, dense=True, dtype=np.float64, cast=False, symmetric="upper"):
+
+        if symmetric not in SYMMETRIC_OUTPUTS:
+            raise ValueError("symmetric must be one of {s}; {p} provided".format(s=SYMMETRIC_OUTPUTS, p=symmetric))
+        elif np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("GramAccumulator dtype must be float32 or float64; {d} provided".format(d=dtype))
+
+        self._shape = (int(n_columns), int(n_columns))
+        self._dense = dense
+        self._dtype = np.dtype(dtype)
+        self._cast = cast
+        self._symmetric = symmetric
+
+        # A full matrix is accumulated as the upper triangle and mirrored when the result is requested
+        self._triangle = "lower" if symmetric == "lower" else "upper"
+
+        self._output = np.zeros(self._shape, dtype=self._dtype) if dense else None
+        self._n_rows, self._n_blocks = 0, 0
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def n_rows(self):
+        """The number of rows in every block added so far"""
+        return self._n_rows
+
+    @property
+    def n_blocks(self):
+        """The number of blocks added so far"""
+        return self._n_blocks
+
+    def add(self, block):
+        """
+        Add the gram matrix of a block of rows to the output
 
+        :param block: Block of rows as a sparse matrix in CSR or CSC format or a 2d numpy array
+        :type block: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, MKLSparseMatrix, np.ndarray
+        :return: This accumulator
+        :rtype: GramAccumulator
+        """
+
+        block = _unwrap_mkl_sparse(block)
+
+        if block.ndim != 2 or block.shape[1] != self._shape[1]:
+            err_msg = "Block must have {n} columns; {s} provided".format(n=self._shape[1], s=block.shape)
+            raise ValueError(err_msg)
+        elif not _sps.isspmatrix(block) and not self._dense:
+            raise ValueError("Dense blocks can only be accumulated into a dense output")
+
+        with _instrumented_call("GramAccumulator.add", block) as call:
+            block = _type_check(block, cast=self._cast)
+
+            if block.dtype != self._dtype and self._cast:
+                _cast_reason = "cast from {t} to {d}".format(t=block.dtype, d=self._dtype)
+                _audit_copy(_cast_reason, _nbytes(block, itemsize=self._dtype.itemsize))
+                block = block.astype(self._dtype)
+            elif block.dtype != self._dtype:
+                err_msg = "Block data type must be {d}; {b} provided".format(d=self._dtype, b=block.dtype)
+                raise ValueError(err_msg)
+
+            # A block without any non-zero values doesn't change the output
+            if not _empty_output_check(block, block):
+                self._accumulate(block)
+
+            # The block is only counted once its gram matrix has been added
+            self._n_rows += block.shape[0]
+            self._n_blocks += 1
+
+            return call.set_output(self)
+
+    def _accumulate(self, block):
+        """
+        Add the gram matrix of a checked block to the output
+
+        :param block: Block of rows with the output data type
+        :type block: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, np.ndarray
+        """
+
+        # The gram matrix of a F-ordered block is calculated from its transpose so it matches the C-ordered output
+        transpose = False
+
+        if not _sps.isspmatrix(block) and block.flags.f_contiguous and not block.flags.c_contiguous:
+            block, transpose = block.T, True
+
+        if self._dense:
+            _gram_matrix(block, transpose=transpose, dense=True, out=self._output, out_scalar=1.,
+                         symmetric=self._triangle)
+        else:
+            block_gram = _gram_matrix(block, symmetric=self._triangle)
+            self._output = block_gram if self._output is None else self._output + block_gram
+
+    def add_blocks(self, blocks, prefetch=True):
+        """
+        Add the gram matrix of every block of rows from an iterable (for example, a generator which loads blocks
+        from disk). If prefetch is set, the next block is taken from the iterable on a background thread while the
+        current block is added, so two blocks are held in memory at once.
+
+        :param blocks: Blocks of rows
+        :type blocks: iterable
+        :param prefetch: Get the next block on a background thread while adding the current block
+        :type prefetch: bool
+        :return: This accumulator
+        :rtype: GramAccumulator
+        """
+
+        blocks = iter(blocks)
+
+        if not prefetch:
+            for block in blocks:
+                self.add(block)
+
+            return self
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            next_block = pool.submit(next, blocks, _NO_BLOCK)
+
+            while True:
+                block = next_block.result()
+
+                if block is _NO_BLOCK:
+                    break
+
+                next_block = pool.submit(next, blocks, _NO_BLOCK)
+                self.add(block)
+
+        return self
+
+    def result(self, copy=True):
+        """
+        Get the accumulated gram matrix
+
+        :param copy: Return a copy of a dense output. If False, the accumulator's own dense output array is returned,
+        and it will be changed by any blocks which are added later.
+        :type copy: bool
+        :return: Gram matrix
+        :rtype: np.ndarray, scipy.sparse.csr_matrix
+        """
+
+        if not self._dense and self._output is None:
+            return _sps.csr_matrix(self._shape, dtype=self._dtype)
+
+        elif not self._dense:
+            output_arr = self._output.copy()
+
+            if self._symmetric == "full":
+                output_arr = (output_arr + _sps.triu(output_arr, k=1, format="csr").T).tocsr()
+
+            return output_arr
+
+        output_arr = self._output.copy() if copy else self._output
+
+        # mkl_sparse_?_syrkd can also add to the other triangle of an out array, which is zeroed or replaced here
+        if self._symmetric == "full":
+            _fill_lower_triangle(output_arr, mirror=True)
+        elif self._symmetric == "lower":
+            _fill_lower_triangle(output_arr.T, mirror=False)
+        else:
+            _fill_lower_triangle(output_arr, mirror=False)
+
+        return output_arr
 
+    def __repr__(self):
+        return "<GramAccumulator {s} ({o}) of {r} rows in {b} blocks>".format(s=self._shape,
+                                                                            o="dense" if self._dense else "sparse",
+                                                                            r=self._n_rows, b=self._n_blocks)
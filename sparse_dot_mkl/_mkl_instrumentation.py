@@ -0,0 +1,439 @@
+import time
+import warnings
+import threading
+import functools
+import contextlib
+
+# Phases that the time spent in an instrumented call is divided into
+# Time which is not spent in any of these (e.g. dispatch and empty output checks) is reported as "other"
+PHASES = ("validation", "casting", "allocation", "handle_creation", "conversion", "optimize", "compute", "reorder",
+          "export", "handle_destruction", "other")
+
+# Event callbacks are only called if any are registered; nothing is timed otherwise
+_CALLBACKS = []
+_CALLBACKS_LOCK = threading.Lock()
+
+
+# What to do when the library makes an implicit copy of an array
+COPY_AUDIT_MODES = ("ignore", "count", "warn", "raise")
+_COPY_AUDIT = {"mode": "ignore"}
+
+# Number of copies and bytes copied, keyed by the reason for the copy
+_COPY_COUNTS = {}
+_COPY_COUNTS_LOCK = threading.Lock()
+
+
+class _ThreadState(threading.local):
+    """The call which is being timed, and whether copies are forbidden, on each python thread"""
+    timer = None
+    strict_no_copy = False
+
+
+_THREAD_STATE = _ThreadState()
+
+
+def add_event_callback(callback):
+    """
+    Register a function which will be called with an event dict after every sparse_dot_mkl call on any thread.
+    The event has the keys:
+    "operation": the public function or method which was called,
+    "inputs": a list of dicts with the "shape", "nnz" (None for dense arrays), "dtype", and "layout"
+    (the sparse format, or "C" or "F" order) of each input,
+    "output": the same dict for the output, or None if the call raised an exception,
+    "threads": the number of MKL threads for the call,
+    "phases": a dict of the seconds spent in each phase of the call,
+    "time": the total seconds spent in the call,
+    "copies": a list of dicts with the "reason" and "bytes" of each implicit copy made during the call,
+    "error": the name of the exception the call raised, or None,
+    "thread": the identifier (threading.get_ident()) of the python thread which made the call.
+
+    :param callback: Function which takes one event dict
+    :type callback: callable
+    """
+
+    if not callable(callback):
+        raise ValueError("Event callback must be callable; {c} provided".format(c=type(callback)))
+
+    with _CALLBACKS_LOCK:
+        _CALLBACKS.append(callback)
+
+
+def remove_event_callback(callback):
+    """
+    Unregister a function registered with add_event_callback
+
+    :param callback: Registered function
+    :type callback: callable
+    """
+
+    with _CALLBACKS_LOCK:
+        try:
+            _CALLBACKS.remove(callback)
+        except ValueError:
+            raise ValueError("Event callback {c} is not registered".format(c=callback))
+
+
+@contextlib.contextmanager
+def record_events(thread_only=False):
+    """
+    Context manager which collects the events for sparse_dot_mkl calls into a list until it exits
+
+    :param thread_only: Only collect the events for calls made from the calling python thread,
+    instead of from any thread
+    :type thread_only: bool
+    :return: List which events are appended to
+    :rtype: list
+    """
+
+    events = []
+    thread = threading.get_ident()
+
+    def _record(event):
+        if not thread_only or event["thread"] == thread:
+            events.append(event)
+
+    add_event_callback(_record)
+
+    try:
+        yield events
+    finally:
+        remove_event_callback(_record)
+
+
+class _CallTimer:
+    """
+    Divides the time spent in one call into phases. Phases can be nested, and the time spent in a nested phase is
+    not counted for the phase that contains it.
+    """
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.)
+        self.copies = []
+        self._stack = []
+        self._current = "other"
+        self._last = time.perf_counter()
+
+    def enter(self, phase):
+        """Start a phase, pausing the current phase"""
+        self._charge()
+        self._stack.append(self._current)
+        self._current = phase
+
+    def exit(self):
+        """End the current phase, resuming the phase which contains it"""
+        self._charge()
+        self._current = self._stack.pop()
+
+    def _charge(self):
+        """Add the time since the last phase change to the current phase"""
+        now = time.perf_counter()
+        self.phases[self._current] += now - self._last
+        self._last = now
+
+
+class _InstrumentedCall:
+    """
+    Context manager which times a public call and sends its event to the registered callbacks
+    """
+
+    def __init__(self, operation, matrices):
+        self.event = {"operation": operation,
+                      "inputs": [_describe(m) for m in matrices],
+                      "output": None,
+                      "threads": None,
+                      "phases": None,
+                      "time": None,
+                      "copies": None,
+                      "error": None,
+                      "thread": threading.get_ident()}
+        self._timer = None
+        self._start = None
+
+    def __enter__(self):
+        self._timer = _CallTimer()
+        self._start = time.perf_counter()
+        _THREAD_STATE.timer = self._timer
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._timer._charge()
+        self.event["time"] = time.perf_counter() - self._start
+        self.event["phases"] = self._timer.phases
+        self.event["copies"] = self._timer.copies
+        self.event["error"] = exc_type.__name__ if exc_type is not None else None
+        _THREAD_STATE.timer = None
+
+        # Imported here because the interface imports this module
+        from sparse_dot_mkl._mkl_interface import get_max_threads
+        self.event["threads"] = get_max_threads()
+
+        _send_event(self.event)
+
+    def set_output(self, output):
+        """
+        Describe the output of the call in its event
+
+        :param output: Output of the call
+        :type output: scipy.sparse.spmatrix, np.ndarray
+        :return: The output, unchanged
+        :rtype: scipy.sparse.spmatrix, np.ndarray
+        """
+
+        self.event["output"] = _describe(output)
+        return output
+
+
+class _NullCall:
+    """
+    Stand-in for _InstrumentedCall when nothing is being recorded
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+    @staticmethod
+    def set_output(output):
+        return output
+
+
+_NULL_CALL = _NullCall()
+
+
+def _instrumented_call(operation, *matrices):
+    """
+    Get a context manager which records an event for a public call if there are any event callbacks.
+    Calls made from inside an instrumented call are counted as part of it instead of creating their own event.
+
+    :param operation: Name of the public function or method
+    :type operation: str
+    :param matrices: Inputs to the call
+    :type matrices: scipy.sparse.spmatrix, np.ndarray
+    :return: Context manager
+    :rtype: _InstrumentedCall, _NullCall
+    """
+
+    if not _CALLBACKS or _THREAD_STATE.timer is not None:
+        return _NULL_CALL
+
+    return _InstrumentedCall(operation, matrices)
+
+
+def _timed_phase(phase):
+    """
+    Decorator which counts the time spent in a function as a phase of the current instrumented call.
+    If no call is being instrumented on this thread, the function is just called.
+
+    :param phase: Phase name from PHASES
+    :type phase: str
+    """
+
+    if phase not in PHASES:
+        raise ValueError("Phase must be one of {p}; {n} provided".format(p=PHASES, n=phase))
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _THREAD_STATE.timer if _CALLBACKS else None
+
+            if timer is None:
+                return func(*args, **kwargs)
+
+            timer.enter(phase)
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.exit()
+
+        return wrapper
+
+    return decorator
+
+
+def set_copy_audit_mode(mode):
+    """
+    Set what happens when sparse_dot_mkl makes an implicit copy of an array (a dtype cast, an index cast,
+    a CSC to CSR conversion, a copy of MKL output, etc).
+    "ignore" does nothing (default), "count" adds the copy to the totals returned by get_copy_audit(),
+    "warn" counts it and raises a RuntimeWarning, and "raise" counts it and raises a ValueError before copying.
+
+    :param mode: "ignore", "count", "warn", or "raise"
+    :type mode: str
+    """
+
+    if mode not in COPY_AUDIT_MODES:
+        raise ValueError("Copy audit mode must be one of {m}; {p} provided".format(m=COPY_AUDIT_MODES, p=mode))
+
+    _COPY_AUDIT["mode"] = mode
+
+
+def get_copy_audit():
+    """
+    Get the implicit copies counted since the last reset_copy_audit() call (copies are only counted if the
+    copy audit mode is not "ignore")
+
+    :return: A dict keyed by the reason for the copy, with a dict of the "count" and total "bytes" for each reason
+    :rtype: dict
+    """
+
+    with _COPY_COUNTS_LOCK:
+        return {reason: {"count": c[0], "bytes": c[1]} for reason, c in _COPY_COUNTS.items()}
+
+
+def reset_copy_audit():
+    """
+    Clear the implicit copy counts
+    """
+
+    with _COPY_COUNTS_LOCK:
+        _COPY_COUNTS.clear()
+
+
+def _audit_copy(reason, nbytes):
+    """
+    Account for an implicit copy which is about to be made. This must be called before the copy is made,
+    so that a copy which isn't allowed is never allocated.
+
+    :param reason: Why the copy is made
+    :type reason: str
+    :param nbytes: Number of bytes which will be copied
+    :type nbytes: int
+    """
+
+    mode = _COPY_AUDIT["mode"]
+    strict = _THREAD_STATE.strict_no_copy
+    timer = _THREAD_STATE.timer if _CALLBACKS else None
+
+    if mode == "ignore" and not strict and timer is None:
+        return
+
+    nbytes = int(nbytes)
+
+    if timer is not None:
+        timer.copies.append({"reason": reason, "bytes": nbytes})
+
+    if mode != "ignore":
+        with _COPY_COUNTS_LOCK:
+            counts = _COPY_COUNTS.setdefault(reason, [0, 0])
+            counts[0] += 1
+            counts[1] += nbytes
+
+    msg = "Implicit copy of {n} bytes: {r}".format(n=nbytes, r=reason)
+
+    if strict:
+        raise ValueError(msg + " (strict_no_copy=True)")
+    elif mode == "raise":
+        raise ValueError(msg)
+    elif mode == "warn":
+        warnings.warn(msg, RuntimeWarning)
+
+
+class _StrictNoCopy:
+    """
+    Context manager which makes any implicit copy on this thread raise a ValueError until it exits
+    """
+
+    def __init__(self):
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = _THREAD_STATE.strict_no_copy
+        _THREAD_STATE.strict_no_copy = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _THREAD_STATE.strict_no_copy = self._previous
+
+
+def _no_copy_call(strict_no_copy):
+    """
+    Get a context manager which forbids implicit copies for a public call if strict_no_copy is set
+
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy
+    :type strict_no_copy: bool
+    :return: Context manager
+    :rtype: _StrictNoCopy, _NullCall
+    """
+
+    return _StrictNoCopy() if strict_no_copy else _NULL_CALL
+
+
+def _nbytes(matrix, itemsize=None):
+    """
+    Get the number of bytes in the arrays of a sparse matrix or in a dense array
+
+    :param matrix: Sparse matrix, MKLSparseMatrix, or dense array
+    :type matrix: scipy.sparse.spmatrix, MKLSparseMatrix, np.ndarray
+    :param itemsize: Count the data as this many bytes per element instead of its current size (e.g. after a cast)
+    :type itemsize: int, None
+    :return: Number of bytes
+    :rtype: int
+    """
+
+    # MKLSparseMatrix wraps a scipy matrix
+    matrix = getattr(matrix, "matrix", matrix)
+
+    if hasattr(matrix, "indptr"):
+        data = matrix.data.nbytes if itemsize is None else matrix.data.size * itemsize
+        return data + matrix.indices.nbytes + matrix.indptr.nbytes
+
+    return matrix.nbytes if itemsize is None else matrix.size * itemsize
+
+
+def _send_event(event):
+    """
+    Call every registered callback with an event. A callback which raises an exception does not stop the others,
+    and does not change the result of the call; a RuntimeWarning is raised instead.
+
+    :param event: Event
+    :type event: dict
+    """
+
+    with _CALLBACKS_LOCK:
+        callbacks = tuple(_CALLBACKS)
+
+    for callback in callbacks:
+        try:
+            callback(event)
+        except Exception as err:
+            warnings.warn("Event callback {c} raised {e}".format(c=callback, e=repr(err)), RuntimeWarning)
+
+
+def _describe(matrix):
+    """
+    Describe a matrix for an event
+
+    :param matrix: Sparse matrix, MKLSparseMatrix, dense array, or a product estimate from estimate_product_nnz
+    :type matrix: scipy.sparse.spmatrix, MKLSparseMatrix, np.ndarray, dict
+    :return: A dict with the shape, nnz (None for dense arrays), dtype, and layout
+    :rtype: dict, None
+    """
+
+    if matrix is None:
+        return None
+
+    # An estimate describes a product which has not been computed
+    if isinstance(matrix, dict):
+        return {"shape": tuple(matrix["shape"]), "nnz": matrix["nnz"], "dtype": None, "layout": None}
+
+    sparse_format = getattr(matrix, "format", None)
+
+    if sparse_format is not None:
+        layout = sparse_format
+    elif getattr(matrix, "flags", None) is None:
+        layout = None
+    elif matrix.flags.c_contiguous:
+        layout = "C"
+    elif matrix.flags.f_contiguous:
+        layout = "F"
+    else:
+        layout = "strided"
+
+    return {"shape": tuple(getattr(matrix, "shape", ())),
+            "nnz": matrix.nnz if sparse_format is not None else None,
+            "dtype": str(getattr(matrix, "dtype", type(matrix).__name__)),
+            "layout": layout}
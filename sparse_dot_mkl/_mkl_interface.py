@@ -1,6 +1,11 @@
 import os
+import json
+import zlib
 import time
+import threading
+import contextlib
 import warnings
+import weakref
 import ctypes as _ctypes
 import ctypes.util as _ctypes_util
 
@@ -35,29 +40,29 @@ except (OSError, ImportError) as err:
     _ierr_msg = "Unable to load the MKL libraries through libmkl_rt. Try setting $LD_LIBRARY_PATH. " + str(err)
     raise ImportError(_ierr_msg)
 
-# Use mkl-service to check version if it's installed
-# Since it's not on PyPi I don't want to make this an actual package dependency
-# So without it just create mock functions and don't do version checking
-try:
-    from mkl import get_version, get_version_string
-except ImportError:
-    def get_version():
-        return None
-
-
-    def get_version_string():
-        return None
-
-if get_version() is not None and get_version()["MajorVersion"] < 2020:
-    _verr_msg = "Loaded version of MKL is out of date: {v}".format(v=get_version_string())
-    warnings.warn(_verr_msg)
-
 import numpy as np
 import scipy.sparse as _spsparse
 from numpy.ctypeslib import ndpointer, as_array
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase, _audit_copy, _nbytes
 
 NUMPY_FLOAT_DTYPES = [np.float32, np.float64]
 
+# The detected MKL_INT type is cached here (keyed by MKL library path, size, and mtime) if it can only be found
+# with a trial multiplication
+MKL_INT_CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                  "sparse_dot_mkl", "mkl_int.json")
+
+
+class _MKLVersion(_ctypes.Structure):
+    """MKL version struct (MKLVersion)"""
+    _fields_ = [("MajorVersion", _ctypes.c_int),
+                ("MinorVersion", _ctypes.c_int),
+                ("UpdateVersion", _ctypes.c_int),
+                ("ProductStatus", _ctypes.c_char_p),
+                ("Build", _ctypes.c_char_p),
+                ("Processor", _ctypes.c_char_p),
+                ("Platform", _ctypes.c_char_p)]
+
 
 class MKL:
     """ This class holds shared object references to C functions with arg and returntypes that can be adjusted"""
@@ -65,6 +70,10 @@ class MKL:
     MKL_INT = None
     MKL_INT_NUMPY = None
     MKL_DEBUG = False
+    MKL_DENSE_THRESHOLD = 0.5
+
+    # Largest dimension, non-zero count, or output size which will use the LP64 interface if ILP64 is available
+    MKL_LP64_MAX = np.iinfo(np.int32).max
 
     # Import function for creating a MKL CSR object
     # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-create-csr
@@ -118,6 +127,18 @@ class MKL:
     # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-spmm
     _mkl_sparse_spmm = _libmkl.mkl_sparse_spmm
 
+    # Import function for two-stage matmul
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-sp2m
+    _mkl_sparse_sp2m = _libmkl.mkl_sparse_sp2m
+
+    # Import function for two-stage matmul single dense
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-sp2md
+    _mkl_sparse_s_sp2md = _libmkl.mkl_sparse_s_sp2md
+
+    # Import function for two-stage matmul double dense
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-sp2md
+    _mkl_sparse_d_sp2md = _libmkl.mkl_sparse_d_sp2md
+
     # Import function for cleaning up MKL objects
     # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-destroy
     _mkl_sparse_destroy = _libmkl.mkl_sparse_destroy
@@ -182,6 +203,18 @@ class MKL:
     # https://software.intel.com/en-us/mkl-developer-reference-c-cblas-syrk
     _cblas_dsyrk = _libmkl.cblas_dsyrk
 
+    # Import function for sparse symmetric triple product
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-sypr
+    _mkl_sparse_sypr = _libmkl.mkl_sparse_sypr
+
+    # Import function for dense single symmetric triple product
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-syprd
+    _mkl_sparse_s_syprd = _libmkl.mkl_sparse_s_syprd
+
+    # Import function for dense double symmetric triple product
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-syprd
+    _mkl_sparse_d_syprd = _libmkl.mkl_sparse_d_syprd
+
     # Import function for QR solver - reorder
     # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-qr-reorder
     _mkl_sparse_qr_reorder = _libmkl.mkl_sparse_qr_reorder
@@ -202,6 +235,86 @@ class MKL:
     # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-qr-solve
     _mkl_sparse_s_qr_solve = _libmkl.mkl_sparse_s_qr_solve
 
+    # Import function for setting sparse (dot) vector hints
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-set-mv-hint
+    _mkl_sparse_set_mv_hint = _libmkl.mkl_sparse_set_mv_hint
+
+    # Import function for setting sparse (dot) dense hints
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-set-mm-hint
+    _mkl_sparse_set_mm_hint = _libmkl.mkl_sparse_set_mm_hint
+
+    # Import function for setting memory hints
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-set-memory-hint
+    _mkl_sparse_set_memory_hint = _libmkl.mkl_sparse_set_memory_hint
+
+    # Import function for analyzing a sparse matrix using the provided hints
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-sparse-optimize
+    _mkl_sparse_optimize = _libmkl.mkl_sparse_optimize
+
+    # Import functions for thread control
+    # The lowercase names in mkl_rt are the fortran interface (arguments by reference), so use the C names
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-num-threads
+    _mkl_set_num_threads = _libmkl.MKL_Set_Num_Threads
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-num-threads-local
+    _mkl_set_num_threads_local = _libmkl.MKL_Set_Num_Threads_Local
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-get-max-threads
+    _mkl_get_max_threads = _libmkl.MKL_Get_Max_Threads
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-dynamic
+    _mkl_set_dynamic = _libmkl.MKL_Set_Dynamic
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-get-dynamic
+    _mkl_get_dynamic = _libmkl.MKL_Get_Dynamic
+
+    # Import functions for MKL memory manager statistics and for releasing its buffers
+    # These don't take MKL_INT arguments, so the argtypes are set here instead of in _set_int_type
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-mem-stat
+    _mkl_mem_stat = _libmkl.MKL_Mem_Stat
+    _mkl_mem_stat.argtypes = [_ctypes.POINTER(_ctypes.c_int)]
+    _mkl_mem_stat.restype = _ctypes.c_int64
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-peak-mem-usage
+    _mkl_peak_mem_usage = _libmkl.MKL_Peak_Mem_Usage
+    _mkl_peak_mem_usage.argtypes = [_ctypes.c_int]
+    _mkl_peak_mem_usage.restype = _ctypes.c_int64
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-free-buffers
+    _mkl_free_buffers = _libmkl.MKL_Free_Buffers
+    _mkl_free_buffers.argtypes = []
+    _mkl_free_buffers.restype = None
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-thread-free-buffers
+    _mkl_thread_free_buffers = _libmkl.MKL_Thread_Free_Buffers
+    _mkl_thread_free_buffers.argtypes = []
+    _mkl_thread_free_buffers.restype = None
+
+    # Import functions for selecting the threading and interface layers of mkl_rt
+    # These only have an effect before any other MKL function is called, and return the active layer
+    # They are called before the integer type is set, so the argtypes are set here instead of in _set_int_type
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-threading-layer
+    _mkl_set_threading_layer = _libmkl.MKL_Set_Threading_Layer
+    _mkl_set_threading_layer.argtypes = [_ctypes.c_int]
+    _mkl_set_threading_layer.restype = _ctypes.c_int
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-interface-layer
+    _mkl_set_interface_layer = _libmkl.MKL_Set_Interface_Layer
+    _mkl_set_interface_layer.argtypes = [_ctypes.c_int]
+    _mkl_set_interface_layer.restype = _ctypes.c_int
+
+    # Import functions for getting the MKL version
+    # Calling either of these initializes MKL, after which the layers can't be changed
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-get-version
+    _mkl_get_version = _libmkl.MKL_Get_Version
+    _mkl_get_version.argtypes = [_ctypes.POINTER(_MKLVersion)]
+    _mkl_get_version.restype = None
+
+    # https://software.intel.com/en-us/mkl-developer-reference-c-mkl-get-version-string
+    _mkl_get_version_string = _libmkl.MKL_Get_Version_String
+    _mkl_get_version_string.argtypes = [_ctypes.c_char_p, _ctypes.c_int]
+    _mkl_get_version_string.restype = None
+
     @classmethod
     def _set_int_type(cls, c_type, np_type):
         cls.MKL_INT = c_type
@@ -246,6 +359,22 @@ class MKL:
                                          _ctypes.POINTER(sparse_matrix_t)]
         cls._mkl_sparse_spmm.restypes = _ctypes.c_int
 
+        cls._mkl_sparse_sp2m.argtypes = [_ctypes.c_int,
+                                         matrix_descr,
+                                         sparse_matrix_t,
+                                         _ctypes.c_int,
+                                         matrix_descr,
+                                         sparse_matrix_t,
+                                         _ctypes.c_int,
+                                         _ctypes.POINTER(sparse_matrix_t)]
+        cls._mkl_sparse_sp2m.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_s_sp2md.argtypes = cls._mkl_sparse_sp2md_argtypes(_ctypes.c_float)
+        cls._mkl_sparse_s_sp2md.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_d_sp2md.argtypes = cls._mkl_sparse_sp2md_argtypes(_ctypes.c_double)
+        cls._mkl_sparse_d_sp2md.restypes = _ctypes.c_int
+
         cls._mkl_sparse_s_spmmd.argtypes = cls._mkl_sparse_spmmd_argtypes(_ctypes.c_float)
         cls._mkl_sparse_s_spmmd.restypes = _ctypes.c_int
 
@@ -293,115 +422,177 @@ class MKL:
         cls._cblas_dsyrk.argtypes = cls._cblas_syrk_argtypes(_ctypes.c_double)
         cls._cblas_dsyrk.restypes = None
 
-        cls._mkl_sparse_qr_reorder.argtypes = [sparse_matrix_t, matrix_descr]
-        cls._mkl_sparse_qr_reorder.restypes = _ctypes.c_int
+        cls._mkl_sparse_sypr.argtypes = [_ctypes.c_int,
+                                         sparse_matrix_t,
+                                         sparse_matrix_t,
+                                         matrix_descr,
+                                         _ctypes.POINTER(sparse_matrix_t),
+                                         _ctypes.c_int]
+        cls._mkl_sparse_sypr.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_s_syprd.argtypes = cls._mkl_sparse_syprd_argtypes(_ctypes.c_float)
+        cls._mkl_sparse_s_syprd.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_d_syprd.argtypes = cls._mkl_sparse_syprd_argtypes(_ctypes.c_double)
+        cls._mkl_sparse_d_syprd.restypes = _ctypes.c_int
+
+        # There are no ILP64 (_64) QR functions
+        if cls._mkl_sparse_qr_reorder is not None:
+            cls._mkl_sparse_qr_reorder.argtypes = [sparse_matrix_t, matrix_descr]
+            cls._mkl_sparse_qr_reorder.restypes = _ctypes.c_int
+
+            cls._mkl_sparse_d_qr_factorize.argtypes = [sparse_matrix_t, _ctypes.POINTER(_ctypes.c_double)]
+            cls._mkl_sparse_d_qr_factorize.restypes = _ctypes.c_int
 
-        cls._mkl_sparse_d_qr_factorize.argtypes = [sparse_matrix_t, _ctypes.POINTER(_ctypes.c_double)]
-        cls._mkl_sparse_d_qr_factorize.restypes = _ctypes.c_int
+            cls._mkl_sparse_s_qr_factorize.argtypes = [sparse_matrix_t, _ctypes.POINTER(_ctypes.c_float)]
+            cls._mkl_sparse_s_qr_factorize.restypes = _ctypes.c_int
 
-        cls._mkl_sparse_s_qr_factorize.argtypes = [sparse_matrix_t, _ctypes.POINTER(_ctypes.c_float)]
-        cls._mkl_sparse_s_qr_factorize.restypes = _ctypes.c_int
+            cls._mkl_sparse_d_qr_solve.argtypes = cls._mkl_sparse_qr_solve(_ctypes.c_double)
+            cls._mkl_sparse_d_qr_solve.restypes = _ctypes.c_int
 
-        cls._mkl_sparse_d_qr_solve.argtypes = cls._mkl_sparse_qr_solve(_ctypes.c_double)
-        cls._mkl_sparse_d_qr_solve.restypes = _ctypes.c_int
+            cls._mkl_sparse_s_qr_solve.argtypes = cls._mkl_sparse_qr_solve(_ctypes.c_float)
+            cls._mkl_sparse_s_qr_solve.restypes = _ctypes.c_int
 
-        cls._mkl_sparse_s_qr_solve.argtypes = cls._mkl_sparse_qr_solve(_ctypes.c_float)
-        cls._mkl_sparse_s_qr_solve.restypes = _ctypes.c_int
+        cls._mkl_sparse_set_mv_hint.argtypes = [sparse_matrix_t, _ctypes.c_int, matrix_descr, cls.MKL_INT]
+        cls._mkl_sparse_set_mv_hint.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_set_mm_hint.argtypes = [sparse_matrix_t,
+                                                _ctypes.c_int,
+                                                matrix_descr,
+                                                _ctypes.c_int,
+                                                cls.MKL_INT,
+                                                cls.MKL_INT]
+        cls._mkl_sparse_set_mm_hint.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_set_memory_hint.argtypes = [sparse_matrix_t, _ctypes.c_int]
+        cls._mkl_sparse_set_memory_hint.restypes = _ctypes.c_int
+
+        cls._mkl_sparse_optimize.argtypes = [sparse_matrix_t]
+        cls._mkl_sparse_optimize.restypes = _ctypes.c_int
+
+        cls._mkl_set_num_threads.argtypes = [_ctypes.c_int]
+        cls._mkl_set_num_threads.restype = None
+
+        cls._mkl_set_num_threads_local.argtypes = [_ctypes.c_int]
+        cls._mkl_set_num_threads_local.restype = _ctypes.c_int
+
+        cls._mkl_get_max_threads.argtypes = []
+        cls._mkl_get_max_threads.restype = _ctypes.c_int
+
+        cls._mkl_set_dynamic.argtypes = [_ctypes.c_int]
+        cls._mkl_set_dynamic.restype = None
+
+        cls._mkl_get_dynamic.argtypes = []
+        cls._mkl_get_dynamic.restype = _ctypes.c_int
 
     def __init__(self):
         raise NotImplementedError("This class is not intended to be instanced")
 
     """ The following methods return the argtype lists for each MKL function that has s and d variants"""
 
-    @staticmethod
-    def _mkl_sparse_create_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_create_argtypes(cls, prec_type):
         return [_ctypes.POINTER(sparse_matrix_t),
                 _ctypes.c_int,
-                MKL.MKL_INT,
-                MKL.MKL_INT,
-                ndpointer(dtype=MKL.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
-                ndpointer(dtype=MKL.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
-                ndpointer(dtype=MKL.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
+                cls.MKL_INT,
+                cls.MKL_INT,
+                ndpointer(dtype=cls.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
+                ndpointer(dtype=cls.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
+                ndpointer(dtype=cls.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
                 ndpointer(dtype=prec_type, ndim=1, flags='C_CONTIGUOUS')]
 
-    @staticmethod
-    def _mkl_sparse_create_bsr_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_create_bsr_argtypes(cls, prec_type):
         return [_ctypes.POINTER(sparse_matrix_t),
                 _ctypes.c_int,
                 _ctypes.c_int,
-                MKL.MKL_INT,
-                MKL.MKL_INT,
-                MKL.MKL_INT,
-                ndpointer(dtype=MKL.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
-                ndpointer(dtype=MKL.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
-                ndpointer(dtype=MKL.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
+                cls.MKL_INT,
+                cls.MKL_INT,
+                cls.MKL_INT,
+                ndpointer(dtype=cls.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
+                ndpointer(dtype=cls.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
+                ndpointer(dtype=cls.MKL_INT, ndim=1, flags='C_CONTIGUOUS'),
                 ndpointer(dtype=prec_type, ndim=3, flags='C_CONTIGUOUS')]
 
-    @staticmethod
-    def _mkl_sparse_export_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_export_argtypes(cls, prec_type):
         return [sparse_matrix_t,
                 _ctypes.POINTER(_ctypes.c_int),
-                _ctypes.POINTER(MKL.MKL_INT),
-                _ctypes.POINTER(MKL.MKL_INT),
-                _ctypes.POINTER(_ctypes.POINTER(MKL.MKL_INT)),
-                _ctypes.POINTER(_ctypes.POINTER(MKL.MKL_INT)),
-                _ctypes.POINTER(_ctypes.POINTER(MKL.MKL_INT)),
+                _ctypes.POINTER(cls.MKL_INT),
+                _ctypes.POINTER(cls.MKL_INT),
+                _ctypes.POINTER(_ctypes.POINTER(cls.MKL_INT)),
+                _ctypes.POINTER(_ctypes.POINTER(cls.MKL_INT)),
+                _ctypes.POINTER(_ctypes.POINTER(cls.MKL_INT)),
                 _ctypes.POINTER(_ctypes.POINTER(prec_type))]
 
-    @staticmethod
-    def _mkl_sparse_export_bsr_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_export_bsr_argtypes(cls, prec_type):
         return [sparse_matrix_t,
                 _ctypes.POINTER(_ctypes.c_int),
                 _ctypes.POINTER(_ctypes.c_int),
-                _ctypes.POINTER(MKL.MKL_INT),
-                _ctypes.POINTER(MKL.MKL_INT),
-                _ctypes.POINTER(MKL.MKL_INT),
-                _ctypes.POINTER(_ctypes.POINTER(MKL.MKL_INT)),
-                _ctypes.POINTER(_ctypes.POINTER(MKL.MKL_INT)),
-                _ctypes.POINTER(_ctypes.POINTER(MKL.MKL_INT)),
+                _ctypes.POINTER(cls.MKL_INT),
+                _ctypes.POINTER(cls.MKL_INT),
+                _ctypes.POINTER(cls.MKL_INT),
+                _ctypes.POINTER(_ctypes.POINTER(cls.MKL_INT)),
+                _ctypes.POINTER(_ctypes.POINTER(cls.MKL_INT)),
+                _ctypes.POINTER(_ctypes.POINTER(cls.MKL_INT)),
                 _ctypes.POINTER(_ctypes.POINTER(prec_type))]
 
-    @staticmethod
-    def _cblas_gemm_argtypes(prec_type):
+    @classmethod
+    def _cblas_gemm_argtypes(cls, prec_type):
         return [_ctypes.c_int,
                 _ctypes.c_int,
                 _ctypes.c_int,
-                MKL.MKL_INT,
-                MKL.MKL_INT,
-                MKL.MKL_INT,
+                cls.MKL_INT,
+                cls.MKL_INT,
+                cls.MKL_INT,
                 prec_type,
                 ndpointer(dtype=prec_type, ndim=2),
-                MKL.MKL_INT,
+                cls.MKL_INT,
                 ndpointer(dtype=prec_type, ndim=2),
-                MKL.MKL_INT,
+                cls.MKL_INT,
                 prec_type,
                 _ctypes.POINTER(prec_type),
-                MKL.MKL_INT]
+                cls.MKL_INT]
+
+    @classmethod
+    def _mkl_sparse_spmmd_argtypes(cls, prec_type):
+        return [_ctypes.c_int,
+                sparse_matrix_t,
+                sparse_matrix_t,
+                _ctypes.c_int,
+                _ctypes.POINTER(prec_type), cls.MKL_INT]
 
-    @staticmethod
-    def _mkl_sparse_spmmd_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_sp2md_argtypes(cls, prec_type):
         return [_ctypes.c_int,
+                matrix_descr,
                 sparse_matrix_t,
+                _ctypes.c_int,
+                matrix_descr,
                 sparse_matrix_t,
+                prec_type,
+                prec_type,
+                _ctypes.POINTER(prec_type),
                 _ctypes.c_int,
-                _ctypes.POINTER(prec_type), MKL.MKL_INT]
+                cls.MKL_INT]
 
-    @staticmethod
-    def _mkl_sparse_mm_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_mm_argtypes(cls, prec_type):
         return [_ctypes.c_int,
                 prec_type,
                 sparse_matrix_t,
                 matrix_descr,
                 _ctypes.c_int,
                 ndpointer(dtype=prec_type, ndim=2),
-                MKL.MKL_INT,
-                MKL.MKL_INT,
+                cls.MKL_INT,
+                cls.MKL_INT,
                 prec_type,
                 _ctypes.POINTER(prec_type),
-                MKL.MKL_INT]
+                cls.MKL_INT]
 
-    @staticmethod
-    def _mkl_sparse_mv_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_mv_argtypes(cls, prec_type):
         return [_ctypes.c_int,
                 prec_type,
                 sparse_matrix_t,
@@ -410,41 +601,81 @@ class MKL:
                 prec_type,
                 _ctypes.POINTER(prec_type)]
 
-    @staticmethod
-    def _mkl_sparse_syrkd_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_syrkd_argtypes(cls, prec_type):
         return [_ctypes.c_int,
                 sparse_matrix_t,
                 prec_type,
                 prec_type,
                 _ctypes.POINTER(prec_type),
                 _ctypes.c_int,
-                MKL.MKL_INT]
+                cls.MKL_INT]
 
-    @staticmethod
-    def _cblas_syrk_argtypes(prec_type):
+    @classmethod
+    def _mkl_sparse_syprd_argtypes(cls, prec_type):
         return [_ctypes.c_int,
+                sparse_matrix_t,
+                ndpointer(dtype=prec_type, ndim=2),
+                _ctypes.c_int,
+                cls.MKL_INT,
+                prec_type,
+                prec_type,
+                _ctypes.POINTER(prec_type),
                 _ctypes.c_int,
+                cls.MKL_INT]
+
+    @classmethod
+    def _cblas_syrk_argtypes(cls, prec_type):
+        return [_ctypes.c_int,
                 _ctypes.c_int,
-                MKL.MKL_INT,
-                MKL.MKL_INT,
+                _ctypes.c_int,
+                cls.MKL_INT,
+                cls.MKL_INT,
                 prec_type,
                 ndpointer(dtype=prec_type, ndim=2),
-                MKL.MKL_INT,
+                cls.MKL_INT,
                 prec_type,
                 _ctypes.POINTER(prec_type),
-                MKL.MKL_INT]
+                cls.MKL_INT]
 
-    @staticmethod
-    def _mkl_sparse_qr_solve(prec_type):
+    @classmethod
+    def _mkl_sparse_qr_solve(cls, prec_type):
         return [_ctypes.c_int,
                 sparse_matrix_t,
                 _ctypes.POINTER(prec_type),
                 _ctypes.c_int,
-                MKL.MKL_INT,
+                cls.MKL_INT,
                 _ctypes.POINTER(prec_type),
-                MKL.MKL_INT,
+                cls.MKL_INT,
                 ndpointer(dtype=prec_type, ndim=2),
-                MKL.MKL_INT]
+                cls.MKL_INT]
+
+
+class MKL64(MKL):
+    """
+    This class holds references to the ILP64 (_64 suffixed) MKL functions, which always take 64-bit integers.
+    These exist alongside the LP64 functions in mkl_rt, so each call can use whichever interface fits its matrices.
+    The service functions are shared with MKL.
+    """
+
+    MKL_INT = None
+    MKL_INT_NUMPY = None
+
+    @classmethod
+    def _bind_functions(cls):
+        """
+        Replace every sparse BLAS and CBLAS function reference inherited from MKL with the _64 function.
+        Functions without a _64 version are set to None.
+
+        :return: True if all of the functions needed for products exist
+        :rtype: bool
+        """
+
+        for attr, func in vars(MKL).items():
+            if isinstance(func, _ctypes._CFuncPtr) and func.__name__.startswith(("mkl_sparse_", "cblas_")):
+                setattr(cls, attr, getattr(_libmkl, func.__name__ + "_64", None))
+
+        return cls._mkl_sparse_d_create_csr is not None and cls._mkl_sparse_sp2m is not None
 
 
 # Construct opaque struct & type
@@ -465,6 +696,14 @@ class matrix_descr(_ctypes.Structure):
         super(matrix_descr, self).__init__(sparse_matrix_type_t, sparse_fill_mode_t, sparse_diag_type_t)
 
 
+# Shared object information struct from dladdr (POSIX only)
+class _DlInfo(_ctypes.Structure):
+    _fields_ = [("dli_fname", _ctypes.c_char_p),
+                ("dli_fbase", _ctypes.c_void_p),
+                ("dli_sname", _ctypes.c_char_p),
+                ("dli_saddr", _ctypes.c_void_p)]
+
+
 # Define standard return codes
 RETURN_CODES = {0: "SPARSE_STATUS_SUCCESS",
                 1: "SPARSE_STATUS_NOT_INITIALIZED",
@@ -482,13 +721,79 @@ LAYOUT_CODE_F = 102
 SPARSE_OPERATION_NON_TRANSPOSE = 10
 SPARSE_OPERATION_TRANSPOSE = 11
 
+# Define matrix descriptor codes
+SPARSE_MATRIX_TYPE_GENERAL = 20
+SPARSE_MATRIX_TYPE_SYMMETRIC = 21
+SPARSE_MATRIX_TYPE_TRIANGULAR = 23
+SPARSE_MATRIX_TYPE_DIAGONAL = 24
+SPARSE_FILL_MODE_LOWER = 40
+SPARSE_FILL_MODE_UPPER = 41
+SPARSE_FILL_MODE_FULL = 42
+SPARSE_DIAG_NON_UNIT = 50
+SPARSE_DIAG_UNIT = 51
+
+# Matrix structures, fill modes, and diagonal types that a sparse matrix can be described with
+# https://software.intel.com/en-us/mkl-developer-reference-c-matrix-descriptor
+MATRIX_STRUCTURES = {"general": SPARSE_MATRIX_TYPE_GENERAL,
+                     "symmetric": SPARSE_MATRIX_TYPE_SYMMETRIC,
+                     "triangular": SPARSE_MATRIX_TYPE_TRIANGULAR,
+                     "diagonal": SPARSE_MATRIX_TYPE_DIAGONAL}
+FILL_MODES = {"lower": SPARSE_FILL_MODE_LOWER, "upper": SPARSE_FILL_MODE_UPPER}
+DIAGONAL_TYPES = {"non_unit": SPARSE_DIAG_NON_UNIT, "unit": SPARSE_DIAG_UNIT}
+
 # Define index codes
 SPARSE_INDEX_BASE_ZERO = 0
 SPARSE_INDEX_BASE_ONE = 1
 
+# Define memory hint codes
+SPARSE_MEMORY_NONE = 80
+SPARSE_MEMORY_AGGRESSIVE = 81
+
+# Define sp2m request stage codes
+SPARSE_STAGE_FULL_MULT = 90
+SPARSE_STAGE_NNZ_COUNT = 91
+SPARSE_STAGE_FINALIZE_MULT = 92
+SPARSE_STAGE_FULL_MULT_NO_VAL = 93
+SPARSE_STAGE_FINALIZE_MULT_NO_VAL = 94
+
+# MKL threading layers
+# https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-threading-layer
+THREADING_LAYERS = {"INTEL": 0, "SEQUENTIAL": 1, "GNU": 3, "TBB": 4}
+
+# MKL interface layers (GNU is a flag that can be combined with LP64 or ILP64)
+# https://software.intel.com/en-us/mkl-developer-reference-c-mkl-set-interface-layer
+INTERFACE_LAYERS = {"LP64": 0, "ILP64": 1}
+MKL_INTERFACE_GNU = 2
+
+# mkl_peak_mem_usage modes
+# https://software.intel.com/en-us/mkl-developer-reference-c-mkl-peak-mem-usage
+MKL_PEAK_MEM_DISABLE = 0
+MKL_PEAK_MEM_ENABLE = 1
+MKL_PEAK_MEM = 2
+MKL_PEAK_MEM_RESET = -1
+
 # ILP64 message
 ILP64_MSG = " Try changing MKL to int64 with the environment variable MKL_INTERFACE_LAYER=ILP64"
 
+# Handles owned by MKLSparseMatrix objects, which are only destroyed when the owning object is finalized
+# Matrices are keyed by id() of the wrapped scipy matrix (value is a weakref to the owner)
+# Handles are keyed by the address of the MKL object
+_PERSISTENT_MATRICES = {}
+_PERSISTENT_HANDLES = set()
+
+# Addresses of every MKL handle which has been created and not yet destroyed
+_LIVE_HANDLES = set()
+
+# Index arrays cast to a MKL_INT type, keyed by the buffer address and size of the original indptr and indices arrays
+# and the MKL_INT type. Entries hold weak references to the original arrays and a checksum of their values, so cast
+# arrays are only reused for the same arrays with unchanged values. Entries are evicted when either original array
+# is garbage collected.
+_INDEX_CACHE = {}
+
+# The MKL integer type is detected the first time MKL is used instead of at import
+_INIT_STATE = {"done": False, "running": False}
+_INIT_LOCK = threading.RLock()
+
 
 def set_debug_mode(debug_bool):
     """
@@ -501,6 +806,317 @@ def set_debug_mode(debug_bool):
     MKL.MKL_DEBUG = debug_bool
 
 
+def set_dense_threshold(threshold):
+    """
+    Set the output density above which a sparse (dot) sparse product with dense="auto" will yield a dense array
+
+    :param threshold: Fraction of the output which is non-zero, between 0 and 1. Defaults to 0.5.
+    :type threshold: float
+    """
+
+    if not 0 <= threshold <= 1:
+        raise ValueError("Dense threshold must be between 0 and 1; {t} provided".format(t=threshold))
+
+    MKL.MKL_DENSE_THRESHOLD = float(threshold)
+
+
+def set_num_threads(n_threads):
+    """
+    Set the number of threads MKL uses for every python thread which has not set a thread-local number
+
+    :param n_threads: Number of threads
+    :type n_threads: int
+    """
+
+    MKL._mkl_set_num_threads(_check_num_threads(n_threads))
+
+
+def get_max_threads():
+    """
+    Get the number of threads MKL will use for a call from this python thread
+
+    :return: Number of threads
+    :rtype: int
+    """
+
+    return MKL._mkl_get_max_threads()
+
+
+def set_dynamic(dynamic):
+    """
+    Allow or prevent MKL from using fewer threads than requested when it decides that is faster.
+    MKL does this by default.
+
+    :param dynamic: True to allow MKL to adjust the number of threads. False to always use the requested number.
+    :type dynamic: bool
+    """
+
+    MKL._mkl_set_dynamic(int(bool(dynamic)))
+
+
+@contextlib.contextmanager
+def mkl_threads(n_threads):
+    """
+    Context manager which sets the number of threads MKL uses for calls from this python thread only.
+    Other python threads are not affected, and the previous setting is restored on exit.
+
+    :param n_threads: Number of threads, or None to leave the thread settings unchanged
+    :type n_threads: int, None
+    """
+
+    if n_threads is None:
+        yield
+        return
+
+    # mkl_set_num_threads_local returns the previous thread-local setting (0 means use the global setting)
+    previous_threads = MKL._mkl_set_num_threads_local(_check_num_threads(n_threads))
+    debug_print("Set MKL thread-local threads to {n}".format(n=n_threads))
+
+    try:
+        yield
+    finally:
+        MKL._mkl_set_num_threads_local(previous_threads)
+
+
+def memory_stats(reset_peak=False):
+    """
+    Get the memory allocated by the MKL memory manager and the number of live MKL sparse handles
+
+    :param reset_peak: Reset the peak memory usage after reading it
+    :type reset_peak: bool
+    :return: A dict with keys:
+    "mkl_bytes": the bytes currently allocated by the MKL memory manager,
+    "mkl_buffers": the number of buffers currently allocated by the MKL memory manager,
+    "mkl_peak_bytes": the peak bytes allocated by the MKL memory manager since peak tracking was enabled or reset
+    (None if peak tracking is not enabled with set_peak_memory_tracking(True)),
+    "live_handles": the number of MKL sparse handles which have been created and not destroyed,
+    "persistent_handles": the number of those handles which are owned by MKLSparseMatrix objects
+    :rtype: dict
+    """
+
+    n_buffers = _ctypes.c_int()
+    mkl_bytes = MKL._mkl_mem_stat(_ctypes.byref(n_buffers))
+    peak_bytes = MKL._mkl_peak_mem_usage(MKL_PEAK_MEM_RESET if reset_peak else MKL_PEAK_MEM)
+
+    return {"mkl_bytes": int(mkl_bytes),
+            "mkl_buffers": n_buffers.value,
+            "mkl_peak_bytes": int(peak_bytes) if peak_bytes >= 0 else None,
+            "live_handles": len(_LIVE_HANDLES),
+            "persistent_handles": len(_PERSISTENT_HANDLES)}
+
+
+def set_peak_memory_tracking(enabled):
+    """
+    Turn MKL peak memory usage tracking on or off. This is off by default because it slows down
+    the MKL memory manager.
+
+    :param enabled: True to track peak memory usage. False to stop tracking it.
+    :type enabled: bool
+    """
+
+    ret_val = MKL._mkl_peak_mem_usage(MKL_PEAK_MEM_ENABLE if enabled else MKL_PEAK_MEM_DISABLE)
+
+    if ret_val < 0 and enabled:
+        raise ValueError("MKL peak memory usage tracking could not be enabled")
+
+
+@contextlib.contextmanager
+def release_memory(thread_only=False):
+    """
+    Context manager which releases the buffers held by the MKL memory manager when it exits.
+    The dict it yields is filled in on exit with the memory_stats() after the buffers are released, and with:
+    "released_bytes": the bytes released by freeing the MKL buffers,
+    "new_handles": the number of MKL sparse handles created in the block which are still alive on exit.
+    This includes handles held by objects which are still alive (MKLSparseMatrix, SparseQR, SparseProductPlan,
+    and zero-copy outputs); any others have been leaked.
+
+    :param thread_only: Only release the buffers held for the calling python thread
+    :type thread_only: bool
+    :return: Dict which is filled in on exit
+    :rtype: dict
+    """
+
+    stats = {}
+    handles_before = set(_LIVE_HANDLES)
+
+    try:
+        yield stats
+    finally:
+        bytes_before = MKL._mkl_mem_stat(_ctypes.byref(_ctypes.c_int()))
+
+        if thread_only:
+            MKL._mkl_thread_free_buffers()
+        else:
+            MKL._mkl_free_buffers()
+
+        stats.update(memory_stats())
+        stats["released_bytes"] = int(bytes_before) - stats["mkl_bytes"]
+        stats["new_handles"] = len(_LIVE_HANDLES - handles_before)
+
+        debug_print("Released {n} bytes of MKL buffers".format(n=stats["released_bytes"]))
+
+
+def _check_num_threads(n_threads):
+    """
+    Make sure a number of threads is a positive integer
+
+    :param n_threads: Number of threads
+    :type n_threads: int
+    :return: Number of threads
+    :rtype: int
+    """
+
+    if isinstance(n_threads, bool) or int(n_threads) != n_threads or n_threads < 1:
+        raise ValueError("Number of threads must be a positive integer; {n} provided".format(n=n_threads))
+
+    return int(n_threads)
+
+
+def set_threading_layer(layer):
+    """
+    Set the MKL threading layer.
+    This only has an effect before MKL has been used, so it is usually better to set the environment variable
+    MKL_THREADING_LAYER, which is validated and applied when sparse_dot_mkl is imported.
+    A RuntimeWarning is raised if MKL is already using a different threading layer.
+
+    :param layer: "INTEL", "SEQUENTIAL", "GNU", or "TBB"
+    :type layer: str
+    :return: The active threading layer
+    :rtype: str
+    """
+
+    code = _layer_code(layer, THREADING_LAYERS, "threading")
+    active = _layer_name(MKL._mkl_set_threading_layer(code), THREADING_LAYERS)
+
+    if active != layer.upper():
+        warnings.warn("MKL threading layer {l} could not be set because MKL is using {a}".format(l=layer.upper(),
+                                                                                                a=active),
+                      RuntimeWarning)
+
+    return active
+
+
+def get_threading_layer():
+    """
+    Get the MKL threading layer
+
+    :return: The active threading layer ("INTEL", "SEQUENTIAL", "GNU", or "TBB"), or None if MKL has not been told
+    :rtype: str, None
+    """
+
+    # Setting an invalid layer has no effect and returns the active layer
+    return _layer_name(MKL._mkl_set_threading_layer(-1), THREADING_LAYERS)
+
+
+def get_interface_layer():
+    """
+    Get the MKL interface layer
+
+    :return: The active interface layer ("LP64" or "ILP64"), or None if MKL has not been told
+    :rtype: str, None
+    """
+
+    code = MKL._mkl_set_interface_layer(-1)
+    return _layer_name(code & ~MKL_INTERFACE_GNU if code >= 0 else code, INTERFACE_LAYERS)
+
+
+def _layer_code(layer, layers, layer_type):
+    """
+    Get the MKL code for a layer name
+
+    :param layer: Layer name (case-insensitive)
+    :type layer: str
+    :param layers: Dict of valid layer names keyed to MKL codes
+    :type layers: dict
+    :param layer_type: "threading" or "interface" for error messages
+    :type layer_type: str
+    :return: MKL code
+    :rtype: int
+    """
+
+    try:
+        return layers[str(layer).strip().upper()]
+    except KeyError:
+        raise ValueError("MKL {t} layer must be one of {v}; {l} provided".format(t=layer_type, v=list(layers.keys()),
+                                                                                l=layer))
+
+
+def _layer_name(code, layers):
+    """
+    Get the layer name for a MKL code
+
+    :param code: MKL code
+    :type code: int
+    :param layers: Dict of valid layer names keyed to MKL codes
+    :type layers: dict
+    :return: Layer name, or None if the code is not a known layer
+    :rtype: str, None
+    """
+
+    for name, layer_code in layers.items():
+        if layer_code == code:
+            return name
+
+    return None
+
+
+def _configure_layers():
+    """
+    Validate the MKL_THREADING_LAYER and MKL_INTERFACE_LAYER environment variables and set those layers explicitly.
+    mkl_rt ignores invalid values without any error, and this has to happen before MKL is used for anything else.
+    """
+
+    threading_layer = os.environ.get("MKL_THREADING_LAYER")
+    interface_layer = os.environ.get("MKL_INTERFACE_LAYER")
+
+    try:
+        if threading_layer is not None:
+            MKL._mkl_set_threading_layer(_layer_code(threading_layer, THREADING_LAYERS, "threading"))
+
+        if interface_layer is not None:
+            interface = [i.strip().upper() for i in interface_layer.split(",")]
+            code = _layer_code(interface[0], INTERFACE_LAYERS, "interface")
+
+            if interface[1:] == ["GNU"]:
+                code |= MKL_INTERFACE_GNU
+            elif len(interface) > 1:
+                raise ValueError("MKL interface layer may only be combined with GNU; {l} provided".format(
+                    l=interface_layer))
+
+            MKL._mkl_set_interface_layer(code)
+
+    except ValueError as err:
+        raise ImportError("Invalid MKL layer environment variable: " + str(err))
+
+
+def get_version():
+    """
+    Get the version of the loaded MKL library
+
+    :return: A dict with MajorVersion, MinorVersion, UpdateVersion, ProductStatus, Build, Processor, and Platform
+    :rtype: dict
+    """
+
+    version = _MKLVersion()
+    MKL._mkl_get_version(_ctypes.byref(version))
+
+    return {name: value.decode() if isinstance(value, bytes) else value
+            for name, value in ((f, getattr(version, f)) for f, _ in _MKLVersion._fields_)}
+
+
+def get_version_string():
+    """
+    Get the version string of the loaded MKL library
+
+    :return: MKL version string
+    :rtype: str
+    """
+
+    buffer = _ctypes.create_string_buffer(256)
+    MKL._mkl_get_version_string(buffer, len(buffer))
+    return buffer.value.decode().strip()
+
+
 def print_mkl_debug():
     """
     Print the MKL interface status if debug mode is on
@@ -509,69 +1125,273 @@ def print_mkl_debug():
     if not MKL.MKL_DEBUG:
         return
 
-    if get_version_string() is None:
-        print("mkl-service must be installed to get full debug messaging")
-    else:
-        print(get_version_string())
+    _mkl_init()
+
+    print(get_version_string())
 
     print("MKL linked: {fn}".format(fn=_libmkl._name))
     print("MKL interface {np} | {c}".format(np=MKL.MKL_INT_NUMPY, c=MKL.MKL_INT))
+    print("MKL ILP64 (_64) interface for large matrices: {a}".format(a=MKL64.MKL_INT is not None))
+    print("MKL threading layer {t} | interface layer {i}".format(t=get_threading_layer(), i=get_interface_layer()))
+    print("MKL max threads: {n}".format(n=get_max_threads()))
     print("Set int32 interface with env MKL_INTERFACE_LAYER=LP64")
     print("Set int64 interface with env MKL_INTERFACE_LAYER=ILP64")
 
 
-def debug_print(msg):
-    """
-    Print a message if debug mode is on
-    :param msg: Message
-    :type msg: str
-    """
+def debug_print(msg):
+    """
+    Print a message if debug mode is on
+    :param msg: Message
+    :type msg: str
+    """
+
+    if not MKL.MKL_DEBUG:
+        return
+    else:
+        print(msg)
+
+
+def debug_timer(msg=None, old_time=None):
+    """
+    Print a message with timing information if debug mode is on
+    :param msg: Message
+    :type msg: str
+    :param old_time: Time to calculate difference for
+    :type old_time: float
+    """
+
+    if not MKL.MKL_DEBUG:
+        return
+
+    t0 = time.time()
+
+    if old_time is not None and msg is not None:
+        print(msg + ": {0:.6f} seconds".format(t0 - old_time))
+
+    return t0
+
+
+@_timed_phase("casting")
+def _check_scipy_index_typing(sparse_matrix, mkl=MKL):
+    """
+    Ensure that the sparse matrix indicies are in the correct integer type.
+    The matrix is not modified; if the indices need to be cast, a new matrix which shares the data array is returned.
+    Cast index arrays are cached until the original index arrays are garbage collected, so repeated calls with
+    the same matrix only cast once. Cached arrays are checked against the values of the original arrays on every call,
+    so indices which are changed in place are cast again.
+
+    :param sparse_matrix: Scipy matrix in CSC or CSR format
+    :type sparse_matrix: scipy.sparse.spmatrix
+    :param mkl: The MKL interface the indices will be passed to
+    :type mkl: MKL, MKL64
+    :return: Sparse matrix with indices of the MKL_INT type
+    :rtype: scipy.sparse.spmatrix
+    """
+
+    _mkl_init()
+
+    int_max = np.iinfo(mkl.MKL_INT_NUMPY).max
+    if (sparse_matrix.nnz > int_max) or (max(sparse_matrix.shape) > int_max):
+        msg = "MKL interface is {t} and cannot hold matrix {m}\n".format(m=repr(sparse_matrix), t=mkl.MKL_INT_NUMPY)
+        msg += "Try changing MKL to int64 with the environment variable MKL_INTERFACE_LAYER=ILP64"
+        raise ValueError(msg)
+
+    if sparse_matrix.indptr.dtype == mkl.MKL_INT_NUMPY and sparse_matrix.indices.dtype == mkl.MKL_INT_NUMPY:
+        return sparse_matrix
+
+    indptr, indices = _cached_scipy_indices(sparse_matrix, mkl)
+
+    _empty_args = {"blocksize": sparse_matrix.blocksize} if _spsparse.isspmatrix_bsr(sparse_matrix) else {}
+    return _pack_without_copy(sparse_matrix.__class__(sparse_matrix.shape, dtype=sparse_matrix.dtype, **_empty_args),
+                              sparse_matrix.data, indices, indptr)
+
+
+def _cached_scipy_indices(sparse_matrix, mkl):
+    """
+    Get the index arrays of a sparse matrix as the MKL_INT type from the index cache, casting them if they are not
+    cached or if the original arrays have changed since they were cached
+
+    :param sparse_matrix: Scipy matrix in CSR, CSC, or BSR format
+    :type sparse_matrix: scipy.sparse.spmatrix
+    :param mkl: The MKL interface the indices will be passed to
+    :type mkl: MKL, MKL64
+    :return: indptr and indices arrays of the MKL_INT type
+    :rtype: np.ndarray, np.ndarray
+    """
+
+    originals = sparse_matrix.indptr, sparse_matrix.indices
+
+    # The checksum needs contiguous buffers; other index arrays are cast without caching
+    if not all(arr.flags.c_contiguous for arr in originals):
+        return _cast_scipy_indices(sparse_matrix, mkl)
+
+    key = _index_cache_key(sparse_matrix, mkl)
+    checksum = zlib.crc32(originals[1], zlib.crc32(originals[0]))
+    cached = _INDEX_CACHE.get(key)
+
+    if cached is not None and cached[0]() is originals[0] and cached[1]() is originals[1] and cached[2] == checksum:
+        debug_print("Reusing {t} indices for {m}".format(t=key[2], m=repr(sparse_matrix)))
+        return tuple(o if c is None else c for c, o in zip(cached[3], originals))
+
+    cast = _cast_scipy_indices(sparse_matrix, mkl)
+
+    # Arrays which are already the MKL_INT type are cached as None so that the cache does not keep them alive
+    _INDEX_CACHE[key] = (weakref.ref(originals[0]), weakref.ref(originals[1]), checksum,
+                         tuple(c if c is not o else None for c, o in zip(cast, originals)))
+
+    # Evict the cast arrays when either original array is garbage collected
+    # Arrays which were cast again after changing in place already have these
+    if cached is None or cached[0]() is not originals[0] or cached[1]() is not originals[1]:
+        for arr in originals:
+            weakref.finalize(arr, _INDEX_CACHE.pop, key, None)
+
+    return cast
+
+
+def _index_cache_key(sparse_matrix, mkl):
+    """
+    Get the index cache key for the index arrays of a sparse matrix
+
+    :param sparse_matrix: Scipy matrix in CSR, CSC, or BSR format
+    :type sparse_matrix: scipy.sparse.spmatrix
+    :param mkl: The MKL interface the indices will be passed to
+    :type mkl: MKL, MKL64
+    :return: Buffer address and size of indptr and indices, and the MKL_INT type name
+    :rtype: tuple
+    """
+
+    return tuple((arr.ctypes.data, arr.shape[0]) for arr in (sparse_matrix.indptr, sparse_matrix.indices)) + \
+        (np.dtype(mkl.MKL_INT_NUMPY).name, )
+
+
+def _cast_scipy_indices(sparse_matrix, mkl):
+    """
+    Cast the index arrays of a sparse matrix to the MKL_INT type.
+    Arrays which are already the MKL_INT type are returned without a copy.
+
+    :param sparse_matrix: Scipy matrix in CSR, CSC, or BSR format
+    :type sparse_matrix: scipy.sparse.spmatrix
+    :param mkl: The MKL interface the indices will be passed to
+    :type mkl: MKL, MKL64
+    :return: indptr and indices arrays of the MKL_INT type
+    :rtype: np.ndarray, np.ndarray
+    """
+
+    int_type = np.dtype(mkl.MKL_INT_NUMPY)
+    _audit_copy("cast of sparse indices from {f} to {t}".format(f=sparse_matrix.indices.dtype, t=int_type.name),
+                sum(arr.size * int_type.itemsize for arr in (sparse_matrix.indptr, sparse_matrix.indices)
+                    if arr.dtype != int_type))
+
+    debug_print("Cast {m} indices from {f} to {t}; use prepare_mkl() or build the matrix with {t} indices "
+                "to avoid this".format(m=repr(sparse_matrix), f=sparse_matrix.indices.dtype, t=int_type.name))
+
+    return tuple(arr if arr.dtype == int_type else arr.astype(int_type)
+                 for arr in (sparse_matrix.indptr, sparse_matrix.indices))
+
+
+def prepare_mkl(matrix):
+    """
+    Cast the index arrays of a sparse matrix once to the integer type MKL will use for it.
+    Passing the returned matrix to sparse_dot_mkl functions will never copy its indices.
+    The input matrix is not modified, and the returned matrix shares its data array.
+
+    :param matrix: Sparse matrix in CSR, CSC, or BSR format
+    :type matrix: scipy.sparse.spmatrix
+    :return: Sparse matrix with MKL_INT indices
+    :rtype: scipy.sparse.spmatrix
+    """
+
+    if not _spsparse.issparse(matrix) or not _is_allowed_sparse_format(matrix):
+        raise ValueError("prepare_mkl requires a CSR, CSC, or BSR sparse matrix")
+
+    mkl = _choose_interface(matrix)
+    prepared = _check_scipy_index_typing(matrix, mkl)
+
+    # The prepared matrix holds the cast indices, so the cache doesn't need to
+    _INDEX_CACHE.pop(_index_cache_key(matrix, mkl), None)
+
+    return prepared
+
+
+@_timed_phase("validation")
+def _choose_interface(*matrices, output_size=0):
+    """
+    Choose the MKL interface for a call. LP64 (32-bit integers) is used unless a matrix dimension, a number of
+    non-zeros, or the output size is too large for it and the ILP64 (_64) functions are available.
+
+    :param matrices: Sparse matrices or dense arrays which will be passed to MKL
+    :type matrices: scipy.sparse.spmatrix, np.ndarray
+    :param output_size: The largest number of non-zeros the output could have
+    :type output_size: int
+    :return: MKL interface class
+    :rtype: MKL, MKL64
+    """
+
+    _mkl_init()
+
+    if MKL64.MKL_INT is None or MKL.MKL_INT_NUMPY == np.int64:
+        return MKL
+
+    sizes = [output_size]
+
+    for m in matrices:
+        sizes.extend(m.shape)
+        if _spsparse.issparse(m):
+            sizes.append(m.nnz)
 
-    if not MKL.MKL_DEBUG:
-        return
-    else:
-        print(msg)
+    if max(sizes) > MKL.MKL_LP64_MAX:
+        debug_print("Using the ILP64 interface for matrix sizes {s}".format(s=sizes))
+        return MKL64
 
+    return MKL
 
-def debug_timer(msg=None, old_time=None):
+
+def _handle_interface(ref_handle):
     """
-    Print a message with timing information if debug mode is on
-    :param msg: Message
-    :type msg: str
-    :param old_time: Time to calculate difference for
-    :type old_time: float
+    Get the MKL interface which created a MKL sparse handle.
+    Every function called on a handle must come from the same interface.
+
+    :param ref_handle: MKL sparse handle
+    :type ref_handle: sparse_matrix_t
+    :return: MKL interface class
+    :rtype: MKL, MKL64
     """
 
-    if not MKL.MKL_DEBUG:
-        return
+    return getattr(ref_handle, "mkl_interface", MKL)
 
-    t0 = time.time()
 
-    if old_time is not None and msg is not None:
-        print(msg + ": {0:.6f} seconds".format(t0 - old_time))
+def _new_handle(mkl=MKL):
+    """
+    Create an empty MKL sparse handle which records the interface that will be used to fill it
 
-    return t0
+    :param mkl: MKL interface class
+    :type mkl: MKL, MKL64
+    :return: Empty MKL sparse handle
+    :rtype: sparse_matrix_t
+    """
 
+    ref_handle = sparse_matrix_t()
+    ref_handle.mkl_interface = mkl
+    return ref_handle
 
-def _check_scipy_index_typing(sparse_matrix):
+
+def _track_handle(ref_handle):
     """
-    Ensure that the sparse matrix indicies are in the correct integer type
+    Count a MKL sparse handle as live until it is destroyed by _destroy_mkl_handle.
+    This is called after every MKL function which creates a handle returns successfully.
 
-    :param sparse_matrix: Scipy matrix in CSC or CSR format
-    :type sparse_matrix: scipy.sparse.spmatrix
+    :param ref_handle: MKL handle
+    :type ref_handle: sparse_matrix_t
+    :return: The same MKL handle
+    :rtype: sparse_matrix_t
     """
 
-    int_max = np.iinfo(MKL.MKL_INT_NUMPY).max
-    if (sparse_matrix.nnz > int_max) or (max(sparse_matrix.shape) > int_max):
-        msg = "MKL interface is {t} and cannot hold matrix {m}\n".format(m=repr(sparse_matrix), t=MKL.MKL_INT_NUMPY)
-        msg += "Try changing MKL to int64 with the environment variable MKL_INTERFACE_LAYER=ILP64"
-        raise ValueError(msg)
+    address = _handle_address(ref_handle)
 
-    # Cast indexes to MKL_INT type
-    if sparse_matrix.indptr.dtype != MKL.MKL_INT_NUMPY:
-        sparse_matrix.indptr = sparse_matrix.indptr.astype(MKL.MKL_INT_NUMPY)
-    if sparse_matrix.indices.dtype != MKL.MKL_INT_NUMPY:
-        sparse_matrix.indices = sparse_matrix.indices.astype(MKL.MKL_INT_NUMPY)
+    if address is not None:
+        _LIVE_HANDLES.add(address)
+
+    return ref_handle
 
 
 def _get_numpy_layout(numpy_arr, second_arr=None):
@@ -605,60 +1425,88 @@ def _get_numpy_layout(numpy_arr, second_arr=None):
         raise ValueError("Array layout check has failed for unknown reason")
 
 
-def _create_mkl_sparse(matrix):
+@_timed_phase("handle_creation")
+def _create_mkl_sparse(matrix, mkl=None, reuse_persistent=True):
     """
     Create MKL internal representation
 
     :param matrix: Sparse data in CSR or CSC format
     :type matrix: scipy.sparse.spmatrix
+    :param mkl: MKL interface to create the handle with. Chosen from the matrix size if None.
+    :type mkl: MKL, MKL64, None
+    :param reuse_persistent: Return the handle of a MKLSparseMatrix which owns this matrix instead of creating one.
+    This must be False if the caller attaches state to the handle (e.g. a QR factorization) or destroys it itself.
+    :type reuse_persistent: bool
 
     :return ref, double_precision: Handle for the MKL internal representation and boolean for double precision
     :rtype: sparse_matrix_t, float
     """
 
+    _mkl_init()
+
+    # Reuse the handle if this matrix is owned by a MKLSparseMatrix and it was created with the same interface
+    owner = _get_persistent_owner(matrix) if reuse_persistent else None
+    if owner is not None and (mkl is None or _handle_interface(owner.handle) is mkl):
+        debug_print("Reusing persistent MKL handle for {m}".format(m=repr(matrix)))
+        return owner.handle, owner.double_precision
+
+    if not _spsparse.issparse(matrix) or not _is_allowed_sparse_format(matrix):
+        raise ValueError("Matrix is not CSC, CSR, or BSR")
+
+    mkl = _choose_interface(matrix) if mkl is None else mkl
     double_precision = _is_double(matrix)
 
+    _matrix = _check_scipy_index_typing(matrix, mkl)
+
     # Figure out which matrix creation function to use
     if _spsparse.isspmatrix_csr(matrix):
-        _check_scipy_index_typing(matrix)
-        assert matrix.data.shape[0] == matrix.indices.shape[0]
-        assert matrix.indptr.shape[0] == matrix.shape[0] + 1
-        handle_func = MKL._mkl_sparse_d_create_csr if double_precision else MKL._mkl_sparse_s_create_csr
+        assert _matrix.data.shape[0] == _matrix.indices.shape[0]
+        assert _matrix.indptr.shape[0] == _matrix.shape[0] + 1
+        handle_func = mkl._mkl_sparse_d_create_csr if double_precision else mkl._mkl_sparse_s_create_csr
 
     elif _spsparse.isspmatrix_csc(matrix):
-        _check_scipy_index_typing(matrix)
-        assert matrix.data.shape[0] == matrix.indices.shape[0]
-        assert matrix.indptr.shape[0] == matrix.shape[1] + 1
-        handle_func = MKL._mkl_sparse_d_create_csc if double_precision else MKL._mkl_sparse_s_create_csc
+        assert _matrix.data.shape[0] == _matrix.indices.shape[0]
+        assert _matrix.indptr.shape[0] == _matrix.shape[1] + 1
+        handle_func = mkl._mkl_sparse_d_create_csc if double_precision else mkl._mkl_sparse_s_create_csc
 
-    elif _spsparse.isspmatrix_bsr(matrix):
-        _check_scipy_index_typing(matrix)
-        return _create_mkl_sparse_bsr(matrix), double_precision
+    # BSR is the only other allowed format
+    else:
+        handle_func = None
 
+    if handle_func is None:
+        ref = _create_mkl_sparse_bsr(_matrix, mkl=mkl)
     else:
-        raise ValueError("Matrix is not CSC, CSR, or BSR")
+        ref = _pass_mkl_handle_csr_csc(_matrix, handle_func, mkl=mkl)
 
-    return _pass_mkl_handle_csr_csc(matrix, handle_func), double_precision
+    # MKL uses the index arrays without copying them, so keep a cast copy alive as long as the handle
+    if _matrix is not matrix:
+        ref.mkl_matrix = _matrix
 
+    return ref, double_precision
 
-def _pass_mkl_handle_csr_csc(data, handle_func):
+
+def _pass_mkl_handle_csr_csc(data, handle_func, mkl=MKL):
     """
     Create MKL internal representation for CSR or CSC matrix
 
     :param data: Sparse data
     :type data: scipy.sparse.spmatrix
+    :param handle_func: MKL function to create the handle
+    :type handle_func: callable
+    :param mkl: MKL interface of handle_func
+    :type mkl: MKL, MKL64
     :return ref: Handle for the MKL internal representation
     :rtype: sparse_matrix_t
     """
 
     # Create a pointer for the output matrix
-    ref = sparse_matrix_t()
+    ref = _new_handle(mkl)
 
     # Load into a MKL data structure and check return
     ret_val = handle_func(_ctypes.byref(ref),
                           _ctypes.c_int(SPARSE_INDEX_BASE_ZERO),
-                          MKL.MKL_INT(data.shape[0]),
-                          MKL.MKL_INT(data.shape[1]),
+                          mkl.MKL_INT(data.shape[0]),
+                          mkl.MKL_INT(data.shape[1]),
                           data.indptr[0:-1],
                           data.indptr[1:],
                           data.indices,
@@ -667,21 +1515,23 @@ def _pass_mkl_handle_csr_csc(data, handle_func):
     # Check return
     _check_return_value(ret_val, handle_func.__name__)
 
-    return ref
+    return _track_handle(ref)
 
 
-def _create_mkl_sparse_bsr(matrix):
+def _create_mkl_sparse_bsr(matrix, mkl=MKL):
     """
     Create MKL internal representation for BSR matrix
 
     :param matrix: Sparse data
     :type matrix: scipy.sparse.bsr_matrix
+    :param mkl: MKL interface to create the handle with
+    :type mkl: MKL, MKL64
     :return ref: Handle for the MKL internal representation
     :rtype: sparse_matrix_t
     """
 
     double_precision = _is_double(matrix)
-    handle_func = MKL._mkl_sparse_d_create_bsr if double_precision else MKL._mkl_sparse_s_create_bsr
+    handle_func = mkl._mkl_sparse_d_create_bsr if double_precision else mkl._mkl_sparse_s_create_bsr
 
     # Get the blocksize and check that the blocks are square
     _blocksize = matrix.blocksize[0]
@@ -701,15 +1551,15 @@ def _create_mkl_sparse_bsr(matrix):
     _layout, _ = _get_numpy_layout(matrix.data)
 
     # Create a pointer for the output matrix
-    ref = sparse_matrix_t()
+    ref = _new_handle(mkl)
 
     # Load into a MKL data structure and check return
     ret_val = handle_func(_ctypes.byref(ref),
                           _ctypes.c_int(SPARSE_INDEX_BASE_ZERO),
                           _ctypes.c_int(_layout),
-                          MKL.MKL_INT(_block_rows),
-                          MKL.MKL_INT(_block_cols),
-                          MKL.MKL_INT(_blocksize),
+                          mkl.MKL_INT(_block_rows),
+                          mkl.MKL_INT(_block_cols),
+                          mkl.MKL_INT(_blocksize),
                           matrix.indptr[0:-1],
                           matrix.indptr[1:],
                           matrix.indices,
@@ -718,10 +1568,11 @@ def _create_mkl_sparse_bsr(matrix):
     # Check return
     _check_return_value(ret_val, handle_func.__name__)
 
-    return ref
+    return _track_handle(ref)
 
 
-def _export_mkl(csr_mkl_handle, double_precision, output_type="csr"):
+@_timed_phase("export")
+def _export_mkl(csr_mkl_handle, double_precision, output_type="csr", copy=True, owner=None):
     """
     Export a MKL sparse handle of CSR or CSC type
 
@@ -732,26 +1583,36 @@ def _export_mkl(csr_mkl_handle, double_precision, output_type="csr"):
     :type double_precision: bool
     :param output_type: The structure of the MKL handle (and therefore the type of scipy sparse to create)
     :type output_type: str
+    :param copy: Copy the data out of MKL memory. If False, the scipy matrix arrays will use the MKL memory directly
+        and the handle will be destroyed when they are garbage collected. The handle must have been created by MKL
+        (not from scipy arrays) and must not be destroyed by the caller if copy is False.
+    :type copy: bool
+    :param owner: An existing owner of the handle to use if copy is False, instead of taking ownership of it
+    :type owner: _MKLHandleOwner, None
 
     :return: Sparse matrix in scipy format
     :rtype: scipy.spmatrix
     """
 
     output_type = output_type.lower()
+    mkl = _handle_interface(csr_mkl_handle)
 
     if output_type == "csr":
-        out_func = MKL._mkl_sparse_d_export_csr if double_precision else MKL._mkl_sparse_s_export_csr
+        out_func = mkl._mkl_sparse_d_export_csr if double_precision else mkl._mkl_sparse_s_export_csr
         sp_matrix_constructor = _spsparse.csr_matrix
     elif output_type == "csc":
-        out_func = MKL._mkl_sparse_d_export_csc if double_precision else MKL._mkl_sparse_s_export_csc
+        out_func = mkl._mkl_sparse_d_export_csc if double_precision else mkl._mkl_sparse_s_export_csc
         sp_matrix_constructor = _spsparse.csc_matrix
     elif output_type == "bsr":
-        return _export_mkl_sparse_bsr(csr_mkl_handle, double_precision)
+        return _export_mkl_sparse_bsr(csr_mkl_handle, double_precision, copy=copy, owner=owner)
     else:
         raise ValueError("Only CSR, CSC, and BSR output types are supported")
 
+    # Take ownership of the handle so that it is destroyed when there are no more references to its memory
+    owner = (owner or _MKLHandleOwner(csr_mkl_handle)) if not copy else None
+
     # Allocate for output
-    ordering, nrows, ncols, indptrb, indptren, indices, data = _allocate_for_export(double_precision)
+    ordering, nrows, ncols, indptrb, indptren, indices, data = _allocate_for_export(double_precision, mkl=mkl)
     final_dtype = np.float64 if double_precision else np.float32
 
     ret_val = out_func(csr_mkl_handle,
@@ -781,11 +1642,8 @@ def _export_mkl(csr_mkl_handle, double_precision, output_type="csr"):
     index_dim = nrows if output_type == "csr" else ncols
 
     # Construct a numpy array and add 0 to first position for scipy.sparse's 3-array indexing
-    indptrb = as_array(indptrb, shape=(index_dim,))
-    indptren = as_array(indptren, shape=(index_dim,))
-
-    indptren = np.insert(indptren, 0, indptrb[0])
-    nnz = indptren[-1] - indptrb[0]
+    indptr = _export_indptr(indptrb, indptren, index_dim, owner, mkl=mkl)
+    nnz = indptr[-1] - indptr[0]
 
     # If there are no non-zeros, return an empty matrix
     # If the number of non-zeros is insane, raise a ValueError
@@ -795,14 +1653,25 @@ def _export_mkl(csr_mkl_handle, double_precision, output_type="csr"):
         raise ValueError("Matrix ({m} x {n}) is attempting to index {z} elements".format(m=nrows, n=ncols, z=nnz))
 
     # Construct numpy arrays from data pointer and from indicies pointer
-    data = np.array(as_array(data, shape=(nnz,)), copy=True)
-    indices = np.array(as_array(indices, shape=(nnz,)), copy=True)
+    if copy:
+        _audit_copy("copy of MKL {t} output".format(t=output_type),
+                    nnz * (np.dtype(final_dtype).itemsize + np.dtype(mkl.MKL_INT_NUMPY).itemsize) + indptr.nbytes)
+
+        data = np.array(as_array(data, shape=(nnz,)), copy=True)
+        indices = np.array(as_array(indices, shape=(nnz,)), copy=True)
+
+        # Pack and return the matrix
+        return sp_matrix_constructor((data, indices, indptr), shape=(nrows, ncols))
+
+    else:
+        data = _MKLBuffer.as_numpy(data, (nnz,), final_dtype, owner)
+        indices = _MKLBuffer.as_numpy(indices, (nnz,), mkl.MKL_INT_NUMPY, owner)
 
-    # Pack and return the matrix
-    return sp_matrix_constructor((data, indices, indptren), shape=(nrows, ncols))
+        # Set the arrays directly because the scipy constructor may cast the indices to a smaller integer type
+        return _pack_without_copy(sp_matrix_constructor((nrows, ncols), dtype=final_dtype), data, indices, indptr)
 
 
-def _export_mkl_sparse_bsr(bsr_mkl_handle, double_precision):
+def _export_mkl_sparse_bsr(bsr_mkl_handle, double_precision, copy=True, owner=None):
     """
     Export a BSR matrix from MKL's internal representation to scipy
 
@@ -811,17 +1680,26 @@ def _export_mkl_sparse_bsr(bsr_mkl_handle, double_precision):
     :param double_precision: Use float64 if True, float32 if False. This MUST match the underlying float type - this
         defines a memory view, it does not cast.
     :type double_precision: bool
+    :param copy: Copy the data out of MKL memory. If False, the scipy matrix arrays will use the MKL memory directly
+        and the handle will be destroyed when they are garbage collected.
+    :type copy: bool
+    :param owner: An existing owner of the handle to use if copy is False, instead of taking ownership of it
+    :type owner: _MKLHandleOwner, None
     :return: Sparse BSR matrix
     :rtype:
     """
 
+    # Take ownership of the handle so that it is destroyed when there are no more references to its memory
+    owner = (owner or _MKLHandleOwner(bsr_mkl_handle)) if not copy else None
+
     # Allocate for output
-    ordering, nrows, ncols, indptrb, indptren, indices, data = _allocate_for_export(double_precision)
+    mkl = _handle_interface(bsr_mkl_handle)
+    ordering, nrows, ncols, indptrb, indptren, indices, data = _allocate_for_export(double_precision, mkl=mkl)
     block_layout = _ctypes.c_int()
-    block_size = MKL.MKL_INT()
+    block_size = mkl.MKL_INT()
 
     # Set output
-    out_func = MKL._mkl_sparse_d_export_bsr if double_precision else MKL._mkl_sparse_s_export_bsr
+    out_func = mkl._mkl_sparse_d_export_bsr if double_precision else mkl._mkl_sparse_s_export_bsr
     final_dtype = np.float64 if double_precision else np.float32
 
     ret_val = out_func(bsr_mkl_handle,
@@ -850,12 +1728,9 @@ def _export_mkl_sparse_bsr(bsr_mkl_handle, double_precision):
     ordering = "F" if ordering.value == LAYOUT_CODE_F else "C"
 
     # Construct a numpy array and add 0 to first position for scipy.sparse's 3-array indexing
-    indptrb = as_array(indptrb, shape=(index_dim,))
-    indptren = as_array(indptren, shape=(index_dim,))
+    indptr = _export_indptr(indptrb, indptren, index_dim, owner, mkl=mkl)
 
-    indptren = np.insert(indptren, 0, indptrb[0])
-
-    nnz_blocks = (indptren[-1] - indptrb[0])
+    nnz_blocks = (indptr[-1] - indptr[0])
 
     # If there's no non-zero data, return an empty matrix
     if nnz_blocks == 0:
@@ -866,29 +1741,206 @@ def _export_mkl_sparse_bsr(bsr_mkl_handle, double_precision):
         _err = _err.format(m=nrows, n=ncols, z=nnz, b=nnz_blocks, bs=(block_size, block_size))
         raise ValueError(_err)
 
-    data = np.array(as_array(data, shape=(nnz_blocks, block_size, block_size)), copy=True, order=ordering,
-                    dtype=final_dtype)
-    indices = np.array(as_array(indices, shape=(nnz_blocks,)), copy=True)
+    if copy:
+        _audit_copy("copy of MKL bsr output",
+                    nnz_blocks * (block_size ** 2 * np.dtype(final_dtype).itemsize +
+                                  np.dtype(mkl.MKL_INT_NUMPY).itemsize) + indptr.nbytes)
+
+        data = np.array(as_array(data, shape=(nnz_blocks, block_size, block_size)), copy=True, order=ordering,
+                        dtype=final_dtype)
+        indices = np.array(as_array(indices, shape=(nnz_blocks,)), copy=True)
+
+        return _spsparse.bsr_matrix((data, indices, indptr), shape=(nrows, ncols), blocksize=block_dims)
+
+    else:
+        data = _MKLBuffer.as_numpy(data, (nnz_blocks, block_size, block_size), final_dtype, owner)
+        indices = _MKLBuffer.as_numpy(indices, (nnz_blocks,), mkl.MKL_INT_NUMPY, owner)
+
+        return _pack_without_copy(_spsparse.bsr_matrix((nrows, ncols), dtype=final_dtype, blocksize=block_dims),
+                                  data, indices, indptr)
+
+
+@_timed_phase("export")
+def _export_mkl_indptr(mkl_handle, double_precision, output_type="csr"):
+    """
+    Export only the index pointer from a MKL sparse handle of CSR, CSC, or BSR type.
+    This works on a handle which has a structure but no column indices or values
+    (e.g. the output of the sp2m SPARSE_STAGE_NNZ_COUNT stage).
+
+    :param mkl_handle: Handle for the MKL internal representation
+    :type mkl_handle: sparse_matrix_t
+    :param double_precision: The handle is float64 if True, float32 if False
+    :type double_precision: bool
+    :param output_type: The structure of the MKL handle
+    :type output_type: str
+    :return: Index pointer array (copied out of MKL memory). This is the block row pointer for BSR.
+    :rtype: np.ndarray
+    """
+
+    output_type = output_type.lower()
+    mkl = _handle_interface(mkl_handle)
+    ordering, nrows, ncols, indptrb, indptren, indices, data = _allocate_for_export(double_precision, mkl=mkl)
+
+    if output_type == "csr":
+        out_func = mkl._mkl_sparse_d_export_csr if double_precision else mkl._mkl_sparse_s_export_csr
+    elif output_type == "csc":
+        out_func = mkl._mkl_sparse_d_export_csc if double_precision else mkl._mkl_sparse_s_export_csc
+    elif output_type == "bsr":
+        out_func = mkl._mkl_sparse_d_export_bsr if double_precision else mkl._mkl_sparse_s_export_bsr
+    else:
+        raise ValueError("Only CSR, CSC, and BSR index pointers can be exported")
+
+    if output_type == "bsr":
+        ret_val = out_func(mkl_handle,
+                           _ctypes.byref(ordering),
+                           _ctypes.byref(_ctypes.c_int()),
+                           _ctypes.byref(nrows),
+                           _ctypes.byref(ncols),
+                           _ctypes.byref(mkl.MKL_INT()),
+                           _ctypes.byref(indptrb),
+                           _ctypes.byref(indptren),
+                           _ctypes.byref(indices),
+                           _ctypes.byref(data))
+    else:
+        ret_val = out_func(mkl_handle,
+                           _ctypes.byref(ordering),
+                           _ctypes.byref(nrows),
+                           _ctypes.byref(ncols),
+                           _ctypes.byref(indptrb),
+                           _ctypes.byref(indptren),
+                           _ctypes.byref(indices),
+                           _ctypes.byref(data))
+
+    # Check return
+    _check_return_value(ret_val, out_func.__name__)
+
+    index_dim = ncols.value if output_type == "csc" else nrows.value
+
+    if index_dim == 0:
+        return np.zeros(1, dtype=mkl.MKL_INT_NUMPY)
+
+    indptr = _export_indptr(indptrb, indptren, index_dim, mkl=mkl)
+    return indptr - indptr[0]
+
+
+def _export_indptr(indptrb, indptren, index_dim, owner=None, mkl=MKL):
+    """
+    Get a scipy (3-array) index pointer from the MKL (4-array) row or column start and end pointers
+
+    :param indptrb: Pointer to the index start array
+    :type indptrb: MKL_INT*
+    :param indptren: Pointer to the index end array
+    :type indptren: MKL_INT*
+    :param index_dim: Number of rows (CSR or BSR) or columns (CSC)
+    :type index_dim: int
+    :param owner: Owner of the MKL handle. If provided, the MKL memory will be used directly when the end pointer
+        is just the start pointer offset by one.
+    :type owner: _MKLHandleOwner, None
+    :param mkl: MKL interface of the handle
+    :type mkl: MKL, MKL64
+    :return: Index pointer array with index_dim + 1 elements
+    :rtype: np.ndarray
+    """
+
+    _int_size = np.dtype(mkl.MKL_INT_NUMPY).itemsize
+    _start, _end = _ctypes.cast(indptrb, _ctypes.c_void_p).value, _ctypes.cast(indptren, _ctypes.c_void_p).value
+
+    if owner is not None and _end == _start + _int_size and indptrb[0] == 0:
+        return _MKLBuffer.as_numpy(indptrb, (index_dim + 1,), mkl.MKL_INT_NUMPY, owner)
+
+    indptrb = as_array(indptrb, shape=(index_dim,))
+    indptren = as_array(indptren, shape=(index_dim,))
+
+    return np.insert(indptren, 0, indptrb[0])
+
+
+def _pack_without_copy(sparse_matrix, data, indices, indptr):
+    """
+    Put arrays into an empty scipy compressed sparse matrix without any checks, casts, or copies
+
+    :param sparse_matrix: Empty sparse matrix of the correct shape and type
+    :type sparse_matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, scipy.sparse.bsr_matrix
+    :return: Sparse matrix using the provided arrays
+    :rtype: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, scipy.sparse.bsr_matrix
+    """
+
+    sparse_matrix.data, sparse_matrix.indices, sparse_matrix.indptr = data, indices, indptr
+    return sparse_matrix
+
+
+def _csc_as_csr_transpose(matrix):
+    """
+    Reinterpret the arrays of a CSC matrix A as the CSR matrix AT without any checks, casts, or copies
+
+    :param matrix: Sparse matrix
+    :type matrix: scipy.sparse.csc_matrix
+    :return: Transposed sparse matrix which shares the arrays of matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+
+    return _pack_without_copy(_spsparse.csr_matrix(matrix.shape[::-1], dtype=matrix.dtype),
+                              matrix.data, matrix.indices, matrix.indptr)
+
+
+class _MKLHandleOwner:
+    """
+    Owns a MKL sparse handle and destroys it when this object is garbage collected.
+    Numpy arrays which use memory allocated by MKL keep a reference to this object.
+    """
+
+    def __init__(self, ref_handle):
+        self._finalizer = weakref.finalize(self, _destroy_mkl_handle, ref_handle)
 
-    return _spsparse.bsr_matrix((data, indices, indptren), shape=(nrows, ncols), blocksize=block_dims)
 
+class _MKLBuffer:
+    """
+    Exposes memory allocated by MKL to numpy through the array interface.
+    Numpy keeps a reference to this object as the array base, which keeps the handle owner alive.
+    """
 
-def _allocate_for_export(double_precision):
+    def __init__(self, pointer, shape, dtype, owner):
+        self.__array_interface__ = {"data": (_ctypes.cast(pointer, _ctypes.c_void_p).value, False),
+                                    "shape": shape,
+                                    "typestr": np.dtype(dtype).str,
+                                    "version": 3}
+        self._owner = owner
+
+    @classmethod
+    def as_numpy(cls, pointer, shape, dtype, owner):
+        """
+        Create a numpy array from MKL memory without copying
+
+        :param pointer: ctypes pointer to the memory
+        :param shape: Array shape
+        :type shape: tuple(int)
+        :param dtype: Array dtype
+        :type dtype: np.dtype
+        :param owner: Object which owns the memory
+        :type owner: _MKLHandleOwner
+        :return: Array
+        :rtype: np.ndarray
+        """
+        return np.asarray(cls(pointer, shape, dtype, owner))
+
+
+def _allocate_for_export(double_precision, mkl=MKL):
     """
     Get pointers for output from MKL internal representation
     :param double_precision: Allocate an output pointer of doubles
     :type double_precision: bool
+    :param mkl: MKL interface of the handle which will be exported
+    :type mkl: MKL, MKL64
     :return: ordering, nrows, ncols, indptrb, indptren, indices, data
     :rtype: c_int, MKL_INT, MKL_INT, MKL_INT*, MKL_INT*, MKL_INT*, c_float|c_double*
     """
     # Create the pointers for the output data
-    indptrb = _ctypes.POINTER(MKL.MKL_INT)()
-    indptren = _ctypes.POINTER(MKL.MKL_INT)()
-    indices = _ctypes.POINTER(MKL.MKL_INT)()
+    indptrb = _ctypes.POINTER(mkl.MKL_INT)()
+    indptren = _ctypes.POINTER(mkl.MKL_INT)()
+    indices = _ctypes.POINTER(mkl.MKL_INT)()
 
     ordering = _ctypes.c_int()
-    nrows = MKL.MKL_INT()
-    ncols = MKL.MKL_INT()
+    nrows = mkl.MKL_INT()
+    ncols = mkl.MKL_INT()
 
     data = _ctypes.POINTER(_ctypes.c_double)() if double_precision else _ctypes.POINTER(_ctypes.c_float)()
 
@@ -915,6 +1967,7 @@ def _check_return_value(ret_val, func_name):
         return
 
 
+@_timed_phase("handle_destruction")
 def _destroy_mkl_handle(ref_handle):
     """
     Deallocate a MKL sparse handle
@@ -923,10 +1976,73 @@ def _destroy_mkl_handle(ref_handle):
     :type ref_handle: sparse_matrix_t
     """
 
-    ret_val = MKL._mkl_sparse_destroy(ref_handle)
+    # Handles owned by a MKLSparseMatrix are destroyed by its finalizer instead
+    if _handle_address(ref_handle) in _PERSISTENT_HANDLES:
+        return
+
+    ret_val = _handle_interface(ref_handle)._mkl_sparse_destroy(ref_handle)
     _check_return_value(ret_val, "mkl_sparse_destroy")
 
+    _LIVE_HANDLES.discard(_handle_address(ref_handle))
+
+
+def _handle_address(ref_handle):
+    """
+    Get the memory address of a MKL sparse handle
+
+    :param ref_handle:
+    :type ref_handle: sparse_matrix_t
+    :return: Address or None if the handle is a null pointer
+    :rtype: int, None
+    """
+
+    return _ctypes.cast(ref_handle, _ctypes.c_void_p).value
+
+
+def _register_persistent_handle(owner):
+    """
+    Register a MKLSparseMatrix so that its handle is reused (and not destroyed) by the product functions
+
+    :param owner: Object which owns the scipy matrix and the MKL handle
+    :type owner: MKLSparseMatrix
+    """
+
+    _PERSISTENT_MATRICES[id(owner.matrix)] = weakref.ref(owner)
+    _PERSISTENT_HANDLES.add(_handle_address(owner.handle))
+
+
+def _release_persistent_handle(matrix_id, ref_handle):
+    """
+    Unregister and destroy a persistent MKL handle. This is called by the MKLSparseMatrix finalizer.
+
+    :param matrix_id: id() of the wrapped scipy matrix
+    :type matrix_id: int
+    :param ref_handle: MKL handle
+    :type ref_handle: sparse_matrix_t
+    """
+
+    _PERSISTENT_MATRICES.pop(matrix_id, None)
+    _PERSISTENT_HANDLES.discard(_handle_address(ref_handle))
+    _destroy_mkl_handle(ref_handle)
+
+
+def _get_persistent_owner(matrix):
+    """
+    Get the MKLSparseMatrix which owns a scipy matrix
+
+    :param matrix: Sparse matrix
+    :type matrix: scipy.sparse.spmatrix
+    :return: The owning object, or None if the matrix has no persistent handle
+    :rtype: MKLSparseMatrix, None
+    """
+
+    owner_ref = _PERSISTENT_MATRICES.get(id(matrix))
+    owner = owner_ref() if owner_ref is not None else None
+
+    return owner if owner is not None and owner.matrix is matrix else None
+
 
+@_timed_phase("reorder")
 def _order_mkl_handle(ref_handle):
     """
     Reorder indexes in a MKL sparse handle
@@ -935,21 +2051,70 @@ def _order_mkl_handle(ref_handle):
     :type ref_handle: sparse_matrix_t
     """
 
-    ret_val = MKL._mkl_sparse_order(ref_handle)
+    ret_val = _handle_interface(ref_handle)._mkl_sparse_order(ref_handle)
     _check_return_value(ret_val, "mkl_sparse_order")
 
 
-def _convert_to_csr(ref_handle, destroy_original=False):
+@_timed_phase("optimize")
+def _optimize_mkl_handle(ref_handle, expected_calls, transpose=False, layout=None, dense_columns=None,
+                         descr=None, aggressive_memory=True):
+    """
+    Set inspector-executor hints on a MKL sparse handle and then run the MKL analysis stage
+
+    :param ref_handle: MKL sparse handle
+    :type ref_handle: sparse_matrix_t
+    :param expected_calls: Number of times the operation is expected to be called
+    :type expected_calls: int
+    :param transpose: Hint for AT (dot) B instead of A (dot) B
+    :type transpose: bool
+    :param layout: Dense matrix layout code (LAYOUT_CODE_C or LAYOUT_CODE_F) for sparse (dot) dense hints.
+        Set to None for a sparse (dot) vector hint.
+    :type layout: int, None
+    :param dense_columns: Number of columns in the dense matrix for sparse (dot) dense hints
+    :type dense_columns: int, None
+    :param descr: Matrix description. Defaults to a general matrix.
+    :type descr: matrix_descr, None
+    :param aggressive_memory: Allow MKL to allocate memory for an internal copy of the matrix in a faster format
+    :type aggressive_memory: bool
+    """
+
+    descr = matrix_descr() if descr is None else descr
+    op = SPARSE_OPERATION_TRANSPOSE if transpose else SPARSE_OPERATION_NON_TRANSPOSE
+    mkl = _handle_interface(ref_handle)
+
+    if layout is None:
+        ret_val = mkl._mkl_sparse_set_mv_hint(ref_handle, op, descr, expected_calls)
+        _check_return_value(ret_val, "mkl_sparse_set_mv_hint")
+    else:
+        ret_val = mkl._mkl_sparse_set_mm_hint(ref_handle, op, descr, layout, dense_columns, expected_calls)
+        _check_return_value(ret_val, "mkl_sparse_set_mm_hint")
+
+    ret_val = mkl._mkl_sparse_set_memory_hint(ref_handle,
+                                              SPARSE_MEMORY_AGGRESSIVE if aggressive_memory else SPARSE_MEMORY_NONE)
+    _check_return_value(ret_val, "mkl_sparse_set_memory_hint")
+
+    ret_val = mkl._mkl_sparse_optimize(ref_handle)
+    _check_return_value(ret_val, "mkl_sparse_optimize")
+
+
+@_timed_phase("conversion")
+def _convert_to_csr(ref_handle, destroy_original=False, transpose=False):
     """
     Convert a MKL sparse handle to CSR format
 
     :param ref_handle:
     :type ref_handle: sparse_matrix_t
+    :param destroy_original: Destroy the original handle after it has been converted
+    :type destroy_original: bool
+    :param transpose: Convert the transpose of the matrix instead
+    :type transpose: bool
     :return:
     """
 
-    csr_ref = sparse_matrix_t()
-    ret_val = MKL._mkl_sparse_convert_csr(ref_handle, _ctypes.c_int(10), _ctypes.byref(csr_ref))
+    mkl = _handle_interface(ref_handle)
+    csr_ref = _new_handle(mkl)
+    op = SPARSE_OPERATION_TRANSPOSE if transpose else SPARSE_OPERATION_NON_TRANSPOSE
+    ret_val = mkl._mkl_sparse_convert_csr(ref_handle, _ctypes.c_int(op), _ctypes.byref(csr_ref))
 
     try:
         _check_return_value(ret_val, "mkl_sparse_convert_csr")
@@ -961,41 +2126,90 @@ def _convert_to_csr(ref_handle, destroy_original=False):
 
         raise
 
+    _track_handle(csr_ref)
+
     if destroy_original:
         _destroy_mkl_handle(ref_handle)
 
     return csr_ref
 
 
-def _sanity_check(matrix_a, matrix_b, allow_vector=False):
+def _structure_descr(matrix, structure=None, fill_mode="upper", diagonal="non_unit"):
+    """
+    Get the MKL matrix description for a sparse matrix.
+    MKL only reads the triangle selected by fill_mode of a symmetric or triangular matrix,
+    and only reads the diagonal of a diagonal matrix, so the rest of the matrix does not need to be stored.
+
+    :param matrix: Sparse matrix which will be described
+    :type matrix: scipy.sparse.spmatrix
+    :param structure: "general", "symmetric", "triangular", or "diagonal". None is a general matrix.
+    :type structure: str, None
+    :param fill_mode: "upper" or "lower" triangle of a symmetric or triangular matrix
+    :type fill_mode: str
+    :param diagonal: "non_unit" to use the stored diagonal, or "unit" to treat every diagonal value as 1
+    :type diagonal: str
+    :return: Matrix description
+    :rtype: matrix_descr
+    """
+
+    if structure is None or structure == "general":
+        return matrix_descr()
+    elif structure not in MATRIX_STRUCTURES:
+        _err = "structure must be one of {s}; {p} provided".format(s=tuple(MATRIX_STRUCTURES.keys()), p=structure)
+        raise ValueError(_err)
+    elif fill_mode not in FILL_MODES:
+        raise ValueError("fill_mode must be one of {f}; {p} provided".format(f=tuple(FILL_MODES.keys()), p=fill_mode))
+    elif diagonal not in DIAGONAL_TYPES:
+        _err = "diagonal must be one of {d}; {p} provided".format(d=tuple(DIAGONAL_TYPES.keys()), p=diagonal)
+        raise ValueError(_err)
+    elif matrix.shape[0] != matrix.shape[1]:
+        raise ValueError("A {s} matrix must be square; {m} provided".format(s=structure, m=matrix.shape))
+
+    return matrix_descr(sparse_matrix_type_t=MATRIX_STRUCTURES[structure],
+                        sparse_fill_mode_t=FILL_MODES[fill_mode],
+                        sparse_diag_type_t=DIAGONAL_TYPES[diagonal])
+
+
+@_timed_phase("validation")
+def _sanity_check(matrix_a, matrix_b, allow_vector=False, transpose_a=False, transpose_b=False):
     """
     Check matrix dimensions
     :param matrix_a: sp.sparse or numpy array
     :param matrix_b: sp.sparse or numpy array
+    :param transpose_a: Check the dimensions of AT instead of A
+    :param transpose_b: Check the dimensions of BT instead of B
     """
 
     a_2d, b_2d = matrix_a.ndim == 2, matrix_b.ndim == 2
     a_vec, b_vec = _is_dense_vector(matrix_a), _is_dense_vector(matrix_b)
+    a_shape = matrix_a.shape[::-1] if transpose_a else matrix_a.shape
+    b_shape = matrix_b.shape[::-1] if transpose_b else matrix_b.shape
 
     # Check to make sure that both matrices are 2-d
     if not allow_vector and (not a_2d or not b_2d):
-        err_msg = "Matrices must be 2d: {m1} * {m2} is not valid".format(m1=matrix_a.shape, m2=matrix_b.shape)
+        err_msg = "Matrices must be 2d: {m1} * {m2} is not valid".format(m1=a_shape, m2=b_shape)
         raise ValueError(err_msg)
 
     invalid_ndims = not (a_2d or a_vec) or not (b_2d or b_vec)
-    invalid_align = (matrix_a.shape[1] if not matrix_a.ndim == 1 else matrix_a.shape[0]) != matrix_b.shape[0]
+    invalid_align = (a_shape[1] if not matrix_a.ndim == 1 else a_shape[0]) != b_shape[0]
 
     # Check to make sure that this multiplication can work
     if invalid_align or invalid_ndims:
-        err_msg = "Matrix alignment error: {m1} * {m2} is not valid".format(m1=matrix_a.shape, m2=matrix_b.shape)
+        err_msg = "Matrix alignment error: {m1} * {m2} is not valid".format(m1=a_shape, m2=b_shape)
         raise ValueError(err_msg)
 
 
 def _cast_to_float64(matrix):
     """ Make a copy of the array as double precision floats or return the reference if it already is"""
-    return matrix.astype(np.float64) if matrix.dtype != np.float64 else matrix
+
+    if matrix.dtype == np.float64:
+        return matrix
+
+    _audit_copy("cast from {t} to float64".format(t=matrix.dtype), _nbytes(matrix, itemsize=8))
+    return matrix.astype(np.float64)
 
 
+@_timed_phase("casting")
 def _type_check(matrix_a, matrix_b=None, cast=False):
     """
     Make sure that both matrices are single precision floats or both are double precision floats
@@ -1027,6 +2241,7 @@ def _type_check(matrix_a, matrix_b=None, cast=False):
         raise ValueError(err_msg)
 
 
+@_timed_phase("allocation")
 def _out_matrix(shape, dtype, order="C", out_arr=None, out_t=False):
     """
     Create an all-zero matrix or check to make sure that the provided output array matches
@@ -1137,17 +2352,19 @@ def _empty_output_check(matrix_a, matrix_b):
         return False
 
 
-def _validate_dtype():
+def _validate_dtype(mkl=MKL):
     """
     Test to make sure that this library works by creating a random sparse array in CSC format,
     then converting it to CSR format and making sure is has not raised an exception.
 
+    :param mkl: MKL interface to test
+    :type mkl: MKL, MKL64
     """
 
     test_array = _spsparse.random(5, 5, density=0.5, format="csc", dtype=np.float32, random_state=50)
     test_comparison = test_array.A
 
-    csc_ref, precision_flag = _create_mkl_sparse(test_array)
+    csc_ref, precision_flag = _create_mkl_sparse(test_array, mkl=mkl)
 
     try:
         csr_ref = _convert_to_csr(csc_ref)
@@ -1163,7 +2380,7 @@ def _empirical_set_dtype():
     """
     Define dtypes empirically
     Basically just try with int64s and if that doesn't work try with int32s
-    There's a way to do this with intel's mkl helper package but I don't want to add the dependency
+    This is only used if MKL doesn't report its interface layer
     """
     MKL._set_int_type(_ctypes.c_longlong, np.int64)
 
@@ -1179,8 +2396,198 @@ def _empirical_set_dtype():
             raise ImportError("Unable to set MKL numeric type")
 
 
-if MKL.MKL_INT is None:
-    _empirical_set_dtype()
+def _set_dtype():
+    """
+    Set the MKL_INT type from the active interface layer, or from the cache or a trial multiplication
+    if MKL doesn't report its interface layer
+    """
+
+    int_type = _interface_layer_int_type()
+
+    if int_type is None:
+        cache_key = _library_cache_key()
+        int_type = _read_int_type_cache(cache_key)
+
+        if int_type is None:
+            debug_print("MKL did not report an interface layer; testing the MKL_INT type")
+            _empirical_set_dtype()
+            _write_int_type_cache(cache_key, MKL.MKL_INT_NUMPY)
+            return
+
+    MKL._set_int_type(_ctypes.c_longlong if int_type == np.int64 else _ctypes.c_int, int_type)
+
+
+def _interface_layer_int_type():
+    """
+    Get the MKL_INT type from the MKL interface layer.
+    The layer is only reported once MKL has been initialized, so get the version first if it isn't reported.
+
+    :return: np.int32 or np.int64, or None if MKL doesn't report the interface layer
+    :rtype: type, None
+    """
+
+    code = MKL._mkl_set_interface_layer(-1)
+
+    if code < 0:
+        get_version()
+        code = MKL._mkl_set_interface_layer(-1)
+
+    if code < 0:
+        return None
+
+    return np.int64 if code & ~MKL_INTERFACE_GNU == INTERFACE_LAYERS["ILP64"] else np.int32
+
+
+def _library_path():
+    """
+    Get the absolute path of the loaded MKL library.
+    The library is found from a function address with dladdr, because it may have been loaded by name alone.
+
+    :return: Library path, or None if it can't be found
+    :rtype: str, None
+    """
+
+    try:
+        _libdl = _ctypes.CDLL(None)
+        _libdl.dladdr.argtypes = [_ctypes.c_void_p, _ctypes.POINTER(_DlInfo)]
+        _libdl.dladdr.restype = _ctypes.c_int
+
+        info = _DlInfo()
+        if _libdl.dladdr(_ctypes.cast(MKL._mkl_get_max_threads, _ctypes.c_void_p), _ctypes.byref(info)) and \
+                info.dli_fname:
+            return os.path.realpath(os.fsdecode(info.dli_fname))
+    except (OSError, AttributeError, TypeError):
+        pass
+
+    return os.path.realpath(_libmkl._name) if os.path.isabs(_libmkl._name) else None
+
+
+def _library_cache_key():
+    """
+    Get a key for the loaded MKL library which will change if the library file is changed.
+    The interface layer environment variable is included because it changes the MKL_INT type.
+
+    :return: Cache key, or None if the library can't be found
+    :rtype: str, None
+    """
+
+    path = _library_path()
+
+    try:
+        stat = os.stat(path) if path is not None else None
+    except OSError:
+        stat = None
+
+    if stat is None:
+        return None
+
+    return "{p}:{s}:{m}:{i}".format(p=path, s=stat.st_size, m=stat.st_mtime_ns,
+                                    i=os.environ.get("MKL_INTERFACE_LAYER", ""))
+
+
+def _read_int_type_cache(cache_key):
+    """
+    Get the cached MKL_INT type for a library
+
+    :param cache_key: Library cache key
+    :type cache_key: str, None
+    :return: np.int32 or np.int64, or None if it isn't cached
+    :rtype: type, None
+    """
+
+    if cache_key is None:
+        return None
+
+    try:
+        with open(MKL_INT_CACHE_FILE) as cache_fh:
+            cached = json.load(cache_fh).get(cache_key)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+    debug_print("Using cached MKL_INT type {t} from {f}".format(t=cached, f=MKL_INT_CACHE_FILE))
+    return {"int32": np.int32, "int64": np.int64}.get(cached)
+
+
+def _write_int_type_cache(cache_key, int_type):
+    """
+    Cache the MKL_INT type for a library. A cache which can't be written is skipped.
+
+    :param cache_key: Library cache key
+    :type cache_key: str, None
+    :param int_type: MKL_INT type
+    :type int_type: type
+    """
+
+    if cache_key is None:
+        return
+
+    try:
+        with open(MKL_INT_CACHE_FILE) as cache_fh:
+            cached = json.load(cache_fh)
+    except (OSError, ValueError):
+        cached = {}
+
+    cached = cached if isinstance(cached, dict) else {}
+    cached[cache_key] = np.dtype(int_type).name
+
+    try:
+        os.makedirs(os.path.dirname(MKL_INT_CACHE_FILE), exist_ok=True)
+        _tmp_file = "{f}.{p}".format(f=MKL_INT_CACHE_FILE, p=os.getpid())
+
+        with open(_tmp_file, "w") as cache_fh:
+            json.dump(cached, cache_fh)
+
+        os.replace(_tmp_file, MKL_INT_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def _set_ilp64_interface():
+    """
+    Bind the ILP64 (_64) functions alongside the LP64 functions so that large matrices can use 64-bit integers
+    without making every matrix use them. Nothing is bound if the default interface is already ILP64
+    or if this MKL does not have the _64 functions.
+    """
+
+    if MKL.MKL_INT_NUMPY == np.int64 or not MKL64._bind_functions():
+        return
+
+    MKL64._set_int_type(_ctypes.c_longlong, np.int64)
+
+
+def _mkl_init():
+    """
+    Set the MKL_INT type and bind the ILP64 functions the first time MKL is used.
+    Nothing here happens at import, so importing this package stays fast and doesn't initialize MKL.
+    """
+
+    if _INIT_STATE["done"]:
+        return
+
+    with _INIT_LOCK:
+
+        # Testing the MKL_INT type calls back into functions which initialize MKL
+        if _INIT_STATE["done"] or _INIT_STATE["running"]:
+            return
+
+        _INIT_STATE["running"] = True
+
+        try:
+            t = debug_timer()
+
+            if get_version()["MajorVersion"] < 2020:
+                warnings.warn("Loaded version of MKL is out of date: {v}".format(v=get_version_string()))
+
+            _set_dtype()
+            _set_ilp64_interface()
+
+            _INIT_STATE["done"] = True
+            debug_timer("Initialized MKL interface {t}".format(t=MKL.MKL_INT_NUMPY), t)
+        finally:
+            _INIT_STATE["running"] = False
+
+
+_configure_layers()
 
 if _sklearn_env is not None:
     os.environ['KMP_INIT_AT_FORK'] = _sklearn_env
@@ -0,0 +1,248 @@
+from sparse_dot_mkl._mkl_interface import (_create_mkl_sparse, _type_check, _is_allowed_sparse_format,
+                                           _register_persistent_handle, _release_persistent_handle,
+                                           _get_persistent_owner, _optimize_mkl_handle, _handle_address,
+                                           _structure_descr, matrix_descr, debug_print, LAYOUT_CODE_C,
+                                           LAYOUT_CODE_F, SPARSE_MATRIX_TYPE_GENERAL)
+
+import weakref
+import scipy.sparse as _spsparse
+
+
+class MKLSparseMatrix:
+    """
+    A scipy sparse matrix paired with a MKL sparse handle that lives as long as this object does.
+    This can be passed to any sparse_dot_mkl function in place of the scipy matrix it wraps.
+    Checking, casting, and creating the MKL handle happen once when this object is created instead of on every call.
+
+    MKL does not copy the sparse matrix arrays; the wrapped matrix must not have its indices or indptr modified
+    while this object is alive. Values in matrix.data may be changed in place until the handle is optimized with
+    aggressive memory hints (optimize() or the optimize argument of dot_product_mkl). MKL may then use an internal
+    copy of the matrix, and later changes to matrix.data are ignored; create a new MKLSparseMatrix instead.
+
+    :param matrix: Sparse matrix in CSR, CSC, or BSR format
+    :type matrix: scipy.sparse.spmatrix
+    :param cast: Should the data be coerced into float64 if it isn't float32 or float64
+    If set to True and any other dtype is passed, the matrix data will be copied before creating the handle
+    If set to False and any dtype that isn't float32 or float64 is passed, a ValueError will be raised
+    :type cast: bool
+    """
+
+    def __init__(self, matrix, cast=False):
+
+        matrix = _unwrap_mkl_sparse(matrix)
+
+        if not _spsparse.issparse(matrix) or not _is_allowed_sparse_format(matrix):
+            raise ValueError("MKLSparseMatrix requires a CSR, CSC, or BSR sparse matrix")
+
+        if _get_persistent_owner(matrix) is not None:
+            raise ValueError("This matrix is already owned by another MKLSparseMatrix")
+
+        self._matrix = _type_check(matrix, cast=cast)
+        self._handle, self._double_precision = _create_mkl_sparse(self._matrix)
+        self._hints = {}
+
+        _register_persistent_handle(self)
+        self._finalizer = weakref.finalize(self, _release_persistent_handle, id(self._matrix), self._handle)
+
+        debug_print("Created persistent MKL handle for {m}".format(m=repr(self._matrix)))
+
+    @property
+    def matrix(self):
+        """The wrapped scipy sparse matrix"""
+        return self._matrix
+
+    @property
+    def handle(self):
+        """The MKL sparse handle"""
+        return self._handle
+
+    @property
+    def double_precision(self):
+        """True if the data is float64, False if it is float32"""
+        return self._double_precision
+
+    @property
+    def closed(self):
+        """True if the MKL handle has been destroyed"""
+        return not self._finalizer.alive
+
+    @property
+    def shape(self):
+        return self._matrix.shape
+
+    @property
+    def ndim(self):
+        return self._matrix.ndim
+
+    @property
+    def dtype(self):
+        return self._matrix.dtype
+
+    @property
+    def nnz(self):
+        return self._matrix.nnz
+
+    @property
+    def format(self):
+        return self._matrix.format
+
+    @property
+    def hints(self):
+        """The optimization hints which have been applied to the handle and their expected number of calls"""
+        return dict(self._hints)
+
+    def optimize(self, expected_calls, operation="mv", transpose=False, layout="C", dense_columns=1,
+                 aggressive_memory=True, structure=None, fill_mode="upper", diagonal="non_unit"):
+        """
+        Tell MKL how this matrix will be used and let it analyze the matrix and prepare for those calls.
+        This has a one-time cost, but it can make each later call faster.
+        An identical hint which has already been applied is skipped.
+
+        :param expected_calls: Number of times the operation is expected to be called
+        :type expected_calls: int
+        :param operation: "mv" for sparse (dot) vector or "mm" for sparse (dot) dense
+        :type operation: str
+        :param transpose: Optimize for AT (dot) B instead of A (dot) B
+        :type transpose: bool
+        :param layout: Memory order ("C" or "F") of the dense matrix; only used for "mm"
+        :type layout: str
+        :param dense_columns: Number of columns in the dense matrix; only used for "mm"
+        :type dense_columns: int
+        :param aggressive_memory: Allow MKL to allocate memory for an internal copy of the matrix in a faster format.
+        Values changed in place in matrix.data after this are not seen by MKL if it made a copy.
+        :type aggressive_memory: bool
+        :param structure: Optimize for calls which describe the matrix as "general", "symmetric", "triangular",
+        or "diagonal" (the same structure must be passed to those calls)
+        :type structure: str, None
+        :param fill_mode: "upper" or "lower" triangle of a symmetric or triangular matrix
+        :type fill_mode: str
+        :param diagonal: "non_unit" or "unit" diagonal
+        :type diagonal: str
+        :return: self
+        :rtype: MKLSparseMatrix
+        """
+
+        if self.closed:
+            raise ValueError("Cannot optimize a MKLSparseMatrix after it has been closed")
+
+        if operation == "mv":
+            layout_code, dense_columns = None, None
+        elif operation == "mm" and layout in ("C", "F"):
+            layout_code = LAYOUT_CODE_C if layout == "C" else LAYOUT_CODE_F
+        elif operation == "mm":
+            raise ValueError("layout must be 'C' or 'F'; {l} provided".format(l=layout))
+        else:
+            raise ValueError("operation must be 'mv' or 'mm'; {o} provided".format(o=operation))
+
+        if int(expected_calls) < 1:
+            raise ValueError("expected_calls must be a positive integer")
+
+        descr = _structure_descr(self._matrix, structure=structure, fill_mode=fill_mode, diagonal=diagonal)
+
+        return self._apply_hint(int(expected_calls), transpose, layout_code, dense_columns, descr,
+                                aggressive_memory=aggressive_memory)
+
+    def _apply_hint(self, expected_calls, transpose, layout_code, dense_columns, descr, aggressive_memory=True):
+        """
+        Set a hint on the handle and optimize it, unless an identical hint has already been applied
+
+        :param expected_calls: Number of times the operation is expected to be called
+        :type expected_calls: int
+        :param transpose: Optimize for AT (dot) B instead of A (dot) B
+        :type transpose: bool
+        :param layout_code: Dense matrix layout code, or None for sparse (dot) vector
+        :type layout_code: int, None
+        :param dense_columns: Number of columns in the dense matrix, or None for sparse (dot) vector
+        :type dense_columns: int, None
+        :param descr: Matrix description
+        :type descr: matrix_descr
+        :param aggressive_memory: Allow MKL to allocate memory for an internal copy of the matrix in a faster format
+        :type aggressive_memory: bool
+        :return: self
+        :rtype: MKLSparseMatrix
+        """
+
+        operation = "mv" if layout_code is None else "mm"
+        hint_key = (operation, bool(transpose), layout_code, dense_columns)
+
+        # Hints for a symmetric, triangular, or diagonal description are separate from the general hint
+        if descr.sparse_matrix_type_t != SPARSE_MATRIX_TYPE_GENERAL:
+            hint_key += ((descr.sparse_matrix_type_t, descr.sparse_fill_mode_t, descr.sparse_diag_type_t),)
+
+        if self._hints.get(hint_key) == expected_calls:
+            return self
+
+        _optimize_mkl_handle(self._handle, expected_calls, transpose=transpose, layout=layout_code,
+                             dense_columns=dense_columns, descr=descr, aggressive_memory=aggressive_memory)
+
+        self._hints[hint_key] = expected_calls
+        debug_print("Optimized MKL handle for {n} {o} calls ({h})".format(n=expected_calls, o=operation, h=hint_key))
+
+        return self
+
+    def close(self):
+        """
+        Destroy the MKL handle now instead of waiting for garbage collection.
+        The object can still be used afterwards, but a new handle will be created on every call.
+        """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "<MKLSparseMatrix ({c}) wrapping {m}>".format(c="closed" if self.closed else "open",
+                                                             m=repr(self._matrix))
+
+
+def _optimize_for_call(matrix, ref_handle, expected_calls, transpose=False, layout=None, dense_columns=None,
+                       descr=None):
+    """
+    Apply an optimization hint for the current call if the handle belongs to a MKLSparseMatrix.
+    A temporary handle is destroyed at the end of the call, so optimizing it would be wasted work.
+
+    :param matrix: Sparse matrix
+    :type matrix: scipy.sparse.spmatrix
+    :param ref_handle: The MKL handle used for this call
+    :type ref_handle: sparse_matrix_t
+    :param expected_calls: Number of times the operation is expected to be called
+    :type expected_calls: int, None
+    :param transpose: AT (dot) B instead of A (dot) B
+    :type transpose: bool
+    :param layout: Dense matrix layout code, or None for sparse (dot) vector
+    :type layout: int, None
+    :param dense_columns: Number of columns in the dense matrix
+    :type dense_columns: int, None
+    :param descr: Matrix description used for this call
+    :type descr: matrix_descr, None
+    """
+
+    if expected_calls is None:
+        return
+
+    owner = _get_persistent_owner(matrix)
+
+    if owner is None or _handle_address(owner.handle) != _handle_address(ref_handle):
+        debug_print("Skipping optimization because the sparse matrix is not a MKLSparseMatrix")
+    elif int(expected_calls) < 1:
+        raise ValueError("expected_calls must be a positive integer")
+    else:
+        owner._apply_hint(int(expected_calls), transpose, layout, dense_columns if layout is not None else None,
+                          matrix_descr() if descr is None else descr)
+
+
+def _unwrap_mkl_sparse(matrix):
+    """
+    Get the scipy matrix from a MKLSparseMatrix, or return anything else unchanged.
+    The MKL handle is looked up from the scipy matrix when it is needed.
+
+    :param matrix: Matrix or MKLSparseMatrix
+    :type matrix: MKLSparseMatrix, scipy.sparse.spmatrix, np.ndarray
+    :return: Matrix
+    :rtype: scipy.sparse.spmatrix, np.ndarray
+    """
+
+    return matrix.matrix if isinstance(matrix, MKLSparseMatrix) else matrix
@@ -0,0 +1,188 @@
+from sparse_dot_mkl._mkl_interface import _libmkl, MKL, mkl_threads, get_max_threads, debug_print, _mkl_init
+
+import os
+import warnings
+import threading
+import contextlib
+import ctypes as _ctypes
+
+# Use threadpoolctl to expose the MKL threadpool if it's installed
+# It's not a package dependency, so without it the MKL threadpool just can't be controlled through threadpoolctl
+try:
+    import threadpoolctl as _threadpoolctl
+except ImportError:
+    _threadpoolctl = None
+
+# Behavior when the MKL threads for all concurrent calls exceed the available cores
+OVERSUBSCRIPTION_MODES = ("ignore", "warn", "cap")
+
+_OVERSUBSCRIPTION = {"mode": "warn"}
+_ACTIVE_CALLS = {"count": 0}
+_ACTIVE_CALLS_LOCK = threading.Lock()
+
+
+def set_oversubscription_mode(mode):
+    """
+    Set what happens when the MKL threads multiplied by the number of python threads which are concurrently calling
+    sparse_dot_mkl functions is larger than the number of available cores
+
+    :param mode: "ignore" to do nothing,
+    "warn" to raise a RuntimeWarning (the default),
+    "cap" to reduce the MKL threads for each call to an even share of the cores.
+    Calls which set the threads argument explicitly will not be capped.
+    :type mode: str
+    """
+
+    if mode not in OVERSUBSCRIPTION_MODES:
+        raise ValueError("Oversubscription mode must be one of {m}; {p} provided".format(m=OVERSUBSCRIPTION_MODES,
+                                                                                          p=mode))
+
+    _OVERSUBSCRIPTION["mode"] = mode
+
+
+def mkl_threadpool_controller():
+    """
+    Get a threadpoolctl ThreadpoolController for the MKL library used by sparse_dot_mkl,
+    which can be used to limit MKL threads with `.limit(limits=N)` or `.wrap(limits=N)`
+
+    :return: Controller which contains only the MKL library loaded by sparse_dot_mkl
+    :rtype: threadpoolctl.ThreadpoolController
+    """
+
+    if _threadpoolctl is None:
+        raise ImportError("threadpoolctl must be installed to get a MKL threadpool controller")
+
+    controller = _threadpoolctl.ThreadpoolController()
+    filepaths = [lib.filepath for lib in controller.lib_controllers if _is_loaded_mkl(lib)]
+
+    if len(filepaths) == 0:
+        raise RuntimeError("threadpoolctl did not find the MKL library {n}".format(n=_libmkl._name))
+
+    return controller.select(filepath=filepaths)
+
+
+def _is_loaded_mkl(lib_controller):
+    """
+    Check if a threadpoolctl library controller is controlling the same MKL library that sparse_dot_mkl loaded.
+    Compare function addresses, because the library path and the name it was loaded by may not match.
+
+    :param lib_controller: threadpoolctl library controller
+    :type lib_controller: threadpoolctl.LibController
+    :return: True if this is the loaded MKL library
+    :rtype: bool
+    """
+
+    func = getattr(lib_controller.dynlib, "MKL_Get_Max_Threads", None)
+
+    if func is None:
+        return False
+
+    return _ctypes.cast(func, _ctypes.c_void_p).value == _ctypes.cast(MKL._mkl_get_max_threads,
+                                                                     _ctypes.c_void_p).value
+
+
+def _register_threadpoolctl():
+    """
+    Register a threadpoolctl controller for the loaded MKL library if threadpoolctl would not find it by file name.
+    threadpoolctl finds libmkl_rt itself, so this only matters for MKL loaded under another name.
+
+    :return: True if a controller was registered
+    :rtype: bool
+    """
+
+    if _threadpoolctl is None or not hasattr(_threadpoolctl, "register"):
+        return False
+
+    lib_name = os.path.basename(_libmkl._name).lower()
+
+    if any(lib_name.startswith(prefix) for prefix in _threadpoolctl.MKLController.filename_prefixes):
+        return False
+
+    class _SparseDotMKLController(_threadpoolctl.MKLController):
+        filename_prefixes = (lib_name,)
+
+    _threadpoolctl.register(_SparseDotMKLController)
+    debug_print("Registered {n} with threadpoolctl".format(n=lib_name))
+
+    return True
+
+
+def _available_cores():
+    """
+    Get the number of cores this process can run on
+
+    :return: Number of cores
+    :rtype: int
+    """
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _thread_budget(threads, active_calls, cores, mode):
+    """
+    Decide how many MKL threads a call should use and whether that oversubscribes the cores
+
+    :param threads: Number of threads requested for this call, or None if not set
+    :type threads: int, None
+    :param active_calls: Number of calls running concurrently, including this one
+    :type active_calls: int
+    :param cores: Number of available cores
+    :type cores: int
+    :param mode: Oversubscription mode
+    :type mode: str
+    :return: Number of threads to use for this call (or None to leave the threads unchanged),
+    and True if the cores are oversubscribed
+    :rtype: int, bool
+    """
+
+    call_threads = get_max_threads() if threads is None else threads
+
+    if mode == "ignore" or call_threads * active_calls <= cores:
+        return threads, False
+
+    if mode == "cap" and threads is None:
+        return max(1, cores // active_calls), False
+
+    return threads, True
+
+
+@contextlib.contextmanager
+def _mkl_call(threads=None):
+    """
+    Context manager for a public function call which sets the MKL threads for this call
+    and checks that all of the concurrent calls do not oversubscribe the available cores
+
+    :param threads: Number of threads for this call, or None to use the current MKL setting
+    :type threads: int, None
+    """
+
+    _mkl_init()
+
+    with _ACTIVE_CALLS_LOCK:
+        _ACTIVE_CALLS["count"] += 1
+        active_calls = _ACTIVE_CALLS["count"]
+
+    try:
+        cores = _available_cores()
+        call_threads, oversubscribed = _thread_budget(threads, active_calls, cores, _OVERSUBSCRIPTION["mode"])
+
+        if oversubscribed:
+            _msg = "MKL is using {t} threads for each of {c} concurrent calls on {n} cores. " \
+                   "Set threads=N or use sparse_dot_mkl.set_oversubscription_mode('cap')."
+            warnings.warn(_msg.format(t=get_max_threads() if threads is None else threads, c=active_calls, n=cores),
+                          RuntimeWarning)
+        elif call_threads != threads:
+            debug_print("Capped MKL threads to {t} for {c} concurrent calls".format(t=call_threads, c=active_calls))
+
+        with mkl_threads(call_threads):
+            yield
+
+    finally:
+        with _ACTIVE_CALLS_LOCK:
+            _ACTIVE_CALLS["count"] -= 1
+
+
+_register_threadpoolctl()
@@ -1,13 +1,17 @@
-from sparse_dot_mkl._mkl_interface import (MKL, _sanity_check, _empty_output_check, _type_check, _create_mkl_sparse,
-                                           _destroy_mkl_handle, matrix_descr, debug_print, _convert_to_csr,
-                                           _get_numpy_layout, _check_return_value, LAYOUT_CODE_C, LAYOUT_CODE_F,
-                                           _out_matrix)
+from sparse_dot_mkl._mkl_interface import (_choose_interface, _handle_interface, _sanity_check, _empty_output_check,
+                                           _type_check, _create_mkl_sparse, _destroy_mkl_handle, matrix_descr,
+                                           debug_print, _convert_to_csr, _get_numpy_layout, _check_return_value,
+                                           LAYOUT_CODE_C, LAYOUT_CODE_F, _out_matrix)
+from sparse_dot_mkl._mkl_sparse_matrix import _optimize_for_call
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase, _audit_copy, _nbytes
 import numpy as np
 import ctypes as _ctypes
 import scipy.sparse as _spsparse
 
 
-def _sparse_dense_matmul(matrix_a, matrix_b, scalar=1., transpose=False, out=None, out_scalar=None, out_t=None):
+@_timed_phase("compute")
+def _sparse_dense_matmul(matrix_a, matrix_b, scalar=1., transpose=False, out=None, out_scalar=None, out_t=None,
+                         optimize=None, descr=None):
     """
     Multiply together a sparse and a dense matrix
     mkl_sparse_?_mm requires the left (A) matrix to be sparse and the right (B) matrix to be dense
@@ -26,6 +30,10 @@ def _sparse_dense_matmul(matrix_a, matrix_b, scalar=1., transpose=False, out=Non
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param optimize: Optimize a persistent MKL handle for this many calls of this operation if provided.
+    :type optimize: int, None
+    :param descr: Matrix description of the sparse matrix (e.g. symmetric or triangular). Defaults to general.
+    :type descr: matrix_descr, None
     :return: A (dot) B as a dense array in either column-major or row-major format
     :rtype: np.ndarray
     """
@@ -35,16 +43,20 @@ def _sparse_dense_matmul(matrix_a, matrix_b, scalar=1., transpose=False, out=Non
 
     # Prep MKL handles and check that matrixes are compatible types
     # MKL requires CSR format if the dense array is column-major
+    mkl = _choose_interface(matrix_a, matrix_b)
+
     if layout_b == LAYOUT_CODE_F and not _spsparse.isspmatrix_csr(matrix_a):
-        mkl_non_csr, dbl = _create_mkl_sparse(matrix_a)
-        mkl_a = _convert_to_csr(mkl_non_csr)
+        _audit_copy("conversion of a {f} matrix to CSR for a F-ordered dense array".format(f=matrix_a.format),
+                    _nbytes(matrix_a))
+        mkl_non_csr, dbl = _create_mkl_sparse(matrix_a, mkl=mkl)
+        mkl_a = _convert_to_csr(mkl_non_csr, destroy_original=True)
     else:
-        mkl_a, dbl = _create_mkl_sparse(matrix_a)
+        mkl_a, dbl = _create_mkl_sparse(matrix_a, mkl=mkl)
 
     # Set functions and types for float or doubles
     output_ctype = _ctypes.c_double if dbl else _ctypes.c_float
     output_dtype = np.float64 if dbl else np.float32
-    func = MKL._mkl_sparse_d_mm if dbl else MKL._mkl_sparse_s_mm
+    func = _handle_interface(mkl_a)._mkl_sparse_d_mm if dbl else _handle_interface(mkl_a)._mkl_sparse_s_mm
 
     # Allocate an output array
     output_arr = _out_matrix(output_shape, output_dtype, order="C" if layout_b == LAYOUT_CODE_C else "F",
@@ -52,10 +64,15 @@ def _sparse_dense_matmul(matrix_a, matrix_b, scalar=1., transpose=False, out=Non
 
     _, output_ld = _get_numpy_layout(output_arr)
 
+    descr = matrix_descr() if descr is None else descr
+
+    _optimize_for_call(matrix_a, mkl_a, optimize, transpose=transpose, layout=layout_b, dense_columns=output_shape[1],
+                       descr=descr)
+
     ret_val = func(11 if transpose else 10,
                    scalar,
                    mkl_a,
-                   matrix_descr(),
+                   descr,
                    layout_b,
                    matrix_b,
                    output_shape[1],
@@ -72,7 +89,8 @@ def _sparse_dense_matmul(matrix_a, matrix_b, scalar=1., transpose=False, out=Non
     return output_arr
 
 
-def _sparse_dot_dense(matrix_a, matrix_b, cast=False, scalar=1., out=None, out_scalar=None):
+def _sparse_dot_dense(matrix_a, matrix_b, cast=False, scalar=1., out=None, out_scalar=None, optimize=None,
+                      transpose_a=False, transpose_b=False, descr=None):
     """
     Multiply together a dense and a sparse matrix.
     If the sparse matrix is not CSR, it may need to be reordered, depending on the order of the dense array.
@@ -90,27 +108,47 @@ def _sparse_dot_dense(matrix_a, matrix_b, cast=False, scalar=1., out=None, out_s
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param optimize: Optimize a persistent MKL handle for this many calls of this operation if provided.
+    :type optimize: int, None
+    :param transpose_a: Multiply AT instead of A. A dense A is transposed as a view.
+    :type transpose_a: bool
+    :param transpose_b: Multiply BT instead of B. A dense B is transposed as a view.
+    :type transpose_b: bool
+    :param descr: Matrix description of the sparse matrix (e.g. symmetric or triangular). Defaults to general.
+    :type descr: matrix_descr, None
 
     :return: A (dot) B as a dense matrix
     :rtype: np.ndarray
     """
-    _sanity_check(matrix_a, matrix_b)
+
+    # Transposing a dense array only changes its order, so only the sparse matrix is transposed by MKL
+    if transpose_a and not _spsparse.isspmatrix(matrix_a):
+        matrix_a, transpose_a = matrix_a.T, False
+
+    if transpose_b and not _spsparse.isspmatrix(matrix_b):
+        matrix_b, transpose_b = matrix_b.T, False
+
+    _sanity_check(matrix_a, matrix_b, transpose_a=transpose_a, transpose_b=transpose_b)
 
     # Check for edge condition inputs which result in empty outputs
     if _empty_output_check(matrix_a, matrix_b):
         debug_print("Skipping multiplication because A (dot) B must yield an empty matrix")
         final_dtype = np.float64 if matrix_a.dtype != matrix_b.dtype or matrix_a.dtype != np.float32 else np.float32
-        return _out_matrix((matrix_a.shape[0], matrix_b.shape[1]), final_dtype, out_arr=out)
+        output_shape = (matrix_a.shape[1] if transpose_a else matrix_a.shape[0],
+                        matrix_b.shape[0] if transpose_b else matrix_b.shape[1])
+        return _out_matrix(output_shape, final_dtype, out_arr=out)
 
     matrix_a, matrix_b = _type_check(matrix_a, matrix_b, cast=cast)
 
     if sum([_spsparse.isspmatrix(matrix_a), _spsparse.isspmatrix(matrix_b)]) != 1:
         raise ValueError("_sparse_dot_dense takes one sparse and one dense array")
     elif _spsparse.isspmatrix(matrix_a):
-        return _sparse_dense_matmul(matrix_a, matrix_b, scalar=scalar, out=out, out_scalar=out_scalar)
+        return _sparse_dense_matmul(matrix_a, matrix_b, scalar=scalar, transpose=transpose_a, out=out,
+                                    out_scalar=out_scalar, optimize=optimize, descr=descr)
     elif _spsparse.isspmatrix(matrix_b) and out is not None:
-        _ = _sparse_dense_matmul(matrix_b, matrix_a.T, scalar=scalar, transpose=True,
-                                 out=out.T, out_scalar=out_scalar, out_t=True)
+        _ = _sparse_dense_matmul(matrix_b, matrix_a.T, scalar=scalar, transpose=not transpose_b,
+                                 out=out.T, out_scalar=out_scalar, out_t=True, optimize=optimize, descr=descr)
         return out
     elif _spsparse.isspmatrix(matrix_b) and out is None:
-        return _sparse_dense_matmul(matrix_b, matrix_a.T, scalar=scalar, transpose=True).T
+        return _sparse_dense_matmul(matrix_b, matrix_a.T, scalar=scalar, transpose=not transpose_b,
+                                    optimize=optimize, descr=descr).T
@@ -1,71 +1,235 @@
-from sparse_dot_mkl._mkl_interface import (MKL, _sanity_check, _get_numpy_layout, _type_check, _create_mkl_sparse,
+from sparse_dot_mkl._mkl_interface import (MKL, _sanity_check, _type_check, _create_mkl_sparse,
                                            _destroy_mkl_handle, matrix_descr, RETURN_CODES, _convert_to_csr,
-                                           _check_return_value, LAYOUT_CODE_C)
+                                           _check_return_value, LAYOUT_CODE_C, debug_print)
+from sparse_dot_mkl._mkl_sparse_matrix import _unwrap_mkl_sparse
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase, _instrumented_call, _audit_copy, _nbytes
 
+import weakref
 import numpy as np
 import ctypes as _ctypes
 import scipy.sparse as _spsparse
 
 
-def _sparse_qr(matrix_a, matrix_b):
+class SparseQR:
     """
-    Solve AX = B for X
-
-    :param matrix_a: Sparse matrix A
-    :type matrix_a: scipy.sparse.csr_matrix
-    :param matrix_b: Dense matrix B
-    :type matrix_b: numpy.ndarray
-    :return: Dense matrix X
-    :rtype: numpy.ndarray
+    A sparse QR factorization of A which can be used to solve AX = B for any number of dense B matrices.
+    The matrix is reordered and factorized once when this object is created; each solve only does the
+    triangular solves.
+
+    :param matrix_a: Sparse matrix A (solver requires CSR; will convert a CSC matrix if cast=True)
+    :type matrix_a: scipy.sparse.csr_matrix, MKLSparseMatrix
+    :param cast: Should the data be coerced into float64 if it isn't float32 or float64,
+    and should a CSC matrix be converted to a CSR matrix.
+    :type cast: bool
     """
 
-    mkl_a, dbl = _create_mkl_sparse(matrix_a)
-    layout_b, ld_b = _get_numpy_layout(matrix_b)
+    def __init__(self, matrix_a, cast=False):
+
+        matrix_a = _unwrap_mkl_sparse(matrix_a)
+
+        if _spsparse.isspmatrix_csc(matrix_a) and not cast:
+            raise ValueError("SparseQR only accepts CSR matrices if cast=False")
+        elif not _spsparse.isspmatrix_csr(matrix_a) and not _spsparse.isspmatrix_csc(matrix_a):
+            raise ValueError("SparseQR requires matrix A to be CSR or CSC sparse matrix")
+        elif _spsparse.isspmatrix_csc(matrix_a):
+            _audit_copy("conversion of a csc matrix to CSR for QR factorization", _nbytes(matrix_a))
+            matrix_a = matrix_a.tocsr()
+
+        self._matrix = _type_check(matrix_a, cast=cast)
+        # There are no ILP64 (_64) QR functions, so always use the default interface
+        # The QR factorization is stored in the handle, so a MKLSparseMatrix handle is never shared
+        self._handle, self._double_precision = _create_mkl_sparse(self._matrix, mkl=MKL, reuse_persistent=False)
+        self._finalizer = weakref.finalize(self, _destroy_mkl_handle, self._handle)
+        self._values = None
+
+        # QR Reorder ##
+        ret_val_r = MKL._mkl_sparse_qr_reorder(self._handle, matrix_descr())
+
+        # Check return
+        _check_return_value(ret_val_r, "mkl_sparse_qr_reorder")
+
+        self._factorize()
+
+    @property
+    def matrix(self):
+        """The factorized sparse matrix A (in CSR format)"""
+        return self._matrix
+
+    @property
+    def shape(self):
+        return self._matrix.shape
+
+    @property
+    def dtype(self):
+        return self._matrix.dtype
+
+    @property
+    def closed(self):
+        """True if the MKL handle has been destroyed"""
+        return not self._finalizer.alive
+
+    @_timed_phase("compute")
+    def _factorize(self, values=None):
+
+        # QR Factorize ##
+        factorize_func = MKL._mkl_sparse_d_qr_factorize if self._double_precision else MKL._mkl_sparse_s_qr_factorize
+        value_ctype = _ctypes.c_double if self._double_precision else _ctypes.c_float
+
+        ret_val_f = factorize_func(self._handle,
+                                   values.ctypes.data_as(_ctypes.POINTER(value_ctype)) if values is not None else None)
+
+        # Check return
+        _check_return_value(ret_val_f, factorize_func.__name__)
+
+        # Keep a reference to the values array that the factorization came from
+        self._values = values
 
-    output_shape = matrix_a.shape[1], matrix_b.shape[1]
+    def refactorize(self, new_values):
+        """
+        Factorize a new matrix A which has the same sparsity structure as the original A.
+        The fill-reducing reordering is reused and only the numeric factorization is redone.
 
-    if _spsparse.isspmatrix_csc(matrix_a):
-        mkl_a = _convert_to_csr(mkl_a)
+        :param new_values: Non-zero values in the same order as SparseQR.matrix.data,
+        or a sparse matrix with the same sparsity structure as A
+        :type new_values: np.ndarray, scipy.sparse.spmatrix
+        :return: self
+        :rtype: SparseQR
+        """
+
+        if self.closed:
+            raise ValueError("Cannot refactorize a SparseQR after it has been closed")
+
+        if _spsparse.issparse(new_values):
+            new_values = new_values.tocsr()
+
+            if (new_values.shape != self._matrix.shape or
+                    not np.array_equal(new_values.indptr, self._matrix.indptr) or
+                    not np.array_equal(new_values.indices, self._matrix.indices)):
+                raise ValueError("New matrix must have the same sparsity structure as the factorized matrix")
+
+            new_values = new_values.data
 
-    # QR Reorder ##
-    ret_val_r = MKL._mkl_sparse_qr_reorder(mkl_a, matrix_descr())
+        new_values = np.asarray(new_values).ravel()
+
+        if new_values.shape[0] != self._matrix.nnz:
+            err_msg = "{n} new values provided for a matrix with {m} non-zero values".format(n=new_values.shape[0],
+                                                                                             m=self._matrix.nnz)
+            raise ValueError(err_msg)
 
-    # Check return
-    _check_return_value(ret_val_r, "mkl_sparse_qr_reorder")
+        # Copy the values so that they can't be changed after factorization
+        _audit_copy("copy of SparseQR refactorization values", new_values.size * self._matrix.dtype.itemsize)
+        self._factorize(np.array(new_values, dtype=self._matrix.dtype, order="C"))
 
-    # QR Factorize ##
-    factorize_func = MKL._mkl_sparse_d_qr_factorize if dbl else MKL._mkl_sparse_s_qr_factorize
+        debug_print("Refactorized QR for {m}".format(m=repr(self._matrix)))
 
-    ret_val_f = factorize_func(mkl_a, None)
+        return self
 
-    # Check return
-    _check_return_value(ret_val_f, factorize_func.__name__)
+    def solve(self, matrix_b, cast=False):
+        """
+        Solve AX = B for X
+
+        :param matrix_b: Dense matrix or vector B
+        :type matrix_b: numpy.ndarray
+        :param cast: Should B be coerced into the same data type as A if it doesn't match
+        :type cast: bool
+        :return: Dense matrix X
+        :rtype: numpy.ndarray
+        """
 
-    # QR Solve ##
-    output_dtype = np.float64 if dbl else np.float32
-    output_ctype = _ctypes.c_double if dbl else _ctypes.c_float
+        if self.closed:
+            raise ValueError("Cannot solve with a SparseQR after it has been closed")
 
-    output_arr = np.zeros(output_shape, dtype=output_dtype, order="C" if layout_b == LAYOUT_CODE_C else "F")
-    layout_out, ld_out = _get_numpy_layout(output_arr)
+        if self._matrix.shape[0] != matrix_b.shape[0]:
+            err_msg = "Bad matrix shapes for AX=B solver: A {sha} & B {shb}".format(sha=self._matrix.shape,
+                                                                                    shb=matrix_b.shape)
+            raise ValueError(err_msg)
 
-    solve_func = MKL._mkl_sparse_d_qr_solve if dbl else MKL._mkl_sparse_s_qr_solve
+        if matrix_b.dtype != self._matrix.dtype and cast:
+            _audit_copy("cast from {f} to {t}".format(f=matrix_b.dtype, t=self._matrix.dtype),
+                        matrix_b.size * self._matrix.dtype.itemsize)
+            matrix_b = matrix_b.astype(self._matrix.dtype)
+        elif matrix_b.dtype != self._matrix.dtype:
+            err_msg = "Matrix data types must be in concordance; {a} and {b} provided".format(a=self._matrix.dtype,
+                                                                                              b=matrix_b.dtype)
+            raise ValueError(err_msg)
 
-    ret_val_s = solve_func(10,
-                           mkl_a,
-                           None,
-                           layout_b,
-                           output_shape[1],
-                           output_arr.ctypes.data_as(_ctypes.POINTER(output_ctype)),
-                           ld_out,
-                           matrix_b,
-                           ld_b)
+        with _instrumented_call("SparseQR.solve", self._matrix, matrix_b) as call:
+            x_arr = self._solve(matrix_b if matrix_b.ndim == 2 else matrix_b.reshape(-1, 1))
+            return call.set_output(x_arr if matrix_b.ndim == 2 else x_arr.ravel())
 
-    # Check return
-    _check_return_value(ret_val_s, solve_func.__name__)
+    @_timed_phase("compute")
+    def _solve(self, matrix_b):
 
-    _destroy_mkl_handle(mkl_a)
+        # MKL only supports one right-hand side per solve; the factorization is reused for each column
+        # Each column is solved directly into a column of a column-major output array
+        output_arr = np.zeros((self._matrix.shape[1], matrix_b.shape[1]), dtype=self._matrix.dtype, order="F")
+
+        # The columns of B are only copied if they aren't already contiguous (e.g. a C-ordered B)
+        if not matrix_b.flags.f_contiguous:
+            _audit_copy("copy of B columns for QR solve", matrix_b.nbytes)
+
+        for i in range(matrix_b.shape[1]):
+            self._solve_column(np.ascontiguousarray(matrix_b[:, i:i + 1]), output_arr[:, i:i + 1])
+
+        return output_arr
+
+    def _solve_column(self, column_b, column_x):
+        """
+        Solve Ax = b for a single column into a column of the output array
+
+        :param column_b: Contiguous column of B (n x 1)
+        :type column_b: numpy.ndarray
+        :param column_x: Contiguous column of the output array to write x into (m x 1)
+        :type column_x: numpy.ndarray
+        """
+
+        output_ctype = _ctypes.c_double if self._double_precision else _ctypes.c_float
+        solve_func = MKL._mkl_sparse_d_qr_solve if self._double_precision else MKL._mkl_sparse_s_qr_solve
+
+        # QR Solve ##
+        ret_val_s = solve_func(10,
+                               self._handle,
+                               None,
+                               LAYOUT_CODE_C,
+                               1,
+                               column_x.ctypes.data_as(_ctypes.POINTER(output_ctype)),
+                               1,
+                               column_b,
+                               1)
+
+        # Check return
+        _check_return_value(ret_val_s, solve_func.__name__)
+
+    def close(self):
+        """
+        Destroy the MKL handle and the factorization now instead of waiting for garbage collection
+        """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "<SparseQR ({c}) of {m}>".format(c="closed" if self.closed else "open", m=repr(self._matrix))
+
+
+def _sparse_qr(matrix_a, matrix_b):
+    """
+    Solve AX = B for X
+
+    :param matrix_a: Sparse matrix A
+    :type matrix_a: scipy.sparse.csr_matrix
+    :param matrix_b: Dense matrix B
+    :type matrix_b: numpy.ndarray
+    :return: Dense matrix X
+    :rtype: numpy.ndarray
+    """
 
-    return output_arr
+    with SparseQR(matrix_a, cast=True) as qr_a:
+        return qr_a._solve(matrix_b)
 
 
 def sparse_qr_solver(matrix_a, matrix_b, cast=False):
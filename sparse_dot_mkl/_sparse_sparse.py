@@ -1,13 +1,23 @@
-from sparse_dot_mkl._mkl_interface import (MKL, sparse_matrix_t, _create_mkl_sparse, debug_print, debug_timer,
+from sparse_dot_mkl._mkl_interface import (MKL, _new_handle, _handle_interface, _choose_interface, _create_mkl_sparse,
+                                           debug_print, debug_timer, _track_handle, _mkl_init,
                                            _export_mkl, _order_mkl_handle, _destroy_mkl_handle, _type_check,
                                            _empty_output_check, _sanity_check, _is_allowed_sparse_format,
-                                           _check_return_value)
+                                           _check_return_value, matrix_descr, _MKLHandleOwner, _export_mkl_indptr,
+                                           _out_matrix, _get_numpy_layout, SPARSE_MATRIX_TYPE_GENERAL,
+                                           SPARSE_FILL_MODE_FULL, SPARSE_DIAG_NON_UNIT, NUMPY_FLOAT_DTYPES,
+                                           SPARSE_OPERATION_NON_TRANSPOSE, SPARSE_OPERATION_TRANSPOSE,
+                                           SPARSE_STAGE_NNZ_COUNT, SPARSE_STAGE_FINALIZE_MULT_NO_VAL,
+                                           SPARSE_STAGE_FINALIZE_MULT, SPARSE_STAGE_FULL_MULT)
+from sparse_dot_mkl._mkl_sparse_matrix import _unwrap_mkl_sparse
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase, _instrumented_call, _audit_copy, _nbytes
+import weakref
 import ctypes as _ctypes
 import numpy as np
 import scipy.sparse as _spsparse
 from scipy.sparse import isspmatrix_csr as is_csr, isspmatrix_csc as is_csc, isspmatrix_bsr as is_bsr
 
 
+@_timed_phase("compute")
 def _matmul_mkl(sp_ref_a, sp_ref_b):
     """
     Dot product two MKL objects together and return a handle to the result
@@ -20,19 +30,60 @@ def _matmul_mkl(sp_ref_a, sp_ref_b):
     :rtype: sparse_matrix_t
     """
 
-    ref_handle = sparse_matrix_t()
+    mkl = _handle_interface(sp_ref_a)
+    ref_handle = _new_handle(mkl)
 
-    ret_val = MKL._mkl_sparse_spmm(_ctypes.c_int(10),
+    ret_val = mkl._mkl_sparse_spmm(_ctypes.c_int(10),
                                    sp_ref_a,
                                    sp_ref_b,
                                    _ctypes.byref(ref_handle))
 
     # Check return
     _check_return_value(ret_val, "mkl_sparse_spmm")
-    return ref_handle
+    return _track_handle(ref_handle)
 
 
-def _matmul_mkl_dense(sp_ref_a, sp_ref_b, output_shape, double_precision):
+@_timed_phase("compute")
+def _matmul_mkl_staged(sp_ref_a, sp_ref_b, stage, ref_handle=None, transpose_a=False, transpose_b=False):
+    """
+    Run one stage of a two-stage dot product of two MKL objects and return a handle to the result
+
+    :param sp_ref_a: Sparse matrix A handle
+    :type sp_ref_a: sparse_matrix_t
+    :param sp_ref_b: Sparse matrix B handle
+    :type sp_ref_b: sparse_matrix_t
+    :param stage: The sp2m request stage code
+    :type stage: int
+    :param ref_handle: The output handle from an earlier stage, or None to create a new output handle
+    :type ref_handle: sparse_matrix_t, None
+    :param transpose_a: Use AT instead of A
+    :type transpose_a: bool
+    :param transpose_b: Use BT instead of B
+    :type transpose_b: bool
+    :return: Sparse matrix handle for the dot product A * B
+    :rtype: sparse_matrix_t
+    """
+
+    mkl = _handle_interface(sp_ref_a)
+    ref_handle = _new_handle(mkl) if ref_handle is None else ref_handle
+
+    ret_val = mkl._mkl_sparse_sp2m(_operation_code(transpose_a),
+                                   _general_descr(),
+                                   sp_ref_a,
+                                   _operation_code(transpose_b),
+                                   _general_descr(),
+                                   sp_ref_b,
+                                   stage,
+                                   _ctypes.byref(ref_handle))
+
+    # Check return
+    _check_return_value(ret_val, "mkl_sparse_sp2m")
+    return _track_handle(ref_handle)
+
+
+@_timed_phase("compute")
+def _matmul_mkl_dense(sp_ref_a, sp_ref_b, output_shape, double_precision, scalar=1., out=None, out_scalar=None,
+                      transpose_a=False, transpose_b=False):
     """
     Dot product two MKL objects together into a dense numpy array and return the result
 
@@ -45,22 +96,42 @@ def _matmul_mkl_dense(sp_ref_a, sp_ref_b, output_shape, double_precision):
     :type output_shape: tuple(int, int)
     :param double_precision: The resulting array will be float64
     :type double_precision: bool
+    :param scalar: Multiply the product by this scalar
+    :type scalar: float
+    :param out: Add the dot product to this array if provided. It may be C or F ordered.
+    :type out: np.ndarray, None
+    :param out_scalar: Multiply the out array by this scalar if provided.
+    :type out_scalar: float, None
+    :param transpose_a: Use AT instead of A
+    :type transpose_a: bool
+    :param transpose_b: Use BT instead of B
+    :type transpose_b: bool
 
     :return: Dense numpy array that's the output of A dot B
     :rtype: np.array
     """
 
-    # Allocate an array for outputs and set functions and types for float or doubles
-    output_arr = np.zeros(output_shape, dtype=np.float64 if double_precision else np.float32)
+    # Allocate an array for outputs (or check the provided array) and set functions and types for float or doubles
+    output_order = "F" if out is not None and out.flags.f_contiguous and not out.flags.c_contiguous else "C"
+    output_arr = _out_matrix(output_shape, np.float64 if double_precision else np.float32, order=output_order,
+                             out_arr=out)
+    output_layout, output_ld = _get_numpy_layout(output_arr)
+
     output_ctype = _ctypes.c_double if double_precision else _ctypes.c_float
-    func = MKL._mkl_sparse_d_spmmd if double_precision else MKL._mkl_sparse_s_spmmd
+    mkl = _handle_interface(sp_ref_a)
+    func = mkl._mkl_sparse_d_sp2md if double_precision else mkl._mkl_sparse_s_sp2md
 
-    ret_val = func(10,
+    ret_val = func(_operation_code(transpose_a),
+                   _general_descr(),
                    sp_ref_a,
+                   _operation_code(transpose_b),
+                   _general_descr(),
                    sp_ref_b,
-                   101,
+                   scalar,
+                   float(out_scalar) if out_scalar is not None else 1.,
                    output_arr.ctypes.data_as(_ctypes.POINTER(output_ctype)),
-                   output_shape[1])
+                   output_layout,
+                   output_ld)
 
     # Check return
     _check_return_value(ret_val, func.__name__)
@@ -68,7 +139,34 @@ def _matmul_mkl_dense(sp_ref_a, sp_ref_b, output_shape, double_precision):
     return output_arr
 
 
-def _sparse_dot_sparse(matrix_a, matrix_b, cast=False, reorder_output=False, dense=False):
+def _general_descr():
+    """
+    Get a matrix descriptor for a general matrix.
+    sp2md rejects descriptors which do not have a valid fill mode and diagonal type, even for general matrices.
+
+    :return: Matrix descriptor
+    :rtype: matrix_descr
+    """
+
+    return matrix_descr(sparse_matrix_type_t=SPARSE_MATRIX_TYPE_GENERAL, sparse_fill_mode_t=SPARSE_FILL_MODE_FULL,
+                        sparse_diag_type_t=SPARSE_DIAG_NON_UNIT)
+
+
+def _operation_code(transpose):
+    """
+    Get the MKL sparse operation code
+
+    :param transpose: Transpose the matrix
+    :type transpose: bool
+    :return: Operation code
+    :rtype: int
+    """
+
+    return SPARSE_OPERATION_TRANSPOSE if transpose else SPARSE_OPERATION_NON_TRANSPOSE
+
+
+def _sparse_dot_sparse(matrix_a, matrix_b, cast=False, reorder_output=False, dense=False, zero_copy=False,
+                       scalar=1., out=None, out_scalar=None, transpose_a=False, transpose_b=False):
     """
     Multiply together two scipy sparse matrixes using the intel Math Kernel Library.
     This currently only supports float32 and float64 data
@@ -88,9 +186,23 @@ def _sparse_dot_sparse(matrix_a, matrix_b, cast=False, reorder_output=False, den
     :type reorder_output: bool
     :param dense: Should the matrix multiplication yield a dense numpy array
     This does not require any copy and is memory efficient if the output array density is > 50%
-    :type dense: bool
-    :return: Sparse matrix that is the result of A * B in CSR format
-    :rtype: scipy.sparse.csr_matrix
+    If set to "auto", the output non-zeros will be counted first, and a dense array will be produced if the
+    output density is above the threshold set with `set_dense_threshold`
+    :type dense: bool, str
+    :param zero_copy: Return a sparse matrix which uses the memory allocated by MKL instead of a copy
+    :type zero_copy: bool
+    :param scalar: Multiply the product by this scalar
+    :type scalar: float
+    :param out: Add the dot product to this dense array if provided. This sets the output to dense.
+    :type out: np.ndarray, None
+    :param out_scalar: Multiply the out array by this scalar if provided.
+    :type out_scalar: float, None
+    :param transpose_a: Multiply AT instead of A without creating AT
+    :type transpose_a: bool
+    :param transpose_b: Multiply BT instead of B without creating BT
+    :type transpose_b: bool
+    :return: Matrix that is the result of A * B in the same sparse format as A, or as a dense array
+    :rtype: scipy.sparse.spmatrix, np.ndarray
     """
 
     # Check for allowed sparse matrix types
@@ -106,47 +218,83 @@ def _sparse_dot_sparse(matrix_a, matrix_b, cast=False, reorder_output=False, den
     else:
         raise ValueError("Input matrices to dot_product_mkl must be CSR, CSC, or BSR; COO is not supported")
 
+    if isinstance(dense, str) and dense != "auto":
+        raise ValueError("dense must be True, False, or 'auto'; {d} provided".format(d=dense))
+
+    # An output array is always dense
+    dense = True if out is not None else dense
+
     # Override output if dense flag is set
-    default_output = default_output if not dense else np.zeros
+    default_output = default_output if not dense or dense == "auto" else np.zeros
 
     # Check to make sure that this multiplication can work and check dtypes
-    _sanity_check(matrix_a, matrix_b)
+    _sanity_check(matrix_a, matrix_b, transpose_a=transpose_a, transpose_b=transpose_b)
+
+    output_shape = (matrix_a.shape[1] if transpose_a else matrix_a.shape[0],
+                    matrix_b.shape[0] if transpose_b else matrix_b.shape[1])
 
     # Check for edge condition inputs which result in empty outputs
     if _empty_output_check(matrix_a, matrix_b):
         debug_print("Skipping multiplication because A (dot) B must yield an empty matrix")
         final_dtype = np.float64 if matrix_a.dtype != matrix_b.dtype or matrix_a.dtype != np.float32 else np.float32
-        return default_output((matrix_a.shape[0], matrix_b.shape[1]), dtype=final_dtype)
+
+        if out is not None:
+            out_arr = _out_matrix(output_shape, final_dtype, out_arr=out,
+                                  order="F" if out.flags.f_contiguous and not out.flags.c_contiguous else "C")
+            out_arr *= out_scalar if out_scalar is not None else 1.
+            return out_arr
+
+        return default_output(output_shape, dtype=final_dtype)
 
     # Check dtypes
     matrix_a, matrix_b = _type_check(matrix_a, matrix_b, cast=cast)
 
+    # Check the output array before any MKL handles are created
+    if out is not None:
+        _out_matrix(output_shape, np.float64 if matrix_a.dtype == np.float64 else np.float32, out_arr=out,
+                    order="F" if out.flags.f_contiguous and not out.flags.c_contiguous else "C")
+
     t = debug_timer()
 
-    # Create intel MKL objects
-    mkl_a, a_dbl = _create_mkl_sparse(matrix_a)
-    mkl_b, b_dbl = _create_mkl_sparse(matrix_b)
+    # The input handles are destroyed however the product ends
+    # The output handle is only destroyed here if the product fails before it is exported
+    mkl_a, mkl_b, mkl_c = None, None, None
 
-    t = debug_timer("Created MKL sparse handles", t)
+    try:
+        # Create intel MKL objects
+        mkl = _product_interface(matrix_a, matrix_b, transpose_a=transpose_a, transpose_b=transpose_b)
+        mkl_a, a_dbl = _create_mkl_sparse(matrix_a, mkl=mkl)
+        mkl_b, b_dbl = _create_mkl_sparse(matrix_b, mkl=mkl)
 
-    # Call spmmd for dense output directly if the dense flag is set
-    if dense:
-        dense_arr = _matmul_mkl_dense(mkl_a, mkl_b, (matrix_a.shape[0], matrix_b.shape[1]), a_dbl or b_dbl)
+        t = debug_timer("Created MKL sparse handles", t)
 
-        debug_timer("Multiplied matrices", t)
+        # Count the output non-zeros to decide if the output should be dense
+        if dense == "auto":
+            mkl_c, dense = _choose_dense_output(mkl_a, mkl_b, matrix_a, matrix_b, a_dbl or b_dbl,
+                                                transpose_a=transpose_a, transpose_b=transpose_b)
 
-        _destroy_mkl_handle(mkl_a)
-        _destroy_mkl_handle(mkl_b)
+            t = debug_timer("Counted output non-zeros", t)
 
-        return dense_arr
+        # Call spmmd for dense output directly if the dense flag is set
+        if dense:
+            dense_arr = _matmul_mkl_dense(mkl_a, mkl_b, output_shape, a_dbl or b_dbl, scalar=scalar, out=out,
+                                          out_scalar=out_scalar, transpose_a=transpose_a, transpose_b=transpose_b)
 
-    # Call spmm for sparse output if the dense flag is not set and then export the sparse matrix to python
-    else:
-        # Dot product
-        mkl_c = _matmul_mkl(mkl_a, mkl_b)
+            debug_timer("Multiplied matrices", t)
+
+            return dense_arr
 
-        _destroy_mkl_handle(mkl_a)
-        _destroy_mkl_handle(mkl_b)
+        # Call spmm for sparse output if the dense flag is not set
+        # Finish the two-stage product if the non-zeros have already been counted
+        # Use the two-stage product in one step if either matrix is transposed, because spmm has no transpose for B
+        if mkl_c is not None:
+            mkl_c = _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_FINALIZE_MULT, ref_handle=mkl_c,
+                                       transpose_a=transpose_a, transpose_b=transpose_b)
+        elif transpose_a or transpose_b:
+            mkl_c = _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_FULL_MULT, transpose_a=transpose_a,
+                                       transpose_b=transpose_b)
+        else:
+            mkl_c = _matmul_mkl(mkl_a, mkl_b)
 
         t = debug_timer("Multiplied matrices", t)
 
@@ -156,10 +304,447 @@ def _sparse_dot_sparse(matrix_a, matrix_b, cast=False, reorder_output=False, den
 
             t = debug_timer("Reordered output indices", t)
 
-        # Extract
-        python_c = _export_mkl(mkl_c, a_dbl or b_dbl, output_type=output_type)
+    except BaseException:
+        if mkl_c is not None:
+            _destroy_mkl_handle(mkl_c)
+
+        raise
+
+    finally:
+        for mkl_handle in (mkl_a, mkl_b):
+            if mkl_handle is not None:
+                _destroy_mkl_handle(mkl_handle)
+
+    # Extract the sparse matrix to python
+    # The handle is owned by the exported matrix if zero_copy is set
+    # Destroy the handle even if the export raises (e.g. because an export copy isn't allowed)
+    try:
+        python_c = _export_mkl(mkl_c, a_dbl or b_dbl, output_type=output_type, copy=not zero_copy)
+    finally:
+        if not zero_copy:
+            _destroy_mkl_handle(mkl_c)
+
+    if scalar != 1.:
+        python_c.data *= scalar
+
+    debug_timer("Created python handle", t)
+
+    return python_c
+
+
+@_timed_phase("validation")
+def _product_interface(matrix_a, matrix_b, transpose_a=False, transpose_b=False):
+    """
+    Choose the MKL interface for a sparse (dot) sparse product. The output of a product can need 64-bit indices
+    when neither input does, so the number of output non-zeros is bounded by the number of non-zero pairs which
+    share an inner index. This bound is only calculated if the dense output would be too large for 32-bit indices.
+
+    :param matrix_a: Sparse matrix A
+    :type matrix_a: scipy.sparse.spmatrix
+    :param matrix_b: Sparse matrix B
+    :type matrix_b: scipy.sparse.spmatrix
+    :param transpose_a: Use AT instead of A
+    :type transpose_a: bool
+    :param transpose_b: Use BT instead of B
+    :type transpose_b: bool
+    :return: MKL interface class
+    :rtype: MKL, MKL64
+    """
+
+    # Each non-zero is a block for BSR
+    _block_a = matrix_a.blocksize if is_bsr(matrix_a) else (1, 1)
+    _block_b = matrix_b.blocksize if is_bsr(matrix_b) else (1, 1)
+
+    output_size = (matrix_a.shape[1] // _block_a[1] if transpose_a else matrix_a.shape[0] // _block_a[0]) * \
+        (matrix_b.shape[0] // _block_b[0] if transpose_b else matrix_b.shape[1] // _block_b[1])
+
+    if output_size > MKL.MKL_LP64_MAX:
+        inner_a = _inner_nnz(matrix_a, 0 if transpose_a else 1)
+        inner_b = _inner_nnz(matrix_b, 1 if transpose_b else 0)
+        output_size = min(output_size, int(np.dot(inner_a.astype(np.float64), inner_b.astype(np.float64))))
+
+    return _choose_interface(matrix_a, matrix_b, output_size=output_size)
+
+
+def _inner_nnz(matrix, axis):
+    """
+    Count the non-zero values (or blocks for BSR) at each index of one axis of a sparse matrix
+
+    :param matrix: Sparse matrix in CSR, CSC, or BSR format
+    :type matrix: scipy.sparse.spmatrix
+    :param axis: 0 to count the non-zeros in each row, 1 to count the non-zeros in each column
+    :type axis: int
+    :return: Number of non-zeros at each index
+    :rtype: np.ndarray
+    """
+
+    compressed_axis = 1 if is_csc(matrix) else 0
+
+    if axis == compressed_axis:
+        return np.diff(matrix.indptr)
+
+    _block = matrix.blocksize[axis] if is_bsr(matrix) else 1
+    return np.bincount(matrix.indices, minlength=matrix.shape[axis] // _block)
+
+
+def _choose_dense_output(mkl_a, mkl_b, matrix_a, matrix_b, double_precision, transpose_a=False, transpose_b=False):
+    """
+    Count the non-zeros in A (dot) B with the first stage of a two-stage product and decide if the output should
+    be dense, based on the density threshold
+
+    :param mkl_a: Sparse matrix A handle
+    :type mkl_a: sparse_matrix_t
+    :param mkl_b: Sparse matrix B handle
+    :type mkl_b: sparse_matrix_t
+    :param matrix_a: Sparse matrix A
+    :type matrix_a: scipy.sparse.spmatrix
+    :param matrix_b: Sparse matrix B
+    :type matrix_b: scipy.sparse.spmatrix
+    :param double_precision: The handles are float64
+    :type double_precision: bool
+    :param transpose_a: Use AT instead of A
+    :type transpose_a: bool
+    :param transpose_b: Use BT instead of B
+    :type transpose_b: bool
+    :return: The output handle after the non-zero count stage (or None if it was destroyed),
+    and True if the output should be dense
+    :rtype: sparse_matrix_t, bool
+    """
+
+    mkl_c = _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_NNZ_COUNT, transpose_a=transpose_a,
+                               transpose_b=transpose_b)
+
+    try:
+        indptr = _export_mkl_indptr(mkl_c, double_precision, output_type=matrix_a.format)
+    except ValueError:
         _destroy_mkl_handle(mkl_c)
+        raise
+
+    # Each non-zero is a block for BSR
+    block_size = matrix_a.blocksize[0] * matrix_b.blocksize[1] if is_bsr(matrix_a) else 1
+
+    output_size = (matrix_a.shape[1] if transpose_a else matrix_a.shape[0]) * \
+        (matrix_b.shape[0] if transpose_b else matrix_b.shape[1])
+    density = int(indptr[-1]) * block_size / output_size
+    use_dense = density > MKL.MKL_DENSE_THRESHOLD
+
+    debug_print("Output density is {d:.4f} (threshold {t}); using {o} output".format(
+        d=density, t=MKL.MKL_DENSE_THRESHOLD, o="dense" if use_dense else "sparse"))
+
+    if use_dense:
+        _destroy_mkl_handle(mkl_c)
+        return None, True
+    else:
+        return mkl_c, False
+
+
+def _estimate_product_nnz(matrix_a, matrix_b, cast=False):
+    """
+    Count the non-zero values in A (dot) B without computing the product,
+    and calculate how much memory the product would need
+
+    :param matrix_a: Sparse matrix A in CSR or CSC format
+    :type matrix_a: scipy.sparse.spmatrix
+    :param matrix_b: Sparse matrix B in the same format as A
+    :type matrix_b: scipy.sparse.spmatrix
+    :param cast: Should the data be coerced into float64 if it isn't float32 or float64
+    :type cast: bool
+    :return: A dict with the output shape, the total number of non-zeros (nnz), the number of non-zeros in each
+    row (row_nnz; CSR) or in each column (col_nnz; CSC), and the output size in bytes keyed by
+    output format, data type, and index type (bytes)
+    :rtype: dict
+    """
+
+    if not _spsparse.issparse(matrix_a) or not _spsparse.issparse(matrix_b):
+        raise ValueError("estimate_product_nnz requires two sparse matrices")
+    elif not (is_csr(matrix_a) and is_csr(matrix_b)) and not (is_csc(matrix_a) and is_csc(matrix_b)):
+        err_msg = "Input matrices to estimate_product_nnz must both be CSR or both be CSC; {a} and {b} provided"
+        raise ValueError(err_msg.format(a=matrix_a.format, b=matrix_b.format))
+
+    _sanity_check(matrix_a, matrix_b)
 
-        debug_timer("Created python handle", t)
+    # The MKL integer type is needed for an empty output, which is created without calling MKL
+    _mkl_init()
 
-        return python_c
+    output_shape = matrix_a.shape[0], matrix_b.shape[1]
+    output_type = matrix_a.format
+    index_dim = output_shape[0] if output_type == "csr" else output_shape[1]
+
+    # Check for edge condition inputs which result in empty outputs
+    if _empty_output_check(matrix_a, matrix_b):
+        debug_print("Skipping nnz count because A (dot) B must yield an empty matrix")
+        indptr = np.zeros(index_dim + 1, dtype=MKL.MKL_INT_NUMPY)
+
+    else:
+        matrix_a, matrix_b = _type_check(matrix_a, matrix_b, cast=cast)
+
+        t = debug_timer()
+
+        mkl = _product_interface(matrix_a, matrix_b)
+        mkl_a, mkl_b = None, None
+
+        # Destroy the input handles even if the count raises
+        try:
+            mkl_a, a_dbl = _create_mkl_sparse(matrix_a, mkl=mkl)
+            mkl_b, b_dbl = _create_mkl_sparse(matrix_b, mkl=mkl)
+
+            mkl_c = _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_NNZ_COUNT)
+        finally:
+            for mkl_handle in (mkl_a, mkl_b):
+                if mkl_handle is not None:
+                    _destroy_mkl_handle(mkl_handle)
+
+        try:
+            indptr = _export_mkl_indptr(mkl_c, a_dbl or b_dbl, output_type=output_type)
+        finally:
+            _destroy_mkl_handle(mkl_c)
+
+        debug_timer("Counted product non-zeros", t)
+
+    nnz = int(indptr[-1])
+
+    return {"shape": output_shape,
+            "nnz": nnz,
+            "row_nnz" if output_type == "csr" else "col_nnz": np.diff(indptr),
+            "bytes": _product_bytes(output_shape, nnz)}
+
+
+def _product_bytes(shape, nnz):
+    """
+    Calculate the memory needed to store a matrix as CSR, CSC, or dense for float32 and float64 data
+    and for int32 and int64 (MKL_INT) indices
+
+    :param shape: Matrix shape
+    :type shape: tuple(int, int)
+    :param nnz: Number of non-zero values
+    :type nnz: int
+    :return: Bytes needed, keyed by format, data type, and (for sparse formats) index type
+    :rtype: dict
+    """
+
+    byte_sizes = {"csr": {}, "csc": {}, "dense": {}}
+
+    for float_dtype in map(np.dtype, NUMPY_FLOAT_DTYPES):
+        byte_sizes["dense"][float_dtype.name] = shape[0] * shape[1] * float_dtype.itemsize
+
+        for output_type, index_dim in (("csr", shape[0]), ("csc", shape[1])):
+            byte_sizes[output_type][float_dtype.name] = {
+                int_dtype.name: nnz * (float_dtype.itemsize + int_dtype.itemsize) + (index_dim + 1) * int_dtype.itemsize
+                for int_dtype in map(np.dtype, (np.int32, np.int64))
+            }
+
+    return byte_sizes
+
+
+class SparseProductPlan:
+    """
+    A sparse (dot) sparse product of two matrices whose sparsity structure is fixed but whose values change.
+    The output structure is calculated and allocated once when this object is created. Each execution only
+    computes the output values, writing them into the same output arrays.
+
+    The plan keeps its own copies of A and B; new values are provided to execute().
+
+    :param matrix_a: Sparse matrix A in CSR, CSC, or BSR format
+    :type matrix_a: scipy.sparse.spmatrix, MKLSparseMatrix
+    :param matrix_b: Sparse matrix B in the same format as A
+    :type matrix_b: scipy.sparse.spmatrix, MKLSparseMatrix
+    :param cast: Should the data be coerced into float64 if it isn't float32 or float64
+    :type cast: bool
+    """
+
+    def __init__(self, matrix_a, matrix_b, cast=False):
+
+        matrix_a, matrix_b = _unwrap_mkl_sparse(matrix_a), _unwrap_mkl_sparse(matrix_b)
+
+        if not _spsparse.issparse(matrix_a) or not _spsparse.issparse(matrix_b):
+            raise ValueError("SparseProductPlan requires two sparse matrices")
+        elif not _is_allowed_sparse_format(matrix_a) or not _is_allowed_sparse_format(matrix_b):
+            raise ValueError("Input matrices to SparseProductPlan must be CSR, CSC, or BSR; COO is not supported")
+        elif matrix_a.format != matrix_b.format:
+            err_msg = "Input matrices to SparseProductPlan must be the same format; {a} and {b} provided"
+            raise ValueError(err_msg.format(a=matrix_a.format, b=matrix_b.format))
+
+        _sanity_check(matrix_a, matrix_b)
+        matrix_a, matrix_b = _type_check(matrix_a, matrix_b, cast=cast)
+
+        # Keep copies so that the values MKL reads can only be changed by execute()
+        _audit_copy("copy of SparseProductPlan inputs", _nbytes(matrix_a) + _nbytes(matrix_b))
+        self._matrix_a, self._matrix_b = matrix_a.copy(), matrix_b.copy()
+        self._shape = matrix_a.shape[0], matrix_b.shape[1]
+        self._format = matrix_a.format
+        self._double_precision = matrix_a.dtype == np.float64
+
+        self._handles, self._owner = None, None
+        self._finalizer, self._closed = None, False
+
+        if _empty_output_check(self._matrix_a, self._matrix_b):
+            debug_print("SparseProductPlan will yield an empty matrix")
+            return
+
+        t = debug_timer()
+
+        mkl = _product_interface(self._matrix_a, self._matrix_b)
+        mkl_a, _ = _create_mkl_sparse(self._matrix_a, mkl=mkl)
+        mkl_b, _ = _create_mkl_sparse(self._matrix_b, mkl=mkl)
+
+        # Count non-zeros and calculate the output structure without values
+        mkl_c = _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_NNZ_COUNT)
+        self._handles = mkl_a, mkl_b, mkl_c
+
+        # The output handle memory will be used directly by exported matrices
+        self._owner = _MKLHandleOwner(mkl_c)
+        self._finalizer = weakref.finalize(self, _destroy_mkl_handles, mkl_a, mkl_b)
+
+        _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_FINALIZE_MULT_NO_VAL, ref_handle=mkl_c)
+
+        debug_timer("Created SparseProductPlan structure", t)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def format(self):
+        return self._format
+
+    @property
+    def dtype(self):
+        return self._matrix_a.dtype
+
+    @property
+    def matrix_a(self):
+        """The plan's copy of matrix A"""
+        return self._matrix_a
+
+    @property
+    def matrix_b(self):
+        """The plan's copy of matrix B"""
+        return self._matrix_b
+
+    @property
+    def closed(self):
+        """True if the MKL handles have been destroyed"""
+        return self._closed
+
+    def execute(self, values_a=None, values_b=None, copy=False):
+        """
+        Compute A (dot) B, optionally replacing the values of A and/or B first.
+
+        :param values_a: New non-zero values for A in the same order as SparseProductPlan.matrix_a.data,
+        or a sparse matrix with the same sparsity structure as A
+        :type values_a: np.ndarray, scipy.sparse.spmatrix, None
+        :param values_b: New non-zero values for B in the same order as SparseProductPlan.matrix_b.data,
+        or a sparse matrix with the same sparsity structure as B
+        :type values_b: np.ndarray, scipy.sparse.spmatrix, None
+        :param copy: Return a copy of the product.
+        If False, the returned matrix uses the plan's output arrays, which are overwritten by the next execution.
+        :type copy: bool
+        :return: Sparse matrix that is the result of A * B in the same format as A
+        :rtype: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, scipy.sparse.bsr_matrix
+        """
+
+        if self.closed:
+            raise ValueError("Cannot execute a SparseProductPlan after it has been closed")
+
+        with _instrumented_call("SparseProductPlan.execute", self._matrix_a, self._matrix_b) as call:
+            _replace_values(self._matrix_a, values_a) if values_a is not None else None
+            _replace_values(self._matrix_b, values_b) if values_b is not None else None
+
+            if self._handles is None:
+                return _empty_sparse(self._format, self._shape, self.dtype, self._matrix_a, self._matrix_b)
+
+            t = debug_timer()
+
+            mkl_a, mkl_b, mkl_c = self._handles
+            _matmul_mkl_staged(mkl_a, mkl_b, SPARSE_STAGE_FINALIZE_MULT, ref_handle=mkl_c)
+
+            t = debug_timer("Computed SparseProductPlan values", t)
+
+            python_c = _export_mkl(mkl_c, self._double_precision, output_type=self._format, copy=copy,
+                                   owner=self._owner)
+
+            debug_timer("Created python handle", t)
+
+            return call.set_output(python_c)
+
+    def close(self):
+        """
+        Destroy the MKL handles now instead of waiting for garbage collection.
+        Matrices returned by execute() with copy=False remain valid until they are garbage collected.
+        """
+
+        if self._finalizer is not None:
+            self._finalizer()
+
+        # The output handle is destroyed when no exported matrices are using its memory
+        self._handles, self._owner, self._closed = None, None, True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "<SparseProductPlan ({c}) {a} (dot) {b} in {f} format>".format(c="closed" if self.closed else "open",
+                                                                             a=self._matrix_a.shape,
+                                                                             b=self._matrix_b.shape, f=self._format)
+
+
+def _destroy_mkl_handles(*ref_handles):
+    """
+    Destroy several MKL handles
+
+    :param ref_handles: MKL handles
+    :type ref_handles: sparse_matrix_t
+    """
+
+    for ref_handle in ref_handles:
+        _destroy_mkl_handle(ref_handle)
+
+
+def _replace_values(matrix, new_values):
+    """
+    Replace the non-zero values of a sparse matrix in place without changing its structure
+
+    :param matrix: Sparse matrix
+    :type matrix: scipy.sparse.spmatrix
+    :param new_values: New non-zero values in the same order as matrix.data,
+    or a sparse matrix with the same sparsity structure
+    :type new_values: np.ndarray, scipy.sparse.spmatrix
+    """
+
+    if _spsparse.issparse(new_values):
+        new_values = new_values.asformat(matrix.format)
+
+        if (new_values.shape != matrix.shape or
+                not np.array_equal(new_values.indptr, matrix.indptr) or
+                not np.array_equal(new_values.indices, matrix.indices)):
+            raise ValueError("New matrix must have the same sparsity structure as the original matrix")
+
+        new_values = new_values.data
+
+    new_values = np.asarray(new_values)
+
+    if new_values.size != matrix.data.size:
+        err_msg = "{n} new values provided for a matrix with {m} stored values".format(n=new_values.size,
+                                                                                       m=matrix.data.size)
+        raise ValueError(err_msg)
+
+    np.copyto(matrix.data, new_values.reshape(matrix.data.shape), casting="same_kind")
+
+
+def _empty_sparse(output_type, shape, dtype, matrix_a, matrix_b):
+    """
+    Create an empty sparse matrix for the product of A and B
+
+    :return: Empty sparse matrix
+    :rtype: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, scipy.sparse.bsr_matrix
+    """
+
+    if output_type == "bsr":
+        return _spsparse.bsr_matrix(shape, dtype=dtype, blocksize=(matrix_a.blocksize[0], matrix_b.blocksize[1]))
+    elif output_type == "csc":
+        return _spsparse.csc_matrix(shape, dtype=dtype)
+    else:
+        return _spsparse.csr_matrix(shape, dtype=dtype)
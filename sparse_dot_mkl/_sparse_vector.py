@@ -1,12 +1,17 @@
-from sparse_dot_mkl._mkl_interface import (MKL, _sanity_check, _empty_output_check, _type_check, _create_mkl_sparse,
-                                           _destroy_mkl_handle, matrix_descr, RETURN_CODES, _is_dense_vector,
-                                           _out_matrix, _check_return_value, _is_allowed_sparse_format)
+from sparse_dot_mkl._mkl_interface import (_choose_interface, _handle_interface, _sanity_check, _empty_output_check,
+                                           _type_check, _create_mkl_sparse, _destroy_mkl_handle, matrix_descr,
+                                           RETURN_CODES, _is_dense_vector, _out_matrix, _check_return_value,
+                                           _is_allowed_sparse_format)
+from sparse_dot_mkl._mkl_sparse_matrix import _optimize_for_call
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase, _audit_copy
 
 import numpy as np
 import ctypes as _ctypes
 
 
-def _sparse_dense_vector_mult(matrix_a, vector_b, scalar=1., transpose=False, out=None, out_scalar=None, out_t=None):
+@_timed_phase("compute")
+def _sparse_dense_vector_mult(matrix_a, vector_b, scalar=1., transpose=False, out=None, out_scalar=None, out_t=None,
+                              optimize=None, descr=None):
     """
     Multiply together a sparse matrix and a dense vector
 
@@ -22,6 +27,10 @@ def _sparse_dense_vector_mult(matrix_a, vector_b, scalar=1., transpose=False, ou
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param optimize: Optimize a persistent MKL handle for this many calls of this operation if provided.
+    :type optimize: int, None
+    :param descr: Matrix description of the sparse matrix (e.g. symmetric or triangular). Defaults to general.
+    :type descr: matrix_descr, None
     :return: A (dot) B as a dense array
     :rtype: np.ndarray
     """
@@ -33,20 +42,28 @@ def _sparse_dense_vector_mult(matrix_a, vector_b, scalar=1., transpose=False, ou
         final_dtype = np.float64 if matrix_a.dtype != vector_b.dtype or matrix_a.dtype != np.float32 else np.float32
         return _out_matrix(output_shape, final_dtype, out_arr=out)
 
-    mkl_a, dbl = _create_mkl_sparse(matrix_a)
+    # Flattening a strided vector makes a contiguous copy of it
+    if not vector_b.flags.c_contiguous and not vector_b.flags.f_contiguous:
+        _audit_copy("copy of a strided dense vector", vector_b.nbytes)
+
+    mkl_a, dbl = _create_mkl_sparse(matrix_a, mkl=_choose_interface(matrix_a, vector_b))
     vector_b = vector_b.ravel()
 
     # Set functions and types for float or doubles
     output_ctype = _ctypes.c_double if dbl else _ctypes.c_float
     output_dtype = np.float64 if dbl else np.float32
-    func = MKL._mkl_sparse_d_mv if dbl else MKL._mkl_sparse_s_mv
+    func = _handle_interface(mkl_a)._mkl_sparse_d_mv if dbl else _handle_interface(mkl_a)._mkl_sparse_s_mv
 
     output_arr = _out_matrix(output_shape, output_dtype, out_arr=out, out_t=out_t)
 
+    descr = matrix_descr() if descr is None else descr
+
+    _optimize_for_call(matrix_a, mkl_a, optimize, transpose=transpose, descr=descr)
+
     ret_val = func(11 if transpose else 10,
                    scalar,
                    mkl_a,
-                   matrix_descr(),
+                   descr,
                    vector_b,
                    float(out_scalar) if out_scalar is not None else 1.,
                    output_arr.ctypes.data_as(_ctypes.POINTER(output_ctype)))
@@ -59,7 +76,8 @@ def _sparse_dense_vector_mult(matrix_a, vector_b, scalar=1., transpose=False, ou
     return output_arr
 
 
-def _sparse_dot_vector(mv_a, mv_b, cast=False, scalar=1., out=None, out_scalar=None):
+def _sparse_dot_vector(mv_a, mv_b, cast=False, scalar=1., out=None, out_scalar=None, optimize=None,
+                       transpose_a=False, transpose_b=False, descr=None):
     """
     Multiply a sparse matrix by a dense vector.
     The matrix must be CSR or CSC format.
@@ -79,22 +97,40 @@ def _sparse_dot_vector(mv_a, mv_b, cast=False, scalar=1., out=None, out_scalar=N
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param optimize: Optimize a persistent MKL handle for this many calls of this operation if provided.
+    :type optimize: int, None
+    :param transpose_a: Multiply AT instead of A if A is the sparse matrix
+    :type transpose_a: bool
+    :param transpose_b: Multiply BT instead of B if B is the sparse matrix
+    :type transpose_b: bool
+    :param descr: Matrix description of the sparse matrix (e.g. symmetric or triangular). Defaults to general.
+    :type descr: matrix_descr, None
     :return: A (dot) B as a dense matrix
     :rtype: np.ndarray
     """
 
-    _sanity_check(mv_a, mv_b, allow_vector=True)
+    # Transposing a dense vector only changes its shape, so only the sparse matrix is transposed by MKL
+    if transpose_a and _is_dense_vector(mv_a):
+        mv_a, transpose_a = mv_a.T, False
+
+    if transpose_b and _is_dense_vector(mv_b):
+        mv_b, transpose_b = mv_b.T, False
+
+    _sanity_check(mv_a, mv_b, allow_vector=True, transpose_a=transpose_a, transpose_b=transpose_b)
     mv_a, mv_b = _type_check(mv_a, mv_b, cast=cast)
 
     if not _is_allowed_sparse_format(mv_a) or not _is_allowed_sparse_format(mv_b):
         raise ValueError("Only CSR, CSC, and BSR-type sparse matrices are supported")
     elif _is_dense_vector(mv_b):
-        return _sparse_dense_vector_mult(mv_a, mv_b, scalar=scalar, out=out, out_scalar=out_scalar)
+        return _sparse_dense_vector_mult(mv_a, mv_b, scalar=scalar, transpose=transpose_a, out=out,
+                                         out_scalar=out_scalar, optimize=optimize, descr=descr)
     elif _is_dense_vector(mv_a) and out is None:
-        return _sparse_dense_vector_mult(mv_b, mv_a.T, scalar=scalar, transpose=True).T
+        return _sparse_dense_vector_mult(mv_b, mv_a.T, scalar=scalar, transpose=not transpose_b,
+                                         optimize=optimize, descr=descr).T
     elif _is_dense_vector(mv_a) and out is not None:
-        _ = _sparse_dense_vector_mult(mv_b, mv_a.T, scalar=scalar, transpose=True,
-                                      out=out.T, out_scalar=out_scalar, out_t=True)
+        _ = _sparse_dense_vector_mult(mv_b, mv_a.T, scalar=scalar, transpose=not transpose_b,
+                                      out=out.T, out_scalar=out_scalar, out_t=True, optimize=optimize,
+                                      descr=descr)
         return out
     else:
         raise ValueError("Neither mv_a or mv_b is a dense vector")
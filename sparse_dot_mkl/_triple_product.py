@@ -0,0 +1,248 @@
+from sparse_dot_mkl._mkl_interface import (_choose_interface, _handle_interface, _new_handle, _create_mkl_sparse,
+                                           _export_mkl, _order_mkl_handle, _destroy_mkl_handle, _type_check,
+                                           _get_numpy_layout, _empty_output_check, _out_matrix, _check_return_value,
+                                           _structure_descr, _track_handle, _csc_as_csr_transpose, debug_print, MKL,
+                                           SPARSE_OPERATION_NON_TRANSPOSE, SPARSE_OPERATION_TRANSPOSE,
+                                           SPARSE_STAGE_FULL_MULT, FILL_MODES)
+from sparse_dot_mkl._sparse_sparse import _inner_nnz
+from sparse_dot_mkl._mkl_instrumentation import _timed_phase
+
+import scipy.sparse as _sps
+import ctypes as _ctypes
+import numpy as np
+
+
+def _triple_output_size(matrix_a, matrix_b, abat=False):
+    """
+    Bound the number of non-zeros in a sparse triple product by the non-zero paths through B if the dense output
+    would be too large for 32-bit indices.
+
+    :param matrix_a: Sparse matrix A in CSR format
+    :type matrix_a: scipy.sparse.csr_matrix
+    :param matrix_b: Sparse matrix B in CSR format
+    :type matrix_b: scipy.sparse.csr_matrix
+    :param abat: Bound A (dot) B (dot) AT instead of AT (dot) B (dot) A
+    :type abat: bool
+    :return: The largest number of non-zeros the output could have
+    :rtype: int
+    """
+
+    out_dim = matrix_a.shape[0] if abat else matrix_a.shape[1]
+    output_size = out_dim * out_dim
+
+    if output_size > MKL.MKL_LP64_MAX:
+        inner = _inner_nnz(matrix_a, 1 if abat else 0).astype(np.float64)
+        b_rows = np.repeat(np.arange(matrix_b.shape[0]), np.diff(matrix_b.indptr))
+
+        # B only stores one triangle, so each stored value can be used in both directions
+        output_size = min(output_size, 2 * int(np.dot(inner[b_rows], inner[matrix_b.indices])))
+
+    return output_size
+
+
+@_timed_phase("compute")
+def _triple_product_sparse(matrix_a, matrix_b, abat=False, reorder_output=False, zero_copy=False, fill_mode="upper"):
+    """
+    Calculate the triple product AT (dot) B (dot) A for sparse matrix A and sparse symmetric matrix B and return the
+    upper triangle as a sparse matrix
+
+    :param matrix_a: Sparse matrix A
+    :type matrix_a: scipy.sparse.csr_matrix
+    :param matrix_b: Sparse symmetric matrix B
+    :type matrix_b: scipy.sparse.csr_matrix
+    :param abat: Return A (dot) B (dot) AT instead of AT (dot) B (dot) A
+    :type abat: bool
+    :param reorder_output:
+    :type reorder_output: bool
+    :param zero_copy: Return a sparse matrix which uses the memory allocated by MKL instead of a copy
+    :type zero_copy: bool
+    :param fill_mode: The triangle of B which is used ("upper" or "lower")
+    :type fill_mode: str
+    :return: Sparse matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+
+    descr_b = _structure_descr(matrix_b, "symmetric", fill_mode=fill_mode)
+    mkl = _choose_interface(matrix_a, matrix_b, output_size=_triple_output_size(matrix_a, matrix_b, abat=abat))
+
+    sp_ref_a, a_dbl = _create_mkl_sparse(matrix_a, mkl=mkl)
+    sp_ref_b, b_dbl = _create_mkl_sparse(matrix_b, mkl=mkl)
+
+    _order_mkl_handle(sp_ref_a)
+    _order_mkl_handle(sp_ref_b)
+
+    ref_handle = _new_handle(mkl)
+
+    ret_val = mkl._mkl_sparse_sypr(SPARSE_OPERATION_NON_TRANSPOSE if abat else SPARSE_OPERATION_TRANSPOSE,
+                                   sp_ref_a,
+                                   sp_ref_b,
+                                   descr_b,
+                                   _ctypes.byref(ref_handle),
+                                   SPARSE_STAGE_FULL_MULT)
+
+    # Check return
+    _check_return_value(ret_val, "mkl_sparse_sypr")
+    _track_handle(ref_handle)
+
+    if reorder_output:
+        _order_mkl_handle(ref_handle)
+
+    # Destroy the handles even if the export raises (e.g. because an export copy isn't allowed)
+    try:
+        output_arr = _export_mkl(ref_handle, a_dbl or b_dbl, output_type="csr", copy=not zero_copy)
+    finally:
+        _destroy_mkl_handle(sp_ref_a)
+        _destroy_mkl_handle(sp_ref_b)
+
+        if not zero_copy:
+            _destroy_mkl_handle(ref_handle)
+
+    return output_arr
+
+
+@_timed_phase("compute")
+def _triple_product_dense(matrix_a, matrix_b, abat=False, scalar=1., out=None, out_scalar=None):
+    """
+    Calculate the triple product AT (dot) B (dot) A for sparse matrix A and dense symmetric matrix B and return the
+    upper triangle as a dense matrix
+
+    :param matrix_a: Sparse matrix A
+    :type matrix_a: scipy.sparse.csr_matrix
+    :param matrix_b: Dense symmetric matrix B
+    :type matrix_b: np.ndarray
+    :param abat: Return A (dot) B (dot) AT instead of AT (dot) B (dot) A
+    :type abat: bool
+    :param scalar: Multiply output by a scalar value
+    :type scalar: float
+    :param out: Add the triple product to this array if provided.
+    :type out: np.ndarray, None
+    :param out_scalar: Multiply the out array by this scalar if provided.
+    :type out_scalar: float, None
+    :return: Dense matrix
+    :rtype: numpy.ndarray
+    """
+
+    out_dim = matrix_a.shape[0] if abat else matrix_a.shape[1]
+
+    sp_ref_a, double_prec = _create_mkl_sparse(matrix_a, mkl=_choose_interface(matrix_a, matrix_b))
+    _order_mkl_handle(sp_ref_a)
+
+    mkl = _handle_interface(sp_ref_a)
+    func = mkl._mkl_sparse_d_syprd if double_prec else mkl._mkl_sparse_s_syprd
+    output_ctype = _ctypes.c_double if double_prec else _ctypes.c_float
+
+    # C is row-major unless a column-major out array is provided
+    output_order = "F" if out is not None and out.flags.f_contiguous and not out.flags.c_contiguous else "C"
+    output_arr = _out_matrix((out_dim, out_dim), np.float64 if double_prec else np.float32, order=output_order,
+                             out_arr=out)
+    layout_c, ld_c = _get_numpy_layout(output_arr)
+
+    # syprd requires B to have the same layout as C
+    # B is symmetric, so a contiguous B is the same matrix in either layout and is passed with the layout of C
+    _, ld_b = _get_numpy_layout(matrix_b)
+
+    ret_val = func(SPARSE_OPERATION_NON_TRANSPOSE if abat else SPARSE_OPERATION_TRANSPOSE,
+                   sp_ref_a,
+                   matrix_b,
+                   layout_c,
+                   ld_b,
+                   scalar,
+                   float(out_scalar) if out_scalar is not None else 1.,
+                   output_arr.ctypes.data_as(_ctypes.POINTER(output_ctype)),
+                   layout_c,
+                   ld_c)
+
+    # Check return
+    _check_return_value(ret_val, func.__name__)
+
+    _destroy_mkl_handle(sp_ref_a)
+
+    return output_arr
+
+
+def _triple_product(matrix_a, matrix_b, transpose=False, cast=False, reorder_output=False, scalar=1., out=None,
+                    out_scalar=None, zero_copy=False, fill_mode="upper"):
+    """
+    Calculate the symmetric triple product AT (dot) B (dot) A from a sparse matrix A and a symmetric matrix B.
+
+    :param matrix_a: Sparse matrix A
+    :type matrix_a: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix
+    :param matrix_b: Symmetric matrix B; a sparse B produces a sparse output and a dense B produces a dense output
+    :type matrix_b: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, np.ndarray
+    :param transpose: Calculate A (dot) B (dot) AT instead
+    :type transpose: bool
+    :param cast: Make internal copies to convert matrices to float matrices if necessary
+    :type cast: bool
+    :param reorder_output: Should the array indices of a sparse output be reordered using MKL
+    :type reorder_output: bool
+    :param scalar: Multiply the product by this scalar
+    :type scalar: float
+    :param out: Add the triple product to this array if provided. B must be dense.
+    :type out: np.ndarray, None
+    :param out_scalar: Multiply the out array by this scalar if provided.
+    :type out_scalar: float, None
+    :param zero_copy: Return a sparse matrix which uses the memory allocated by MKL instead of a copy
+    :type zero_copy: bool
+    :param fill_mode: The triangle of a sparse B which is used ("upper" or "lower")
+    :type fill_mode: str
+    :return: Upper triangle of the triple product
+    :rtype: scipy.sparse.csr_matrix, np.ndarray
+    """
+
+    if not _sps.isspmatrix_csr(matrix_a) and not _sps.isspmatrix_csc(matrix_a):
+        raise ValueError("triple_product requires matrix A to be a CSR or CSC sparse matrix")
+    elif _sps.issparse(matrix_b) and not (_sps.isspmatrix_csr(matrix_b) or _sps.isspmatrix_csc(matrix_b)):
+        raise ValueError("triple_product requires a sparse matrix B to be CSR or CSC format")
+    elif not _sps.issparse(matrix_b) and matrix_b.ndim != 2:
+        raise ValueError("triple_product requires a dense matrix B to be 2d; {s} provided".format(s=matrix_b.shape))
+    elif fill_mode not in FILL_MODES:
+        raise ValueError("fill_mode must be one of {f}; {p} provided".format(f=tuple(FILL_MODES.keys()), p=fill_mode))
+
+    inner_dim = matrix_a.shape[1] if transpose else matrix_a.shape[0]
+
+    if matrix_b.shape != (inner_dim, inner_dim):
+        _err = "Matrix alignment error: B must be {i}x{i} for matrix A {a}; {b} provided".format(i=inner_dim,
+                                                                                              a=matrix_a.shape,
+                                                                                              b=matrix_b.shape)
+        raise ValueError(_err)
+
+    if _sps.issparse(matrix_b) and out is not None:
+        raise ValueError("out argument cannot be used with a sparse B matrix")
+
+    out_dim = matrix_a.shape[0] if transpose else matrix_a.shape[1]
+
+    # Check for edge condition inputs which result in empty outputs
+    if _empty_output_check(matrix_a, matrix_b):
+        debug_print("Skipping multiplication because AT (dot) B (dot) A must yield an empty matrix")
+        final_dtype = np.float64 if matrix_a.dtype != matrix_b.dtype or matrix_a.dtype != np.float32 else np.float32
+
+        if _sps.issparse(matrix_b):
+            return _sps.csr_matrix((out_dim, out_dim), dtype=final_dtype)
+
+        out_arr = _out_matrix((out_dim, out_dim), final_dtype, out_arr=out,
+                              order="F" if out is not None and out.flags.f_contiguous and not out.flags.c_contiguous
+                              else "C")
+        out_arr *= out_scalar if out_scalar is not None else 1.
+        return out_arr
+
+    matrix_a, matrix_b = _type_check(matrix_a, matrix_b, cast=cast)
+
+    # The CSC arrays of A are the CSR arrays of AT, so the transpose flag is flipped instead of converting A
+    if _sps.isspmatrix_csc(matrix_a):
+        matrix_a, transpose = _csc_as_csr_transpose(matrix_a), not transpose
+
+    if not _sps.issparse(matrix_b):
+        return _triple_product_dense(matrix_a, matrix_b, abat=transpose, scalar=scalar, out=out,
+                                     out_scalar=out_scalar)
+
+    # B is symmetric, so the CSC arrays of B are also its CSR arrays, but with the stored triangle transposed
+    if _sps.isspmatrix_csc(matrix_b):
+        matrix_b, fill_mode = _csc_as_csr_transpose(matrix_b), "lower" if fill_mode == "upper" else "upper"
+
+    output_arr = _triple_product_sparse(matrix_a, matrix_b, abat=transpose, reorder_output=reorder_output,
+                                        zero_copy=zero_copy, fill_mode=fill_mode)
+
+    if scalar != 1.:
+        output_arr.data *= scalar
+
+    return output_arr
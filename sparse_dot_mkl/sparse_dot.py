@@ -1,25 +1,37 @@
-from sparse_dot_mkl._sparse_sparse import _sparse_dot_sparse as _sds
+from sparse_dot_mkl._sparse_sparse import _sparse_dot_sparse as _sds, _estimate_product_nnz as _epn, SparseProductPlan
 from sparse_dot_mkl._sparse_dense import _sparse_dot_dense as _sdd
 from sparse_dot_mkl._dense_dense import _dense_dot_dense as _ddd
 from sparse_dot_mkl._sparse_vector import _sparse_dot_vector as _sdv
-from sparse_dot_mkl._gram_matrix import _gram_matrix as _gm
-from sparse_dot_mkl._sparse_qr_solver import sparse_qr_solver as _qrs
-from sparse_dot_mkl._mkl_interface import print_mkl_debug, _is_dense_vector, set_debug_mode, get_version_string
+from sparse_dot_mkl._gram_matrix import _gram_matrix as _gm, _covariance as _cov, GramAccumulator
+from sparse_dot_mkl._triple_product import _triple_product as _tp
+from sparse_dot_mkl._sparse_qr_solver import sparse_qr_solver as _qrs, SparseQR
+from sparse_dot_mkl._mkl_interface import (print_mkl_debug, _is_dense_vector, set_debug_mode, get_version_string,
+                                           set_dense_threshold, set_num_threads, get_max_threads, set_dynamic,
+                                           mkl_threads, set_threading_layer, get_threading_layer,
+                                           get_interface_layer, prepare_mkl, memory_stats, release_memory,
+                                           set_peak_memory_tracking, _structure_descr)
+from sparse_dot_mkl._mkl_sparse_matrix import MKLSparseMatrix, _unwrap_mkl_sparse
+from sparse_dot_mkl._mkl_threadpool import _mkl_call, mkl_threadpool_controller, set_oversubscription_mode
+from sparse_dot_mkl._mkl_instrumentation import (_instrumented_call, _no_copy_call, add_event_callback,
+                                                 remove_event_callback, record_events, set_copy_audit_mode,
+                                                 get_copy_audit, reset_copy_audit)
 import scipy.sparse as _spsparse
 import numpy as _np
 import warnings
 
 
 def dot_product_mkl(matrix_a, matrix_b, cast=False, copy=True, reorder_output=False, dense=False, debug=False,
-                    out=None, out_scalar=None):
+                    out=None, out_scalar=None, optimize=None, zero_copy=False, scalar=1., transpose_a=False,
+                    transpose_b=False, threads=None, strict_no_copy=False, structure=None, fill_mode="upper",
+                    diagonal="non_unit"):
     """
     Multiply together matrixes using the intel Math Kernel Library.
     This currently only supports float32 and float64 data
 
     :param matrix_a: Sparse matrix A in CSC/CSR format or dense matrix in numpy format
-    :type matrix_a: scipy.sparse.spmatrix, np.ndarray
+    :type matrix_a: scipy.sparse.spmatrix, MKLSparseMatrix, np.ndarray
     :param matrix_b: Sparse matrix B in CSC/CSR format or dense matrix in numpy format
-    :type matrix_b: scipy.sparse.spmatrix, np.ndarray
+    :type matrix_b: scipy.sparse.spmatrix, MKLSparseMatrix, np.ndarray
     :param cast: Should the data be coerced into float64 if it isn't float32 or float64
     If set to True and any other dtype is passed, the matrix data will copied internally before multiplication
     If set to False and any dtype that isn't float32 or float64 is passed, a ValueError will be raised
@@ -33,14 +45,52 @@ def dot_product_mkl(matrix_a, matrix_b, cast=False, copy=True, reorder_output=Fa
     :type reorder_output: bool
     :param dense: Should the matrix multiplication be put into a dense numpy array
     This does not require any copy and is memory efficient if the output array density is > 50%
+    If set to "auto", the non-zeros in the output will be counted first, and the output will be dense if its density
+    is above the threshold set with `sparse_dot_mkl.set_dense_threshold` (0.5 by default)
     Note that this flag has no effect if one input array is dense; then the output will always be dense
-    :type dense: bool
+    :type dense: bool, str
     :param debug: Deprecated debug flag. Use `sparse_dot_mkl.set_debug_mode(True)`
     :type debug: bool
     :param out: Add the dot product to this array if provided.
+    If both inputs are sparse, this will produce a dense output and it may be C or F ordered.
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param optimize: Optimize the sparse matrix handle for this many expected calls of this product.
+    This only has an effect on sparse (dot) dense and sparse (dot) vector products where the sparse matrix is a
+    MKLSparseMatrix, because the analysis is lost when a temporary handle is destroyed.
+    :type optimize: int, None
+    :param zero_copy: Return a sparse product which uses the memory allocated by MKL instead of copying it.
+    This reduces peak memory use. The MKL memory is released when the returned arrays are garbage collected.
+    Note that this flag has no effect if the output is dense
+    :type zero_copy: bool
+    :param scalar: Multiply the product by this scalar, so that the result is scalar * A * B
+    (and out := scalar * A * B + out_scalar * out if out is provided). Defaults to 1.
+    :type scalar: float
+    :param transpose_a: Multiply AT instead of A. A sparse A is transposed by MKL during the multiplication, and is
+    never created. A dense A is transposed as a view.
+    :type transpose_a: bool
+    :param transpose_b: Multiply BT instead of B. A sparse B is transposed by MKL during the multiplication, and is
+    never created. A dense B is transposed as a view.
+    :type transpose_b: bool
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast, an
+    index cast, a conversion to CSR, or a copy of MKL output).
+    A sparse product must also set zero_copy=True. Defaults to False.
+    :type strict_no_copy: bool
+    :param structure: Describe the sparse matrix of a sparse (dot) dense or sparse (dot) vector product as
+    "symmetric", "triangular", or "diagonal" instead of "general". MKL only reads the triangle of a symmetric or
+    triangular matrix selected by fill_mode (so only that triangle needs to be stored; e.g. the upper triangular
+    output of gram_matrix_mkl can be used as a symmetric matrix), and only the diagonal of a diagonal matrix.
+    The sparse matrix must be square. Defaults to None (general).
+    :type structure: str, None
+    :param fill_mode: "upper" or "lower" triangle of a symmetric or triangular matrix. Defaults to "upper".
+    :type fill_mode: str
+    :param diagonal: "non_unit" to use the stored diagonal of a symmetric, triangular, or diagonal matrix,
+    or "unit" to treat every diagonal value as 1. Defaults to "non_unit".
+    :type diagonal: str
     :return: Matrix that is the result of A * B in input-dependent format
     :rtype: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, np.ndarray
     """
@@ -48,52 +98,82 @@ def dot_product_mkl(matrix_a, matrix_b, cast=False, copy=True, reorder_output=Fa
     warnings.warn("Set debug mode with sparse_dot_mkl.set_debug_mode(True)", DeprecationWarning) if debug else None
     print_mkl_debug()
 
+    matrix_a, matrix_b = _unwrap_mkl_sparse(matrix_a), _unwrap_mkl_sparse(matrix_b)
+
     num_sparse = sum((_spsparse.issparse(matrix_a), _spsparse.issparse(matrix_b)))
 
-    # SPARSE (DOT) SPARSE #
-    if num_sparse == 2 and out is not None:
-        raise ValueError("out argument cannot be used with sparse (dot) sparse matrix multiplication")
+    # Transposing a dense array is free (it's a view), so only sparse matrices are transposed by MKL
+    if transpose_a and not _spsparse.issparse(matrix_a):
+        matrix_a, transpose_a = matrix_a.T, False
 
-    elif num_sparse == 2:
-        return _sds(matrix_a, matrix_b, cast=cast, reorder_output=reorder_output, dense=dense)
+    if transpose_b and not _spsparse.issparse(matrix_b):
+        matrix_b, transpose_b = matrix_b.T, False
 
-    # SPARSE (DOT) VECTOR #
-    elif num_sparse == 1 and _is_dense_vector(matrix_a) and (matrix_a.ndim == 1 or matrix_a.shape[0] == 1):
-        return _sdv(matrix_a, matrix_b, cast=cast, out=out, out_scalar=out_scalar)
+    # Only the sparse (dot) dense and sparse (dot) vector functions can use a symmetric, triangular, or diagonal matrix
+    if structure is not None and structure != "general" and num_sparse != 1:
+        raise ValueError("structure can only be set for a product of one sparse matrix and one dense array")
+    elif num_sparse == 1:
+        descr = _structure_descr(matrix_a if _spsparse.issparse(matrix_a) else matrix_b, structure=structure,
+                                 fill_mode=fill_mode, diagonal=diagonal)
+    else:
+        descr = None
 
-    # SPARSE (DOT) VECTOR #
-    elif num_sparse == 1 and _is_dense_vector(matrix_b) and (matrix_b.ndim == 1 or matrix_b.shape[1] == 1):
-        return _sdv(matrix_a, matrix_b, cast=cast, out=out, out_scalar=out_scalar)
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), \
+            _instrumented_call("dot_product_mkl", matrix_a, matrix_b) as call:
 
-    # SPARSE (DOT) DENSE & DENSE (DOT) SPARSE #
-    elif num_sparse == 1:
-        return _sdd(matrix_a, matrix_b, cast=cast, out=out, out_scalar=out_scalar)
+        # SPARSE (DOT) SPARSE #
+        if num_sparse == 2:
+            return call.set_output(_sds(matrix_a, matrix_b, cast=cast, reorder_output=reorder_output, dense=dense,
+                                        zero_copy=zero_copy, scalar=scalar, out=out, out_scalar=out_scalar,
+                                        transpose_a=transpose_a, transpose_b=transpose_b))
 
-    # SPECIAL CASE OF VECTOR (DOT) VECTOR #
-    # THIS IS JUST EASIER THAN GETTING THIS EDGE CONDITION RIGHT IN MKL #
-    elif _is_dense_vector(matrix_a) and _is_dense_vector(matrix_b) and (matrix_a.ndim == 1 or matrix_b.ndim == 1):
-        if out_scalar is not None:
-            out *= out_scalar
-        return _np.dot(matrix_a, matrix_b, out=out)
+        # SPARSE (DOT) VECTOR #
+        elif num_sparse == 1 and _is_dense_vector(matrix_a) and (matrix_a.ndim == 1 or matrix_a.shape[0] == 1):
+            return call.set_output(_sdv(matrix_a, matrix_b, cast=cast, scalar=scalar, out=out, out_scalar=out_scalar,
+                                        optimize=optimize, transpose_b=transpose_b, descr=descr))
 
-    # DENSE (DOT) DENSE
-    else:
-        return _ddd(matrix_a, matrix_b, cast=cast, out=out, out_scalar=out_scalar)
+        # SPARSE (DOT) VECTOR #
+        elif num_sparse == 1 and _is_dense_vector(matrix_b) and (matrix_b.ndim == 1 or matrix_b.shape[1] == 1):
+            return call.set_output(_sdv(matrix_a, matrix_b, cast=cast, scalar=scalar, out=out, out_scalar=out_scalar,
+                                        optimize=optimize, transpose_a=transpose_a, descr=descr))
+
+        # SPARSE (DOT) DENSE & DENSE (DOT) SPARSE #
+        elif num_sparse == 1:
+            return call.set_output(_sdd(matrix_a, matrix_b, cast=cast, scalar=scalar, out=out, out_scalar=out_scalar,
+                                        optimize=optimize, transpose_a=transpose_a, transpose_b=transpose_b,
+                                        descr=descr))
+
+        # SPECIAL CASE OF VECTOR (DOT) VECTOR #
+        # THIS IS JUST EASIER THAN GETTING THIS EDGE CONDITION RIGHT IN MKL #
+        elif (_is_dense_vector(matrix_a) and _is_dense_vector(matrix_b) and
+              (matrix_a.ndim == 1 or matrix_b.ndim == 1)):
+            if out_scalar is not None:
+                out *= out_scalar
+            vv_product = _np.dot(matrix_a, matrix_b, out=out)
+            if scalar != 1.:
+                vv_product *= scalar
+            return call.set_output(vv_product)
+
+        # DENSE (DOT) DENSE
+        else:
+            return call.set_output(_ddd(matrix_a, matrix_b, cast=cast, scalar=scalar, out=out, out_scalar=out_scalar))
 
 
 def gram_matrix_mkl(matrix, transpose=False, cast=False, dense=False, debug=False, reorder_output=False,
-                    out=None, out_scalar=None):
+                    out=None, out_scalar=None, zero_copy=False, threads=None, strict_no_copy=False,
+                    symmetric="upper", weights=None):
     """
     Calculate a gram matrix (AT (dot) A) matrix.
-    Note that this should calculate only the upper triangular matrix.
-    However providing a sparse matrix with transpose=False and dense=True will calculate a full matrix
-    (this appears to be a bug in mkl_sparse_?_syrkd)
+    Note that this calculates only the upper triangular matrix by default.
+    However providing a sparse matrix with transpose=False and dense=True and an out array will calculate a full
+    matrix (this appears to be a bug in mkl_sparse_?_syrkd)
 
     :param matrix: Sparse matrix in CSR or CSC format or numpy array
-    :type matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, numpy.ndarray
+    :type matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, MKLSparseMatrix, numpy.ndarray
     :param transpose: Calculate A (dot) AT instead
     :type transpose: bool
-    :param cast: Make internal copies to convert matrix to a float matrix or convert to a CSR matrix if necessary
+    :param cast: Make internal copies to convert matrix to a float matrix if necessary.
+    A CSC matrix is used directly as the CSR transpose and does not need to be converted.
     :type cast: bool
     :param dense: Produce a dense matrix output instead of a sparse matrix
     :type dense: bool
@@ -106,22 +186,156 @@ def gram_matrix_mkl(matrix, transpose=False, cast=False, dense=False, debug=Fals
     :type out: np.ndarray, None
     :param out_scalar: Multiply the out array by this scalar if provided.
     :type out_scalar: float, None
+    :param zero_copy: Return a sparse gram matrix which uses the memory allocated by MKL instead of copying it.
+    :type zero_copy: bool
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast, an
+    index cast, or a copy of MKL output).
+    A sparse gram matrix must also set zero_copy=True. Defaults to False.
+    :type strict_no_copy: bool
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" symmetric matrix.
+    A full sparse matrix is calculated directly as a sparse (dot) sparse product.
+    A full dense matrix is calculated as the upper triangle and then mirrored in place, so an out array must be
+    symmetric. Defaults to "upper".
+    :type symmetric: str
+    :param weights: Calculate the weighted gram matrix AT (dot) W (dot) A (or A (dot) W (dot) AT) for the diagonal
+    matrix W with these weights. A sparse upper triangular output is calculated with mkl_sparse_sypr and any weights.
+    Every other output is the gram matrix of a copy of A scaled by the square roots of the weights, which must not be
+    negative. Defaults to None.
+    :type weights: np.ndarray, None
     :return: Gram matrix
     :rtype: scipy.sparse.csr_matrix, np.ndarray"""
 
     warnings.warn("Set debug mode with sparse_dot_mkl.set_debug_mode(True)", DeprecationWarning) if debug else None
     print_mkl_debug()
 
-    return _gm(matrix, transpose=transpose, cast=cast, dense=dense, reorder_output=reorder_output,
-               out=out, out_scalar=out_scalar)
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), _instrumented_call("gram_matrix_mkl", matrix) as call:
+        return call.set_output(_gm(_unwrap_mkl_sparse(matrix), transpose=transpose, cast=cast, dense=dense,
+                                   reorder_output=reorder_output, out=out, out_scalar=out_scalar,
+                                   zero_copy=zero_copy, symmetric=symmetric, weights=weights))
+
+
+def covariance_mkl(matrix, transpose=False, ddof=1, cast=False, symmetric="full", threads=None, strict_no_copy=False):
+    """
+    Calculate the covariance matrix of the columns of a matrix, where each row is an observation.
+    The gram matrix AT (dot) A is calculated with MKL and the mean is subtracted from it afterwards, so a sparse
+    matrix is never centered or made dense.
+
+    :param matrix: Sparse matrix in CSR or CSC format or numpy array
+    :type matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, MKLSparseMatrix, numpy.ndarray
+    :param transpose: Calculate the covariance matrix of the rows, where each column is an observation
+    :type transpose: bool
+    :param ddof: Delta degrees of freedom; the covariance is divided by the number of observations minus ddof.
+    Defaults to 1.
+    :type ddof: int
+    :param cast: Make internal copies to convert matrix to a float matrix if necessary
+    :type cast: bool
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" symmetric matrix.
+    Defaults to "full".
+    :type symmetric: str
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast or an
+    index cast). Defaults to False.
+    :type strict_no_copy: bool
+    :return: Covariance matrix
+    :rtype: np.ndarray"""
+
+    print_mkl_debug()
+
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), _instrumented_call("covariance_mkl", matrix) as call:
+        return call.set_output(_cov(_unwrap_mkl_sparse(matrix), transpose=transpose, ddof=ddof, cast=cast,
+                                    symmetric=symmetric))
 
 
-def sparse_qr_solve_mkl(matrix_a, matrix_b, cast=False, debug=False):
+def correlation_mkl(matrix, transpose=False, cast=False, symmetric="full", threads=None, strict_no_copy=False):
+    """
+    Calculate the correlation matrix of the columns of a matrix, where each row is an observation.
+    This is the covariance matrix from covariance_mkl divided by the standard deviations of the columns.
+    The correlation of a column which does not vary is NaN.
+
+    :param matrix: Sparse matrix in CSR or CSC format or numpy array
+    :type matrix: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, MKLSparseMatrix, numpy.ndarray
+    :param transpose: Calculate the correlation matrix of the rows, where each column is an observation
+    :type transpose: bool
+    :param cast: Make internal copies to convert matrix to a float matrix if necessary
+    :type cast: bool
+    :param symmetric: Return the "upper" triangle, the "lower" triangle, or the "full" symmetric matrix.
+    Defaults to "full".
+    :type symmetric: str
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast or an
+    index cast). Defaults to False.
+    :type strict_no_copy: bool
+    :return: Correlation matrix
+    :rtype: np.ndarray"""
+
+    print_mkl_debug()
+
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), _instrumented_call("correlation_mkl", matrix) as call:
+        return call.set_output(_cov(_unwrap_mkl_sparse(matrix), transpose=transpose, cast=cast, symmetric=symmetric,
+                                    normalize=True))
+
+
+def triple_product_mkl(matrix_a, matrix_b, transpose=False, cast=False, reorder_output=False, scalar=1., out=None,
+                       out_scalar=None, zero_copy=False, fill_mode="upper", threads=None, strict_no_copy=False):
+    """
+    Calculate the symmetric triple product AT (dot) B (dot) A in one call, where A is sparse and B is symmetric.
+    A sparse B produces a sparse output with mkl_sparse_sypr, and a dense B produces a dense output with
+    mkl_sparse_?_syprd. Only the upper triangle of the output is calculated.
+
+    :param matrix_a: Sparse matrix A in CSR or CSC format
+    :type matrix_a: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, MKLSparseMatrix
+    :param matrix_b: Symmetric matrix B as a sparse matrix in CSR or CSC format or a 2d numpy array
+    :type matrix_b: scipy.sparse.csr_matrix, scipy.sparse.csc_matrix, MKLSparseMatrix, np.ndarray
+    :param transpose: Calculate A (dot) B (dot) AT instead
+    :type transpose: bool
+    :param cast: Make internal copies to convert matrices to float matrices if necessary
+    :type cast: bool
+    :param reorder_output: Should the array indices of a sparse output be reordered using MKL
+    :type reorder_output: bool
+    :param scalar: Multiply the triple product by this scalar
+    :type scalar: float
+    :param out: Add the triple product to this array if provided. B must be dense.
+    :type out: np.ndarray, None
+    :param out_scalar: Multiply the out array by this scalar if provided.
+    :type out_scalar: float, None
+    :param zero_copy: Return a sparse output which uses the memory allocated by MKL instead of copying it.
+    :type zero_copy: bool
+    :param fill_mode: The triangle of a sparse B which is stored and used ("upper" or "lower").
+    Defaults to "upper".
+    :type fill_mode: str
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast, an
+    index cast, or a copy of MKL output). A sparse output must also set zero_copy=True. Defaults to False.
+    :type strict_no_copy: bool
+    :return: Upper triangle of the triple product
+    :rtype: scipy.sparse.csr_matrix, np.ndarray"""
+
+    print_mkl_debug()
+
+    matrix_a, matrix_b = _unwrap_mkl_sparse(matrix_a), _unwrap_mkl_sparse(matrix_b)
+
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), \
+            _instrumented_call("triple_product_mkl", matrix_a, matrix_b) as call:
+        return call.set_output(_tp(matrix_a, matrix_b, transpose=transpose, cast=cast, reorder_output=reorder_output,
+                                   scalar=scalar, out=out, out_scalar=out_scalar, zero_copy=zero_copy,
+                                   fill_mode=fill_mode))
+
+
+def sparse_qr_solve_mkl(matrix_a, matrix_b, cast=False, debug=False, threads=None, strict_no_copy=False):
     """
     Solve AX = B for X where A is sparse and B is dense
 
     :param matrix_a: Sparse matrix (solver requires CSR; will convert if cast=True)
-    :type matrix_a: np.ndarray
+    :type matrix_a: scipy.sparse.csr_matrix, MKLSparseMatrix
     :param matrix_b: Dense matrix
     :type matrix_b: np.ndarray
     :param cast: Should the data be coerced into float64 if it isn't float32 or float64,
@@ -130,6 +344,12 @@ def sparse_qr_solve_mkl(matrix_a, matrix_b, cast=False, debug=False):
     :type cast: bool
     :param debug: Deprecated debug flag. Use `sparse_dot_mkl.set_debug_mode(True)`
     :type debug: bool
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast, an
+    index cast, a conversion to CSR, or a copy of MKL output). Defaults to False.
+    :type strict_no_copy: bool
     :return: Dense array X
     :rtype: np.ndarray
     """
@@ -137,7 +357,44 @@ def sparse_qr_solve_mkl(matrix_a, matrix_b, cast=False, debug=False):
     warnings.warn("Set debug mode with sparse_dot_mkl.set_debug_mode(True)", DeprecationWarning) if debug else None
     print_mkl_debug()
 
-    return _qrs(matrix_a, matrix_b, cast=cast)
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), \
+            _instrumented_call("sparse_qr_solve_mkl", matrix_a, matrix_b) as call:
+        return call.set_output(_qrs(_unwrap_mkl_sparse(matrix_a), matrix_b, cast=cast))
+
+
+def estimate_product_nnz(matrix_a, matrix_b, cast=False, threads=None, strict_no_copy=False):
+    """
+    Count the non-zero values in the sparse (dot) sparse product A (dot) B without computing it.
+    This is exact, and it is much cheaper than the product itself.
+
+    :param matrix_a: Sparse matrix A in CSR or CSC format
+    :type matrix_a: scipy.sparse.spmatrix, MKLSparseMatrix
+    :param matrix_b: Sparse matrix B in the same format as A
+    :type matrix_b: scipy.sparse.spmatrix, MKLSparseMatrix
+    :param cast: Should the data be coerced into float64 if it isn't float32 or float64
+    If set to True and any other dtype is passed, the matrix data will be copied internally
+    If set to False and any dtype that isn't float32 or float64 is passed, a ValueError will be raised
+    :type cast: bool
+    :param threads: Number of threads MKL should use for this call. This only affects the calling python thread.
+    Defaults to None, which uses the current MKL setting.
+    :type threads: int, None
+    :param strict_no_copy: Raise a ValueError instead of making any implicit copy of an array (a dtype cast, an
+    index cast, a conversion to CSR, or a copy of MKL output). Defaults to False.
+    :type strict_no_copy: bool
+    :return: A dict with keys:
+    "shape": the output shape,
+    "nnz": the total number of non-zero values in the output,
+    "row_nnz" (CSR) or "col_nnz" (CSC): the number of non-zero values in each output row or column,
+    "bytes": the memory needed for the output, as bytes["csr" or "csc"][data dtype][index dtype] or
+    bytes["dense"][data dtype]
+    :rtype: dict
+    """
+
+    print_mkl_debug()
+
+    with _mkl_call(threads), _no_copy_call(strict_no_copy), \
+            _instrumented_call("estimate_product_nnz", matrix_a, matrix_b) as call:
+        return call.set_output(_epn(_unwrap_mkl_sparse(matrix_a), _unwrap_mkl_sparse(matrix_b), cast=cast))
 
   
 # Alias for backwards compatibility
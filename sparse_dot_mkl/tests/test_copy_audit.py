@@ -0,0 +1,116 @@
+import unittest
+import warnings
+import numpy as np
+import numpy.testing as npt
+from sparse_dot_mkl import (dot_product_mkl, gram_matrix_mkl, set_copy_audit_mode, get_copy_audit, reset_copy_audit,
+                            prepare_mkl, record_events)
+from sparse_dot_mkl._mkl_instrumentation import _THREAD_STATE, _COPY_AUDIT
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, VECTOR
+
+
+class TestCopyAudit(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = prepare_mkl(MATRIX_1.copy())
+        self.mat2 = prepare_mkl(MATRIX_2.copy())
+        self.vec = VECTOR.copy()
+        reset_copy_audit()
+
+    def tearDown(self):
+        set_copy_audit_mode("ignore")
+        reset_copy_audit()
+        self.assertFalse(_THREAD_STATE.strict_no_copy)
+
+    def test_ignore(self):
+        self.assertEqual(_COPY_AUDIT["mode"], "ignore")
+
+        dot_product_mkl(self.mat1.astype(np.int64), self.mat2, cast=True)
+        self.assertEqual(get_copy_audit(), {})
+
+    def test_count(self):
+        set_copy_audit_mode("count")
+
+        mat1_int = self.mat1.astype(np.int64)
+        dot_product_mkl(mat1_int, self.mat2, cast=True)
+
+        audit = get_copy_audit()
+        self.assertEqual(audit["cast from int64 to float64"]["count"], 1)
+        self.assertEqual(audit["cast from int64 to float64"]["bytes"],
+                         mat1_int.data.size * 8 + mat1_int.indices.nbytes + mat1_int.indptr.nbytes)
+        self.assertEqual(audit["copy of MKL csr output"]["count"], 1)
+        self.assertGreater(audit["copy of MKL csr output"]["bytes"], 0)
+
+        reset_copy_audit()
+        dot_product_mkl(self.mat1, self.mat2, zero_copy=True)
+        self.assertEqual(get_copy_audit(), {})
+
+    def test_conversion(self):
+        set_copy_audit_mode("count")
+
+        dot_product_mkl(self.mat1.tocsc(), np.asarray(self.mat2.A, order="F"))
+        gram_matrix_mkl(self.mat1.tocsc(), cast=True, dense=True)
+
+        audit = get_copy_audit()
+        self.assertIn("conversion of a csc matrix to CSR for a F-ordered dense array", audit)
+
+        # A CSC matrix is used as the CSR transpose for a gram matrix
+        self.assertNotIn("conversion of a csc matrix to CSR for a gram matrix", audit)
+
+    def test_warn(self):
+        set_copy_audit_mode("warn")
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            dot_product_mkl(self.mat1, self.vec.astype(np.float32), cast=True)
+
+        self.assertTrue(any(issubclass(x.category, RuntimeWarning) for x in w))
+        self.assertEqual(get_copy_audit()["cast from float32 to float64"]["count"], 1)
+
+    def test_raise(self):
+        set_copy_audit_mode("raise")
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.vec.astype(np.float32), cast=True)
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.vec), self.mat1.dot(self.vec))
+
+        with self.assertRaises(ValueError):
+            set_copy_audit_mode("not a mode")
+
+    def test_strict_no_copy(self):
+        set_copy_audit_mode("count")
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, strict_no_copy=True)
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(MATRIX_1.astype(np.float32), self.vec, cast=True, strict_no_copy=True)
+
+        with self.assertRaises(ValueError):
+            gram_matrix_mkl(self.mat1, strict_no_copy=True)
+
+        self.assertFalse(_THREAD_STATE.strict_no_copy)
+
+        # Zero-copy paths are allowed
+        mat3 = dot_product_mkl(self.mat1, self.mat2, zero_copy=True, strict_no_copy=True)
+        npt.assert_array_almost_equal(mat3.A, self.mat1.dot(self.mat2).A)
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.vec, strict_no_copy=True),
+                                      self.mat1.dot(self.vec))
+
+        gram_matrix_mkl(self.mat1, zero_copy=True, strict_no_copy=True)
+
+        # Copies which were not allowed are still counted
+        self.assertEqual(get_copy_audit()["copy of MKL csr output"]["count"], 2)
+
+    def test_events(self):
+        with record_events(thread_only=True) as events:
+            dot_product_mkl(self.mat1, self.mat2)
+            dot_product_mkl(self.mat1, self.mat2, zero_copy=True)
+
+        self.assertEqual([c["reason"] for c in events[0]["copies"]], ["copy of MKL csr output"])
+        self.assertEqual(events[1]["copies"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from sparse_dot_mkl import covariance_mkl, correlation_mkl, MKLSparseMatrix
+from sparse_dot_mkl._gram_matrix import _center_upper_triangle
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1
+
+
+class TestCovariance(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cov = np.cov(MATRIX_1.A, rowvar=False)
+        cls.cov_t = np.cov(MATRIX_1.A)
+        cls.corr = np.corrcoef(MATRIX_1.A, rowvar=False)
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat1_d = MATRIX_1.A
+
+    def test_covariance(self):
+        for mat in (self.mat1, self.mat1.tocsc(), self.mat1_d, np.asarray(self.mat1_d, order="F")):
+            npt.assert_array_almost_equal(covariance_mkl(mat), self.cov)
+
+        npt.assert_array_almost_equal(covariance_mkl(self.mat1, transpose=True), self.cov_t)
+        npt.assert_array_almost_equal(covariance_mkl(self.mat1, ddof=0), np.cov(self.mat1_d, rowvar=False, ddof=0))
+
+        with MKLSparseMatrix(self.mat1) as mkl_mat:
+            npt.assert_array_almost_equal(covariance_mkl(mkl_mat), self.cov)
+
+    def test_correlation(self):
+        for mat in (self.mat1, self.mat1.tocsc(), self.mat1_d):
+            npt.assert_array_almost_equal(correlation_mkl(mat), self.corr)
+
+        npt.assert_array_almost_equal(correlation_mkl(self.mat1, transpose=True), np.corrcoef(self.mat1_d))
+
+    def test_symmetric(self):
+        npt.assert_array_almost_equal(covariance_mkl(self.mat1, symmetric="upper"), np.triu(self.cov))
+        npt.assert_array_almost_equal(covariance_mkl(self.mat1, symmetric="lower"), np.tril(self.cov))
+        npt.assert_array_almost_equal(correlation_mkl(self.mat1_d, symmetric="upper"), np.triu(self.corr))
+
+    def test_single(self):
+        cov = covariance_mkl(self.mat1.astype(np.float32))
+        self.assertEqual(cov.dtype, np.float32)
+        npt.assert_allclose(cov, self.cov, rtol=1e-3, atol=1e-4)
+
+    def test_constant_column(self):
+        mat1 = self.mat1_d.copy()
+        mat1[:, 0] = 1.
+
+        self.assertTrue(np.all(np.isnan(correlation_mkl(mat1)[0])))
+        npt.assert_array_almost_equal(covariance_mkl(mat1)[0], np.zeros(mat1.shape[1]))
+
+    def test_bands(self):
+        data = np.random.default_rng(12).random((700, 600))
+        gram = data.T @ data
+
+        _center_upper_triangle(gram, data.shape[0], data.mean(axis=0), normalize=True)
+        npt.assert_array_almost_equal(np.triu(gram), np.triu(np.corrcoef(data, rowvar=False)))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            covariance_mkl(self.mat1[0:1])
+
+        with self.assertRaises(ValueError):
+            covariance_mkl(self.mat1, symmetric="both")
+
+        with self.assertRaises(ValueError):
+            covariance_mkl(self.mat1.astype(np.int64))
+
+
+if __name__ == '__main__':
+    unittest.main()
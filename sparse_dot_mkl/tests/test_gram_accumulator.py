@@ -0,0 +1,99 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import GramAccumulator
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1
+
+
+def _row_blocks(matrix, block_rows=45):
+    for start in range(0, matrix.shape[0], block_rows):
+        yield matrix[start:start + block_rows]
+
+
+class TestGramAccumulator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gram = np.dot(MATRIX_1.A.T, MATRIX_1.A)
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat1_d = MATRIX_1.A
+
+    def test_dense_output(self):
+        for blocks in (_row_blocks(self.mat1), _row_blocks(self.mat1.tocsc()), _row_blocks(self.mat1_d),
+                       (np.asarray(b, order="F") for b in _row_blocks(self.mat1_d))):
+            acc = GramAccumulator(self.mat1.shape[1]).add_blocks(blocks)
+
+            self.assertEqual(acc.n_rows, self.mat1.shape[0])
+            self.assertEqual(acc.n_blocks, 5)
+            npt.assert_array_almost_equal(acc.result(), np.triu(self.gram))
+
+    def test_symmetric(self):
+        acc = GramAccumulator(self.mat1.shape[1], symmetric="lower").add_blocks(_row_blocks(self.mat1))
+        npt.assert_array_almost_equal(acc.result(), np.tril(self.gram))
+
+        acc = GramAccumulator(self.mat1.shape[1], symmetric="full").add_blocks(_row_blocks(self.mat1_d))
+        npt.assert_array_almost_equal(acc.result(), self.gram)
+
+        acc = GramAccumulator(self.mat1.shape[1], dense=False, symmetric="full").add_blocks(_row_blocks(self.mat1))
+        npt.assert_array_almost_equal(acc.result().A, self.gram)
+
+    def test_sparse_output(self):
+        acc = GramAccumulator(self.mat1.shape[1], dense=False)
+        npt.assert_array_almost_equal(acc.result().A, np.zeros(self.gram.shape))
+
+        acc.add_blocks(_row_blocks(self.mat1), prefetch=False)
+        acc.add(_spsparse.csr_matrix((10, self.mat1.shape[1])))
+
+        gram = acc.result()
+        self.assertTrue(_spsparse.isspmatrix_csr(gram))
+        npt.assert_array_almost_equal(gram.A, np.triu(self.gram))
+        self.assertEqual(acc.n_rows, self.mat1.shape[0] + 10)
+
+    def test_result_copy(self):
+        acc = GramAccumulator(self.mat1.shape[1]).add(self.mat1[:100])
+        partial = acc.result()
+
+        acc.add(self.mat1[100:])
+        npt.assert_array_almost_equal(acc.result(copy=False), np.triu(self.gram))
+        self.assertFalse(np.allclose(partial, acc.result()))
+
+    def test_single(self):
+        acc = GramAccumulator(self.mat1.shape[1], dtype=np.float32)
+
+        with self.assertRaises(ValueError):
+            acc.add(self.mat1)
+
+        # A block which wasn't added isn't counted
+        self.assertEqual((acc.n_rows, acc.n_blocks), (0, 0))
+
+        acc = GramAccumulator(self.mat1.shape[1], dtype=np.float32, cast=True).add_blocks(_row_blocks(self.mat1))
+        self.assertEqual(acc.result().dtype, np.float32)
+        npt.assert_allclose(acc.result(), np.triu(self.gram), rtol=1e-4, atol=1e-4)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            GramAccumulator(self.mat1.shape[1], symmetric="both")
+
+        with self.assertRaises(ValueError):
+            GramAccumulator(self.mat1.shape[1], dtype=np.int64)
+
+        with self.assertRaises(ValueError):
+            GramAccumulator(self.mat1.shape[1]).add(self.mat1.T)
+
+        with self.assertRaises(ValueError):
+            GramAccumulator(self.mat1.shape[1], dense=False).add(self.mat1_d)
+
+        # Errors from the generator are raised in the calling thread
+        def _failing_blocks():
+            yield self.mat1[:100]
+            raise IOError("Shard could not be read")
+
+        with self.assertRaises(IOError):
+            GramAccumulator(self.mat1.shape[1]).add_blocks(_failing_blocks())
+
+
+if __name__ == '__main__':
+    unittest.main()
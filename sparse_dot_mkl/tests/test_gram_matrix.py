@@ -1,7 +1,9 @@
 import unittest
 import numpy as np
 import numpy.testing as npt
-from sparse_dot_mkl import gram_matrix_mkl
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import gram_matrix_mkl, prepare_mkl
+from sparse_dot_mkl._gram_matrix import _fill_lower_triangle
 from sparse_dot_mkl.tests.test_mkl import MATRIX_1
 
 
@@ -28,6 +30,14 @@ class TestGramMatrix(unittest.TestCase):
         with self.assertRaises(ValueError):
             gram_matrix_mkl(self.mat1, out=np.zeros((self.mat1.shape[0], self.mat1.shape[0])))
 
+    def test_gram_matrix_sp_zero_copy(self):
+        mat2 = gram_matrix_mkl(self.mat1, zero_copy=True)
+        npt.assert_array_almost_equal(mat2.A, self.gram_ut)
+        self.assertFalse(mat2.data.flags.owndata)
+
+        mat2 = gram_matrix_mkl(self.mat1, transpose=True, reorder_output=True, zero_copy=True)
+        npt.assert_array_almost_equal(mat2.A, self.gram_ut_t)
+
     def test_gram_matrix_sp_single(self):
         mat2 = gram_matrix_mkl(self.mat1.astype(np.float32))
         npt.assert_array_almost_equal(mat2.A, self.gram_ut)
@@ -64,11 +74,27 @@ class TestGramMatrix(unittest.TestCase):
         npt.assert_array_almost_equal(mat2, self.gram_ut_t)
 
     def test_gram_matrix_csc_sp(self):
-        mat2 = gram_matrix_mkl(self.mat1.tocsc(), cast=True)
+        mat2 = gram_matrix_mkl(self.mat1.tocsc())
         npt.assert_array_almost_equal(mat2.A, self.gram_ut)
 
+        mat2 = gram_matrix_mkl(self.mat1.tocsc(), transpose=True, zero_copy=True)
+        npt.assert_array_almost_equal(mat2.A, self.gram_ut_t)
+
     def test_gram_matrix_csc_d(self):
-        mat2 = gram_matrix_mkl(self.mat1.tocsc(), dense=True, cast=True)
+        mat2 = gram_matrix_mkl(self.mat1.tocsc(), dense=True)
+        npt.assert_array_almost_equal(mat2, self.gram_ut)
+
+        mat2 = gram_matrix_mkl(self.mat1.tocsc(), dense=True, transpose=True)
+        npt.assert_array_almost_equal(mat2, self.gram_ut_t)
+
+    def test_gram_matrix_csc_no_copy(self):
+        # Indices of the integer type for the interface this call will use, so only the CSC handling could copy
+        mat1_csc = prepare_mkl(self.mat1.tocsc())
+
+        mat2 = gram_matrix_mkl(mat1_csc, zero_copy=True, strict_no_copy=True)
+        npt.assert_array_almost_equal(mat2.A, self.gram_ut)
+
+        mat2 = gram_matrix_mkl(mat1_csc, dense=True, strict_no_copy=True)
         npt.assert_array_almost_equal(mat2, self.gram_ut)
 
     def test_gram_matrix_dd_double(self):
@@ -104,3 +130,61 @@ class TestGramMatrix(unittest.TestCase):
                                out=np.zeros((self.mat1.shape[1], self.mat1.shape[1]), dtype=np.float32, order="F"),
                                out_scalar=1.)
         npt.assert_array_almost_equal(mat2, self.gram_ut)
+
+
+class TestGramMatrixSymmetric(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gram = np.dot(MATRIX_1.A.T, MATRIX_1.A)
+        cls.gram_t = np.dot(MATRIX_1.A, MATRIX_1.A.T)
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat1_d = MATRIX_1.A
+
+    def test_sparse_lower(self):
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, symmetric="lower").A, np.tril(self.gram))
+
+        mat2 = gram_matrix_mkl(self.mat1, transpose=True, reorder_output=True, zero_copy=True, symmetric="lower")
+        npt.assert_array_almost_equal(mat2.A, np.tril(self.gram_t))
+        self.assertTrue(_spsparse.isspmatrix_csr(mat2))
+
+    def test_sparse_full(self):
+        for mat in (self.mat1, self.mat1.tocsc()):
+            mat2 = gram_matrix_mkl(mat, symmetric="full", reorder_output=True)
+            npt.assert_array_almost_equal(mat2.A, self.gram)
+            self.assertTrue(_spsparse.isspmatrix_csr(mat2))
+
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, transpose=True, symmetric="full").A, self.gram_t)
+
+    def test_sparse_to_dense(self):
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, dense=True, symmetric="lower"), np.tril(self.gram))
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, dense=True, symmetric="full"), self.gram)
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, dense=True, transpose=True, symmetric="full"),
+                                      self.gram_t)
+
+        out = self.gram.copy()
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, dense=True, symmetric="full", out=out,
+                                                      out_scalar=2.),
+                                      self.gram * 3)
+
+    def test_dense(self):
+        for arr in (self.mat1_d, np.asarray(self.mat1_d, order="F")):
+            npt.assert_array_almost_equal(gram_matrix_mkl(arr, symmetric="lower"), np.tril(self.gram))
+            npt.assert_array_almost_equal(gram_matrix_mkl(arr, symmetric="full"), self.gram)
+
+    def test_fill_lower_triangle(self):
+        arr = np.arange(600 ** 2, dtype=float).reshape(600, 600)
+
+        mirrored = arr.copy()
+        _fill_lower_triangle(mirrored, mirror=True)
+        npt.assert_array_equal(mirrored, np.triu(arr) + np.triu(arr, k=1).T)
+
+        zeroed = arr.copy()
+        _fill_lower_triangle(zeroed.T)
+        npt.assert_array_equal(zeroed, np.tril(arr))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            gram_matrix_mkl(self.mat1, symmetric="both")
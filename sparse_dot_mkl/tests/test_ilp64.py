@@ -0,0 +1,133 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import dot_product_mkl, gram_matrix_mkl, sparse_qr_solve_mkl, MKLSparseMatrix
+from sparse_dot_mkl._mkl_interface import (MKL, MKL64, _choose_interface, _create_mkl_sparse, _handle_interface,
+                                           _destroy_mkl_handle, _export_mkl, _mkl_init)
+from sparse_dot_mkl._sparse_sparse import _product_interface, _inner_nnz
+from sparse_dot_mkl.tests import test_sparse_sparse, test_sparse_dense, test_sparse_vector, test_gram_matrix
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, VECTOR
+
+_mkl_init()
+ILP64_AVAILABLE = MKL64.MKL_INT is not None and MKL.MKL_INT_NUMPY != np.int64
+
+
+@unittest.skipUnless(ILP64_AVAILABLE, "The ILP64 interface is not available in addition to LP64")
+class _ForceILP64:
+    """Run a test class with every call dispatched to the ILP64 interface"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._lp64_max = MKL.MKL_LP64_MAX
+        MKL.MKL_LP64_MAX = 0
+
+    @classmethod
+    def tearDownClass(cls):
+        MKL.MKL_LP64_MAX = cls._lp64_max
+        super().tearDownClass()
+
+
+class TestMultiplicationCSRILP64(_ForceILP64, test_sparse_sparse.TestMultiplicationCSR):
+    pass
+
+
+class TestMultiplicationBSRILP64(_ForceILP64, test_sparse_sparse.TestMultiplicationBSR):
+    pass
+
+
+class TestSparseToDenseMultiplicationILP64(_ForceILP64, test_sparse_sparse.TestSparseToDenseMultiplication):
+    pass
+
+
+class TestSparseProductPlanILP64(_ForceILP64, test_sparse_sparse.TestSparseProductPlanCSR):
+    pass
+
+
+class TestSparseDenseFMultiplicationILP64(_ForceILP64, test_sparse_dense.TestSparseDenseFMultiplication):
+    pass
+
+
+class TestSparseVectorMultiplicationCSCILP64(_ForceILP64, test_sparse_vector.TestSparseVectorMultiplicationCSC):
+    pass
+
+
+class TestGramMatrixILP64(_ForceILP64, test_gram_matrix.TestGramMatrix):
+    pass
+
+
+@unittest.skipUnless(ILP64_AVAILABLE, "The ILP64 interface is not available in addition to LP64")
+class TestInterfaceChoice(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+        self.lp64_max = MKL.MKL_LP64_MAX
+
+    def tearDown(self):
+        MKL.MKL_LP64_MAX = self.lp64_max
+
+    def test_choose_interface(self):
+        self.assertIs(_choose_interface(self.mat1, self.mat2), MKL)
+        self.assertIs(_choose_interface(self.mat1, output_size=int(self.lp64_max) + 1), MKL64)
+
+        MKL.MKL_LP64_MAX = self.mat1.nnz - 1
+        self.assertIs(_choose_interface(self.mat1), MKL64)
+        self.assertIs(_choose_interface(self.mat1.A), MKL)
+
+    def test_product_bound(self):
+        _output_nnz = self.mat1.dot(self.mat2).nnz
+        _bound = int(np.dot(_inner_nnz(self.mat1, 1), _inner_nnz(self.mat2, 0)))
+        self.assertGreaterEqual(_bound, _output_nnz)
+
+        npt.assert_array_equal(_inner_nnz(self.mat1, 1), _inner_nnz(self.mat1.tocsc(), 1))
+        npt.assert_array_equal(_inner_nnz(self.mat1, 0), _inner_nnz(self.mat1.tocsc(), 0))
+
+        # The output is too large for LP64 but the non-zero bound is not
+        MKL.MKL_LP64_MAX = _bound
+        self.assertIs(_product_interface(self.mat1, self.mat2), MKL)
+
+        MKL.MKL_LP64_MAX = _bound - 1
+        self.assertIs(_product_interface(self.mat1, self.mat2), MKL64)
+
+    def test_handle_interface(self):
+        MKL.MKL_LP64_MAX = 0
+
+        ref, dbl = _create_mkl_sparse(self.mat1)
+        self.assertIs(_handle_interface(ref), MKL64)
+
+        mat1_export = _export_mkl(ref, dbl, output_type="csr")
+        npt.assert_array_almost_equal(mat1_export.A, self.mat1.A)
+        _destroy_mkl_handle(ref)
+
+        # The input matrix indices are not changed
+        self.assertEqual(self.mat1.indices.dtype, MATRIX_1.indices.dtype)
+
+    def test_persistent_handle_not_changed(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            self.assertIs(_handle_interface(mkl_1.handle), MKL)
+            indices = mkl_1.matrix.indices
+
+            MKL.MKL_LP64_MAX = 0
+
+            npt.assert_array_almost_equal(dot_product_mkl(mkl_1, VECTOR), self.mat1.dot(VECTOR))
+            npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.mat2).A, self.mat1.dot(self.mat2).A)
+
+            ref, _ = _create_mkl_sparse(mkl_1.matrix, mkl=MKL64)
+            self.assertIsNot(ref, mkl_1.handle)
+            _destroy_mkl_handle(ref)
+
+            self.assertIs(mkl_1.matrix.indices, indices)
+
+    def test_qr_uses_lp64(self):
+        MKL.MKL_LP64_MAX = 0
+
+        mat_a = _spsparse.diags(self.mat1.data[0:100].copy(), format="csr")
+        mat_b = self.mat1.data[0:100].copy().reshape(-1, 1)
+
+        npt.assert_array_almost_equal(sparse_qr_solve_mkl(mat_a, mat_b), np.ones_like(mat_b))
+
+    def test_dense_gram_matrix(self):
+        MKL.MKL_LP64_MAX = 0
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1.A), np.triu(np.dot(self.mat1.A.T, self.mat1.A)))
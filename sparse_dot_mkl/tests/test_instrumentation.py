@@ -0,0 +1,162 @@
+import threading
+import unittest
+import warnings
+import numpy as np
+import numpy.testing as npt
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import (dot_product_mkl, gram_matrix_mkl, estimate_product_nnz, SparseQR, SparseProductPlan,
+                            MKLSparseMatrix, add_event_callback, remove_event_callback, record_events)
+from sparse_dot_mkl._mkl_instrumentation import PHASES, _CALLBACKS, _THREAD_STATE, _timed_phase
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, VECTOR
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+        self.vec = VECTOR.copy()
+
+    def tearDown(self):
+        self.assertEqual(len(_CALLBACKS), 0)
+        self.assertIsNone(_THREAD_STATE.timer)
+
+    def test_sparse_sparse_event(self):
+        with record_events(thread_only=True) as events:
+            mat3 = dot_product_mkl(self.mat1, self.mat2, reorder_output=True)
+
+        self.assertEqual(len(events), 1)
+        event = events[0]
+
+        self.assertEqual(event["operation"], "dot_product_mkl")
+        self.assertEqual(event["inputs"][0], {"shape": (200, 300), "nnz": self.mat1.nnz, "dtype": "float64",
+                                              "layout": "csr"})
+        self.assertEqual(event["inputs"][1]["shape"], (300, 100))
+        self.assertEqual(event["output"], {"shape": (200, 100), "nnz": mat3.nnz, "dtype": "float64",
+                                           "layout": "csr"})
+        self.assertIsNone(event["error"])
+        self.assertGreaterEqual(event["threads"], 1)
+        self.assertEqual(event["thread"], threading.get_ident())
+
+        self.assertEqual(set(event["phases"].keys()), set(PHASES))
+
+        for phase in ("validation", "handle_creation", "compute", "reorder", "export", "handle_destruction"):
+            self.assertGreater(event["phases"][phase], 0., msg=phase)
+
+        # Nested phases are not counted twice
+        self.assertLessEqual(sum(event["phases"].values()), event["time"] * 1.0001)
+
+    def test_dense_events(self):
+        mat2_d = np.asarray(self.mat2.A, order="F")
+
+        with record_events(thread_only=True) as events:
+            dot_product_mkl(self.mat1.tocsc(), mat2_d)
+            dot_product_mkl(self.mat1, self.vec)
+            dot_product_mkl(self.mat1.A, mat2_d)
+            gram_matrix_mkl(self.mat1, dense=True)
+
+        self.assertEqual([e["operation"] for e in events], ["dot_product_mkl"] * 3 + ["gram_matrix_mkl"])
+        self.assertEqual(events[0]["inputs"][1]["layout"], "F")
+        self.assertIsNone(events[0]["inputs"][1]["nnz"])
+        self.assertGreater(events[0]["phases"]["conversion"], 0.)
+        self.assertEqual(events[1]["output"]["shape"], (200,))
+
+        for event in events:
+            self.assertGreater(event["phases"]["compute"], 0.)
+
+    def test_estimate_event(self):
+        with record_events(thread_only=True) as events:
+            estimate = estimate_product_nnz(self.mat1, self.mat2)
+
+        self.assertEqual(events[0]["operation"], "estimate_product_nnz")
+        self.assertEqual(events[0]["output"], {"shape": (200, 100), "nnz": estimate["nnz"], "dtype": None,
+                                               "layout": None})
+
+    def test_optimize_event(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            with record_events(thread_only=True) as events:
+                dot_product_mkl(mkl_1, self.vec, optimize=3)
+
+        self.assertGreater(events[0]["phases"]["optimize"], 0.)
+        self.assertEqual(events[0]["phases"]["conversion"], 0.)
+
+    def test_objects(self):
+        with record_events(thread_only=True) as events:
+            with SparseProductPlan(self.mat1, self.mat2) as plan:
+                plan.execute()
+
+            with SparseQR((self.mat1[:, :200] + _spsparse.eye(200)).tocsr()) as qr:
+                qr.solve(self.vec[:200])
+
+        self.assertEqual([e["operation"] for e in events], ["SparseProductPlan.execute", "SparseQR.solve"])
+
+    def test_error_event(self):
+        with record_events(thread_only=True) as events:
+            with self.assertRaises(ValueError):
+                dot_product_mkl(self.mat1, self.mat1)
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["error"], "ValueError")
+        self.assertIsNone(events[0]["output"])
+
+    def test_callbacks(self):
+        events = []
+
+        add_event_callback(events.append)
+        dot_product_mkl(self.mat1, self.vec)
+        remove_event_callback(events.append)
+        dot_product_mkl(self.mat1, self.vec)
+
+        # Callbacks also get the events from calls on any other threads
+        self.assertEqual(len([e for e in events if e["thread"] == threading.get_ident()]), 1)
+
+        with self.assertRaises(ValueError):
+            remove_event_callback(events.append)
+
+        with self.assertRaises(ValueError):
+            add_event_callback("not a function")
+
+    def test_callback_error(self):
+        def _bad_callback(event):
+            raise RuntimeError
+
+        add_event_callback(_bad_callback)
+
+        try:
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.vec), self.mat1.dot(self.vec))
+
+            self.assertTrue(any(issubclass(x.category, RuntimeWarning) for x in w))
+        finally:
+            remove_event_callback(_bad_callback)
+
+    def test_threads(self):
+        events = {}
+
+        def _product(name):
+            with record_events() as all_events, record_events(thread_only=True) as thread_events:
+                dot_product_mkl(self.mat1, self.vec)
+            events[name] = all_events, thread_events, threading.get_ident()
+
+        workers = [threading.Thread(target=_product, args=(i,)) for i in range(4)]
+        [w.start() for w in workers]
+        [w.join() for w in workers]
+
+        # Each recorder sees at least its own call, and a thread_only recorder sees only its own call
+        for all_events, thread_events, thread in events.values():
+            self.assertGreaterEqual(len(all_events), 1)
+            self.assertTrue(all(e["operation"] == "dot_product_mkl" for e in all_events))
+            self.assertEqual([e["thread"] for e in thread_events], [thread])
+
+    def test_disabled(self):
+        self.assertIsNone(_THREAD_STATE.timer)
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.vec), self.mat1.dot(self.vec))
+        self.assertIsNone(_THREAD_STATE.timer)
+
+        with self.assertRaises(ValueError):
+            _timed_phase("not a phase")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import dot_product_mkl, gram_matrix_mkl, MKLSparseMatrix
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2
+
+
+class TestMatrixStructure(unittest.TestCase):
+
+    def setUp(self):
+        self.gram = (MATRIX_1.T @ MATRIX_1).tocsr()
+        self.gram_d = self.gram.A
+        self.upper = _spsparse.triu(self.gram, format="csr")
+        self.lower = _spsparse.tril(self.gram, format="csr")
+
+        self.dense_c = np.asarray(MATRIX_2.A[:, :20], order="C")
+        self.dense_f = np.asarray(MATRIX_2.A[:, :20], order="F")
+        self.vec = MATRIX_2.A[:, 0].copy()
+
+    def test_symmetric_vector(self):
+        npt.assert_array_almost_equal(dot_product_mkl(self.upper, self.vec, structure="symmetric"),
+                                      np.dot(self.gram_d, self.vec))
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.lower, self.vec, structure="symmetric", fill_mode="lower"),
+                                      np.dot(self.gram_d, self.vec))
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.vec, self.upper, structure="symmetric"),
+                                      np.dot(self.vec, self.gram_d))
+
+    def test_symmetric_dense(self):
+        for arr in (self.dense_c, self.dense_f):
+            npt.assert_array_almost_equal(dot_product_mkl(self.upper, arr, structure="symmetric"),
+                                          np.dot(self.gram_d, arr))
+
+            npt.assert_array_almost_equal(dot_product_mkl(arr.T, self.upper, structure="symmetric"),
+                                          np.dot(arr.T, self.gram_d))
+
+    def test_gram_output(self):
+        gram = gram_matrix_mkl(MATRIX_1, reorder_output=True)
+
+        npt.assert_array_almost_equal(dot_product_mkl(gram, self.dense_c, structure="symmetric"),
+                                      np.dot(self.gram_d, self.dense_c))
+
+    def test_triangular(self):
+        npt.assert_array_almost_equal(dot_product_mkl(self.gram, self.vec, structure="triangular"),
+                                      np.dot(self.upper.A, self.vec))
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.gram, self.dense_c, structure="triangular",
+                                                      fill_mode="lower"),
+                                      np.dot(self.lower.A, self.dense_c))
+
+        unit_upper = self.upper.A
+        np.fill_diagonal(unit_upper, 1.)
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.upper, self.vec, structure="triangular",
+                                                      diagonal="unit"),
+                                      np.dot(unit_upper, self.vec))
+
+    def test_diagonal(self):
+        npt.assert_array_almost_equal(dot_product_mkl(self.gram, self.vec, structure="diagonal"),
+                                      self.gram.diagonal() * self.vec)
+
+    def test_optimize(self):
+        with MKLSparseMatrix(self.upper) as mkl_upper:
+            mat3 = dot_product_mkl(mkl_upper, self.vec, structure="symmetric", optimize=5)
+            npt.assert_array_almost_equal(mat3, np.dot(self.gram_d, self.vec))
+
+            self.assertEqual(len(mkl_upper.hints), 1)
+            self.assertEqual(len(list(mkl_upper.hints.keys())[0]), 5)
+
+            mkl_upper.optimize(5, structure="symmetric")
+            self.assertEqual(len(mkl_upper.hints), 1)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            dot_product_mkl(MATRIX_1, self.vec[:MATRIX_1.shape[1]], structure="symmetric")
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.upper, self.vec, structure="hermitian")
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.upper, self.vec, structure="symmetric", fill_mode="full")
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.upper, self.vec, structure="triangular", diagonal="ones")
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.upper, self.upper, structure="symmetric")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import gc
+import unittest
+import numpy as np
+import numpy.testing as npt
+from sparse_dot_mkl import (dot_product_mkl, gram_matrix_mkl, memory_stats, release_memory, set_peak_memory_tracking,
+                            MKLSparseMatrix)
+from sparse_dot_mkl._mkl_interface import _create_mkl_sparse, _destroy_mkl_handle, _LIVE_HANDLES
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, VECTOR
+
+
+class TestMemoryStats(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+        self.vec = VECTOR.copy()
+
+    def test_memory_stats(self):
+        stats = memory_stats()
+
+        self.assertEqual(set(stats.keys()), {"mkl_bytes", "mkl_buffers", "mkl_peak_bytes", "live_handles",
+                                             "persistent_handles"})
+        self.assertGreaterEqual(stats["mkl_bytes"], 0)
+        self.assertGreaterEqual(stats["mkl_buffers"], 0)
+
+    def test_peak_memory(self):
+        set_peak_memory_tracking(True)
+
+        try:
+            dot_product_mkl(self.mat1, self.mat2)
+            self.assertGreaterEqual(memory_stats(reset_peak=True)["mkl_peak_bytes"], 0)
+        finally:
+            set_peak_memory_tracking(False)
+
+        self.assertIsNone(memory_stats()["mkl_peak_bytes"])
+
+    def test_live_handles(self):
+        live = len(_LIVE_HANDLES)
+
+        # Products destroy every temporary handle
+        dot_product_mkl(self.mat1, self.mat2)
+        dot_product_mkl(self.mat1, self.vec)
+        dot_product_mkl(self.mat1.tocsc(), self.mat2.A.copy(order="F"))
+        gram_matrix_mkl(self.mat1)
+        self.assertEqual(len(_LIVE_HANDLES), live)
+
+        # Failed products don't leak handles
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, out=np.ones((self.mat2.shape[1], self.mat1.shape[0])))
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, out=np.ones((self.mat1.shape[0], self.mat2.shape[1]),
+                                                              dtype=np.float32))
+
+        self.assertEqual(len(_LIVE_HANDLES), live)
+
+        # A zero-copy output keeps its handle alive until it is garbage collected
+        mat3 = dot_product_mkl(self.mat1, self.mat2, zero_copy=True)
+        self.assertEqual(len(_LIVE_HANDLES), live + 1)
+
+        del mat3
+        gc.collect()
+        self.assertEqual(len(_LIVE_HANDLES), live)
+
+        ref, _ = _create_mkl_sparse(self.mat1)
+        self.assertEqual(len(_LIVE_HANDLES), live + 1)
+        _destroy_mkl_handle(ref)
+        self.assertEqual(len(_LIVE_HANDLES), live)
+
+    def test_release_memory(self):
+        with release_memory() as stats:
+            npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.mat2).A, self.mat1.dot(self.mat2).A)
+
+        self.assertEqual(stats["new_handles"], 0)
+        self.assertGreaterEqual(stats["released_bytes"], 0)
+        self.assertIn("mkl_bytes", stats)
+
+        with release_memory(thread_only=True) as stats:
+            leaked, _ = _create_mkl_sparse(self.mat1)
+            mkl_mat = MKLSparseMatrix(self.mat2)
+
+        self.assertEqual(stats["new_handles"], 2)
+        self.assertEqual(stats["persistent_handles"], memory_stats()["persistent_handles"])
+
+        _destroy_mkl_handle(leaked)
+        mkl_mat.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
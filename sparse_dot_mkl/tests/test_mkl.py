@@ -8,13 +8,22 @@ try:
 except ImportError:
     pass
 
+import gc
+import sys
+import json
+import tempfile
+import subprocess
 import unittest
 import numpy as np
 import numpy.testing as npt
 import scipy.sparse as _spsparse
-from sparse_dot_mkl import dot_product_mkl
+import sparse_dot_mkl._mkl_interface as _mkl_interface
+from sparse_dot_mkl import dot_product_mkl, prepare_mkl, get_version_string
 from sparse_dot_mkl._mkl_interface import (_create_mkl_sparse, _export_mkl, sparse_matrix_t, _destroy_mkl_handle,
-                                           _convert_to_csr, _order_mkl_handle, MKL)
+                                           _convert_to_csr, _order_mkl_handle, _check_scipy_index_typing,
+                                           _INDEX_CACHE, _mkl_init, _interface_layer_int_type, _library_cache_key,
+                                           _read_int_type_cache, _write_int_type_cache, get_version, MKL)
+from sparse_dot_mkl._sparse_sparse import _matmul_mkl
 
 SEED = 86
 
@@ -222,6 +231,185 @@ class TestHandles(unittest.TestCase):
         self.is_sparse_identical_A(self.mat1.astype(np.float32), cycle_3)
 
 
+    def test_export_zero_copy(self):
+        for fmt in ("csr", "csc"):
+            mat1 = self.mat1.asformat(fmt)
+            mat2 = self.mat2.asformat(fmt)
+
+            ref_1, precision_1 = _create_mkl_sparse(mat1)
+            ref_2, precision_2 = _create_mkl_sparse(mat2)
+
+            ref_3 = _matmul_mkl(ref_1, ref_2)
+
+            _destroy_mkl_handle(ref_1)
+            _destroy_mkl_handle(ref_2)
+
+            cycle_3 = _export_mkl(ref_3, precision_1, output_type=fmt, copy=False)
+
+            self.is_sparse_identical_A(mat1.dot(mat2), cycle_3)
+            self.assertEqual(cycle_3.indices.dtype, MKL.MKL_INT_NUMPY)
+            self.assertFalse(cycle_3.data.flags.owndata)
+            self.assertFalse(cycle_3.indptr.flags.owndata)
+
+    def test_export_zero_copy_bsr(self):
+        mat1 = _spsparse.bsr_matrix(self.mat1, blocksize=(10, 10))
+        mat2 = _spsparse.bsr_matrix(self.mat2, blocksize=(10, 10))
+
+        ref_1, precision_1 = _create_mkl_sparse(mat1)
+        ref_2, precision_2 = _create_mkl_sparse(mat2)
+
+        ref_3 = _matmul_mkl(ref_1, ref_2)
+        cycle_3 = _export_mkl(ref_3, precision_1, output_type="bsr", copy=False)
+
+        self.is_sparse_identical_A(mat1.dot(mat2), cycle_3)
+        self.assertFalse(cycle_3.data.flags.owndata)
+
+        _destroy_mkl_handle(ref_1)
+        _destroy_mkl_handle(ref_2)
+
+
+class TestIndexCache(unittest.TestCase):
+
+    def setUp(self):
+        # Build a matrix with indices of the type that MKL doesn't use so that they must be cast
+        _mkl_init()
+        other_int = np.int64 if MKL.MKL_INT_NUMPY == np.int32 else np.int32
+
+        self.mat1 = MATRIX_1.copy()
+        self.mat1.indptr = self.mat1.indptr.astype(other_int)
+        self.mat1.indices = self.mat1.indices.astype(other_int)
+        self.other_int = other_int
+
+    def test_cast(self):
+        cast_1 = _check_scipy_index_typing(self.mat1)
+
+        self.assertEqual(cast_1.indices.dtype, MKL.MKL_INT_NUMPY)
+        self.assertEqual(cast_1.indptr.dtype, MKL.MKL_INT_NUMPY)
+        self.assertIs(cast_1.data, self.mat1.data)
+
+        # The input is not changed
+        self.assertEqual(self.mat1.indices.dtype, self.other_int)
+        self.assertEqual(self.mat1.indptr.dtype, self.other_int)
+
+        # The second call reuses the cast arrays
+        cast_2 = _check_scipy_index_typing(self.mat1)
+        self.assertIs(cast_1.indices, cast_2.indices)
+        self.assertIs(cast_1.indptr, cast_2.indptr)
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, VECTOR), MATRIX_1.dot(VECTOR))
+        self.assertEqual(self.mat1.indices.dtype, self.other_int)
+
+    def test_cache_evicted(self):
+        n_cached = len(_INDEX_CACHE)
+        _check_scipy_index_typing(self.mat1)
+        self.assertEqual(len(_INDEX_CACHE), n_cached + 1)
+
+        del self.mat1
+        gc.collect()
+
+        self.assertEqual(len(_INDEX_CACHE), n_cached)
+
+    def test_indices_changed_in_place(self):
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, VECTOR), MATRIX_1.dot(VECTOR))
+
+        # Reverse the column order in place; the next product must use the new indices
+        reversed_mat = MATRIX_1.copy()
+        reversed_mat.indices = (MATRIX_1.shape[1] - 1 - reversed_mat.indices).astype(reversed_mat.indices.dtype)
+        cast_1 = _check_scipy_index_typing(self.mat1)
+        self.mat1.indices[:] = reversed_mat.indices
+
+        cast_2 = _check_scipy_index_typing(self.mat1)
+        self.assertIsNot(cast_1.indices, cast_2.indices)
+        npt.assert_array_equal(cast_2.indices, reversed_mat.indices)
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, VECTOR), reversed_mat.dot(VECTOR))
+
+        # The in-place change isn't seen by scipy, so the sorted flag is reset before sorting
+        self.mat1.has_sorted_indices = False
+        self.mat1.sort_indices()
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, VECTOR), reversed_mat.dot(VECTOR))
+
+    def test_prepare(self):
+        n_cached = len(_INDEX_CACHE)
+        prepared = prepare_mkl(self.mat1)
+        self.assertEqual(len(_INDEX_CACHE), n_cached)
+
+        self.assertEqual(prepared.indices.dtype, MKL.MKL_INT_NUMPY)
+        self.assertEqual(self.mat1.indices.dtype, self.other_int)
+        self.assertIs(prepared.data, self.mat1.data)
+
+        # A prepared matrix doesn't need to be cast
+        self.assertIs(_check_scipy_index_typing(prepared), prepared)
+        npt.assert_array_almost_equal(dot_product_mkl(prepared, VECTOR), MATRIX_1.dot(VECTOR))
+
+    def test_prepare_bad_input(self):
+        with self.assertRaises(ValueError):
+            prepare_mkl(self.mat1.tocoo())
+
+        with self.assertRaises(ValueError):
+            prepare_mkl(self.mat1.A)
+
+
+class TestInitialization(unittest.TestCase):
+
+    def test_import_does_not_initialize(self):
+        _script = "import numpy as np, scipy.sparse as sps, sparse_dot_mkl\n" \
+                  "from sparse_dot_mkl._mkl_interface import MKL, _INIT_STATE\n" \
+                  "assert not _INIT_STATE['done'] and MKL.MKL_INT is None\n" \
+                  "sparse_dot_mkl.dot_product_mkl(sps.random(10, 10, format='csr'), np.ones(10))\n" \
+                  "assert _INIT_STATE['done'] and MKL.MKL_INT is not None\n"
+
+        _proc = subprocess.run([sys.executable, "-c", _script], capture_output=True, text=True)
+        self.assertEqual(_proc.returncode, 0, _proc.stderr)
+
+    def test_empty_estimate_initializes(self):
+        _script = "import numpy as np, scipy.sparse as sps, sparse_dot_mkl\n" \
+                  "from sparse_dot_mkl._mkl_interface import MKL\n" \
+                  "est = sparse_dot_mkl.estimate_product_nnz(sps.csr_matrix((10, 20)), sps.csr_matrix((20, 5)))\n" \
+                  "assert est['nnz'] == 0 and est['row_nnz'].dtype == MKL.MKL_INT_NUMPY\n"
+
+        _proc = subprocess.run([sys.executable, "-c", _script], capture_output=True, text=True)
+        self.assertEqual(_proc.returncode, 0, _proc.stderr)
+
+    def test_interface_layer(self):
+        _mkl_init()
+        self.assertEqual(_interface_layer_int_type(), MKL.MKL_INT_NUMPY)
+
+    def test_version(self):
+        self.assertGreaterEqual(get_version()["MajorVersion"], 2020)
+        self.assertIn(str(get_version()["MajorVersion"]), get_version_string())
+
+    def test_int_type_cache(self):
+        cache_file = _mkl_interface.MKL_INT_CACHE_FILE
+        cache_key = _library_cache_key()
+
+        if cache_key is None:
+            self.skipTest("Unable to find the MKL library path")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _mkl_interface.MKL_INT_CACHE_FILE = os.path.join(tmp_dir, "cache", "mkl_int.json")
+
+            try:
+                self.assertIsNone(_read_int_type_cache(cache_key))
+
+                _write_int_type_cache(cache_key, np.int64)
+                _write_int_type_cache("other", np.int32)
+
+                self.assertEqual(_read_int_type_cache(cache_key), np.int64)
+                self.assertEqual(_read_int_type_cache("other"), np.int32)
+                self.assertIsNone(_read_int_type_cache(None))
+
+                with open(_mkl_interface.MKL_INT_CACHE_FILE) as cache_fh:
+                    self.assertEqual(json.load(cache_fh)[cache_key], "int64")
+
+                # A broken cache file is ignored
+                with open(_mkl_interface.MKL_INT_CACHE_FILE, "w") as cache_fh:
+                    cache_fh.write("{")
+
+                self.assertIsNone(_read_int_type_cache(cache_key))
+
+            finally:
+                _mkl_interface.MKL_INT_CACHE_FILE = cache_file
+
 def run():
     unittest.main(module='sparse_dot_mkl.tests.test_mkl')
     unittest.main(module='sparse_dot_mkl.tests.test_gram_matrix')
@@ -230,6 +418,7 @@ def run():
     unittest.main(module='sparse_dot_mkl.tests.test_dense_dense')
     unittest.main(module='sparse_dot_mkl.tests.test_qr_solver')
     unittest.main(module='sparse_dot_mkl.tests.test_sparse_vector')
+    unittest.main(module='sparse_dot_mkl.tests.test_mkl_sparse_matrix')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,166 @@
+import gc
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import dot_product_mkl, gram_matrix_mkl, sparse_qr_solve_mkl, MKLSparseMatrix
+from sparse_dot_mkl._mkl_interface import (_PERSISTENT_HANDLES, _PERSISTENT_MATRICES, _create_mkl_sparse,
+                                           _destroy_mkl_handle, _handle_address)
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, VECTOR
+
+
+class TestMKLSparseMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+        self.vec = VECTOR.copy()
+
+    def test_handle_reused(self):
+        mkl_mat = MKLSparseMatrix(self.mat1)
+        address = _handle_address(mkl_mat.handle)
+
+        ref, dbl = _create_mkl_sparse(mkl_mat.matrix)
+        self.assertEqual(_handle_address(ref), address)
+        self.assertTrue(dbl)
+
+        # Destroying through the product functions should do nothing
+        _destroy_mkl_handle(ref)
+        self.assertIn(address, _PERSISTENT_HANDLES)
+
+        mkl_mat.close()
+        self.assertTrue(mkl_mat.closed)
+        self.assertNotIn(address, _PERSISTENT_HANDLES)
+
+    def test_sparse_sparse(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1, MKLSparseMatrix(self.mat2) as mkl_2:
+            for _ in range(3):
+                npt.assert_array_almost_equal(dot_product_mkl(mkl_1, mkl_2).A, self.mat1.dot(self.mat2).A)
+                npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.mat2, dense=True),
+                                              self.mat1.dot(self.mat2).A)
+
+    def test_sparse_dense(self):
+        mat2_d = self.mat2.A
+        mat2_d_f = np.asarray(mat2_d, order="F")
+
+        with MKLSparseMatrix(self.mat1) as mkl_1, MKLSparseMatrix(self.mat2.tocsc()) as mkl_2:
+            for _ in range(3):
+                npt.assert_array_almost_equal(dot_product_mkl(mkl_1, mat2_d), self.mat1.dot(mat2_d))
+                npt.assert_array_almost_equal(dot_product_mkl(mkl_1, mat2_d_f), self.mat1.dot(mat2_d))
+                npt.assert_array_almost_equal(dot_product_mkl(self.mat1.A, mkl_2), self.mat1.A.dot(mat2_d))
+
+    def test_sparse_vector(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            for _ in range(3):
+                npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.vec), self.mat1.dot(self.vec))
+
+    def test_gram_matrix(self):
+        gram = np.triu(np.dot(self.mat1.A.T, self.mat1.A))
+
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            npt.assert_array_almost_equal(gram_matrix_mkl(mkl_1).A, gram)
+            npt.assert_array_almost_equal(gram_matrix_mkl(mkl_1, dense=True), gram)
+
+    def test_qr_solver(self):
+        mat_a = _spsparse.diags(self.mat1.data[0:100].copy(), format="csr")
+        mat_b = self.mat1.data[0:100].copy().reshape(-1, 1)
+
+        with MKLSparseMatrix(mat_a) as mkl_a:
+            npt.assert_array_almost_equal(sparse_qr_solve_mkl(mkl_a, mat_b), np.ones_like(mat_b))
+
+    def test_float32_and_cast(self):
+        with MKLSparseMatrix(self.mat1.astype(np.float32)) as mkl_1:
+            self.assertFalse(mkl_1.double_precision)
+            npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.vec.astype(np.float32)),
+                                          self.mat1.dot(self.vec), decimal=5)
+
+        with self.assertRaises(ValueError):
+            MKLSparseMatrix(self.mat1.astype(np.int64))
+
+        with MKLSparseMatrix(self.mat1.astype(np.int64), cast=True) as mkl_1:
+            self.assertTrue(mkl_1.double_precision)
+
+    def test_closed_still_works(self):
+        mkl_1 = MKLSparseMatrix(self.mat1)
+        mkl_1.close()
+
+        npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.vec), self.mat1.dot(self.vec))
+
+    def test_finalizer(self):
+        mkl_1 = MKLSparseMatrix(self.mat1)
+        address, matrix_id = _handle_address(mkl_1.handle), id(mkl_1.matrix)
+
+        del mkl_1
+        gc.collect()
+
+        self.assertNotIn(address, _PERSISTENT_HANDLES)
+        self.assertNotIn(matrix_id, _PERSISTENT_MATRICES)
+
+    def test_bad_inputs(self):
+        with self.assertRaises(ValueError):
+            MKLSparseMatrix(self.mat1.tocoo())
+
+        with self.assertRaises(ValueError):
+            MKLSparseMatrix(self.mat1.A)
+
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            with self.assertRaises(ValueError):
+                MKLSparseMatrix(mkl_1)
+
+
+class TestOptimizeHints(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2_d = np.ascontiguousarray(MATRIX_2.A[:, 0:10])
+        self.vec = VECTOR.copy()
+
+    def test_optimize_vector(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            for _ in range(3):
+                npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.vec, optimize=3), self.mat1.dot(self.vec))
+
+            self.assertDictEqual(mkl_1.hints, {("mv", False, None, None): 3})
+
+    def test_optimize_vector_transpose(self):
+        vec_t = np.ones(self.mat1.shape[0])
+
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            npt.assert_array_almost_equal(dot_product_mkl(vec_t, mkl_1, optimize=10), vec_t.dot(self.mat1.A))
+            self.assertIn(("mv", True, None, None), mkl_1.hints)
+
+    def test_optimize_dense(self):
+        mat2_f = np.asarray(self.mat2_d, order="F")
+
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            npt.assert_array_almost_equal(dot_product_mkl(mkl_1, self.mat2_d, optimize=5),
+                                          self.mat1.dot(self.mat2_d))
+            npt.assert_array_almost_equal(dot_product_mkl(mkl_1, mat2_f, optimize=5),
+                                          self.mat1.dot(self.mat2_d))
+
+            self.assertEqual(len(mkl_1.hints), 2)
+
+    def test_optimize_explicit(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            mkl_1.optimize(100, operation="mm", layout="F", dense_columns=10)
+            mkl_1.optimize(100, operation="mv", transpose=True, aggressive_memory=False)
+
+            npt.assert_array_almost_equal(dot_product_mkl(mkl_1, np.asarray(self.mat2_d, order="F")),
+                                          self.mat1.dot(self.mat2_d))
+
+        with self.assertRaises(ValueError):
+            mkl_1.optimize(100)
+
+    def test_optimize_bad_args(self):
+        with MKLSparseMatrix(self.mat1) as mkl_1:
+            with self.assertRaises(ValueError):
+                mkl_1.optimize(10, operation="spmm")
+
+            with self.assertRaises(ValueError):
+                mkl_1.optimize(10, operation="mm", layout="X")
+
+            with self.assertRaises(ValueError):
+                mkl_1.optimize(0)
+
+    def test_optimize_scipy_ignored(self):
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.vec, optimize=10), self.mat1.dot(self.vec))
@@ -2,7 +2,8 @@ import unittest
 import numpy as np
 import numpy.testing as npt
 import scipy.sparse as _spsparse
-from sparse_dot_mkl import sparse_qr_solve_mkl
+from sparse_dot_mkl import sparse_qr_solve_mkl, dot_product_mkl, SparseQR, MKLSparseMatrix
+from sparse_dot_mkl._mkl_interface import _handle_address
 from sparse_dot_mkl.tests.test_mkl import MATRIX_1
 
 
@@ -43,6 +44,11 @@ class TestSparseSolver(unittest.TestCase):
         mat3 = sparse_qr_solve_mkl(self.mat1, self.mat2.ravel())
         npt.assert_array_almost_equal(self.mat3.ravel(), mat3)
 
+    def test_sparse_solver_multiple_columns(self):
+        mat2 = np.hstack((self.mat2, self.mat2 * 2))
+        mat3 = sparse_qr_solve_mkl(self.mat1, mat2)
+        npt.assert_array_almost_equal(np.hstack((self.mat3, self.mat3 * 2)), mat3)
+
     def test_solver_guard_errors(self):
         with self.assertRaises(ValueError):
             mat3 = sparse_qr_solve_mkl(self.mat1, self.mat2.T)
@@ -52,3 +58,114 @@ class TestSparseSolver(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             mat3 = sparse_qr_solve_mkl(self.mat1.tocoo(), self.mat2, cast=True)
+
+
+class TestSparseQR(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(50)
+        cls.A = (_spsparse.random(100, 100, density=0.05, format="csr", random_state=50) +
+                 _spsparse.diags(rng.random(100) + 1, format="csr")).tocsr()
+        cls.B = rng.random((100, 5))
+
+    def setUp(self):
+        self.mat1 = self.A.copy()
+        self.mat2 = self.B.copy()
+
+    def test_solve_many(self):
+        with SparseQR(self.mat1) as qr_a:
+            for i in range(self.mat2.shape[1]):
+                npt.assert_array_almost_equal(qr_a.solve(np.ascontiguousarray(self.mat2[:, i])),
+                                              np.linalg.solve(self.mat1.A, self.mat2[:, i]))
+
+            npt.assert_array_almost_equal(qr_a.solve(self.mat2), np.linalg.solve(self.mat1.A, self.mat2))
+            npt.assert_array_almost_equal(qr_a.solve(np.asfortranarray(self.mat2)),
+                                          np.linalg.solve(self.mat1.A, self.mat2))
+
+    def test_solve_many_no_copy(self):
+        # Columns of an F-ordered B are solved in place into the output
+        x_arr = sparse_qr_solve_mkl(self.mat1, np.asfortranarray(self.mat2), strict_no_copy=True)
+        self.assertTrue(x_arr.flags.f_contiguous)
+        npt.assert_array_almost_equal(x_arr, np.linalg.solve(self.mat1.A, self.mat2))
+
+        # A C-ordered B has to be copied into columns
+        with self.assertRaises(ValueError):
+            sparse_qr_solve_mkl(self.mat1, self.mat2, strict_no_copy=True)
+
+    def test_solve_single(self):
+        with SparseQR(self.mat1.astype(np.float32)) as qr_a:
+            npt.assert_array_almost_equal(qr_a.solve(self.mat2.astype(np.float32)),
+                                          np.linalg.solve(self.mat1.A, self.mat2), decimal=4)
+
+            with self.assertRaises(ValueError):
+                qr_a.solve(self.mat2)
+
+            npt.assert_array_almost_equal(qr_a.solve(self.mat2, cast=True),
+                                          np.linalg.solve(self.mat1.A, self.mat2), decimal=4)
+
+    def test_refactorize(self):
+        mat_new = self.mat1.copy()
+        mat_new.data = mat_new.data * 2 + 1
+
+        with SparseQR(self.mat1) as qr_a:
+            qr_a.refactorize(mat_new.data)
+            npt.assert_array_almost_equal(qr_a.solve(self.mat2), np.linalg.solve(mat_new.A, self.mat2))
+
+            qr_a.refactorize(self.mat1)
+            npt.assert_array_almost_equal(qr_a.solve(self.mat2), np.linalg.solve(self.mat1.A, self.mat2))
+
+            # The original matrix should not have been changed
+            npt.assert_array_almost_equal(qr_a.matrix.A, self.mat1.A)
+
+    def test_refactorize_errors(self):
+        with SparseQR(self.mat1) as qr_a:
+            with self.assertRaises(ValueError):
+                qr_a.refactorize(self.mat1.data[1:])
+
+            with self.assertRaises(ValueError):
+                qr_a.refactorize(_spsparse.eye(100, format="csr"))
+
+        with self.assertRaises(ValueError):
+            qr_a.refactorize(self.mat1.data)
+
+        with self.assertRaises(ValueError):
+            qr_a.solve(self.mat2)
+
+    def test_csc(self):
+        with self.assertRaises(ValueError):
+            SparseQR(self.mat1.tocsc())
+
+        with SparseQR(self.mat1.tocsc(), cast=True) as qr_a:
+            npt.assert_array_almost_equal(qr_a.solve(self.mat2), np.linalg.solve(self.mat1.A, self.mat2))
+
+    def test_mkl_sparse_matrix(self):
+        mkl_mat = MKLSparseMatrix(self.mat1)
+        qr_a, qr_b = SparseQR(mkl_mat), SparseQR(mkl_mat)
+
+        # Each factorization has its own handle instead of the MKLSparseMatrix handle
+        self.assertNotEqual(_handle_address(qr_a._handle), _handle_address(mkl_mat.handle))
+        self.assertNotEqual(_handle_address(qr_a._handle), _handle_address(qr_b._handle))
+
+        qr_b.refactorize(self.mat1.data * 2)
+        npt.assert_array_almost_equal(sparse_qr_solve_mkl(mkl_mat, self.mat2), np.linalg.solve(self.mat1.A, self.mat2))
+
+        # Closing the MKLSparseMatrix doesn't affect the factorization
+        mkl_mat.close()
+        npt.assert_array_almost_equal(qr_a.solve(self.mat2), np.linalg.solve(self.mat1.A, self.mat2))
+        npt.assert_array_almost_equal(qr_b.solve(self.mat2), np.linalg.solve(self.mat1.A * 2, self.mat2))
+
+        qr_a.close()
+        qr_b.close()
+        npt.assert_array_almost_equal(dot_product_mkl(mkl_mat, self.mat2), self.mat1.dot(self.mat2))
+
+    def test_guard_errors(self):
+        with self.assertRaises(ValueError):
+            SparseQR(self.mat1.tocoo(), cast=True)
+
+        with self.assertRaises(ValueError):
+            SparseQR(self.mat1.astype(np.int64))
+
+        with SparseQR(self.mat1) as qr_a:
+            with self.assertRaises(ValueError):
+                qr_a.solve(self.mat2.T)
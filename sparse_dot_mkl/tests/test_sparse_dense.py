@@ -36,6 +36,36 @@ class TestSparseDenseMultiplication(unittest.TestCase):
         npt.assert_array_almost_equal(mat3, out)
         self.assertEqual(id(mat3), id(out))
 
+    def test_float64_scalar(self):
+        d1, d2 = self.mat1_d, self.mat2
+
+        npt.assert_array_almost_equal(np.dot(d1, d2.A) * 2., dot_product_mkl(d1, d2, scalar=2.))
+        npt.assert_array_almost_equal(np.dot(self.mat1.A, self.mat2_d) * 2.,
+                                      dot_product_mkl(self.mat1, self.mat2_d, scalar=2.))
+
+        out = np.ones((d1.shape[0], d2.shape[1]), dtype=np.float64, order=self.order)
+        npt.assert_array_almost_equal(np.dot(d1, d2.A) * 2. + 3., dot_product_mkl(d1, d2, scalar=2., out=out,
+                                                                                  out_scalar=3.))
+
+    def test_float64_transpose(self):
+        mat1_t, mat2_t = self.mat1.T.tocsr(), self.mat2.T.tocsr()
+        mat1_d_t = np.asarray(self.mat1_d.T, order=self.order)
+        mat2_d_t = np.asarray(self.mat2_d.T, order=self.order)
+        mat3_np = np.dot(self.mat1_d, self.mat2_d)
+
+        npt.assert_array_almost_equal(mat3_np, dot_product_mkl(mat1_t, np.asarray(self.mat2_d, order=self.order),
+                                                               transpose_a=True))
+        npt.assert_array_almost_equal(mat3_np, dot_product_mkl(mat1_t, mat2_d_t, transpose_a=True,
+                                                               transpose_b=True))
+        npt.assert_array_almost_equal(mat3_np, dot_product_mkl(mat1_d_t, mat2_t, transpose_a=True,
+                                                               transpose_b=True))
+        npt.assert_array_almost_equal(mat3_np, dot_product_mkl(np.asarray(self.mat1_d, order=self.order), mat2_t,
+                                                               transpose_b=True))
+
+        out = np.ones(mat3_np.shape, dtype=np.float64, order=self.order)
+        npt.assert_array_almost_equal(mat3_np + 2., dot_product_mkl(mat1_t, np.asarray(self.mat2_d, order=self.order),
+                                                                    transpose_a=True, out=out, out_scalar=2.))
+
     def test_float64_b_sparse(self):
         d1, d2 = self.mat1_d, self.mat2
 
@@ -2,7 +2,7 @@ import unittest
 import numpy as np
 import numpy.testing as npt
 import scipy.sparse as _spsparse
-from sparse_dot_mkl import dot_product_mkl
+from sparse_dot_mkl import dot_product_mkl, SparseProductPlan, estimate_product_nnz, set_dense_threshold
 from sparse_dot_mkl._mkl_interface import _create_mkl_sparse, _export_mkl, sparse_matrix_t, set_debug_mode
 from sparse_dot_mkl._sparse_sparse import _matmul_mkl
 from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, make_matrixes
@@ -207,6 +207,95 @@ class TestMultiplicationCSR(unittest.TestCase):
         npt.assert_array_almost_equal(mat3.A, mat3_sp.A)
         npt.assert_array_almost_equal(mat3_np, mat3.A)
 
+    def test_dot_product_mkl_zero_copy(self):
+        mat3 = dot_product_mkl(self.mat1, self.mat2, zero_copy=True)
+
+        mat3_sp = self.mat1.dot(self.mat2)
+
+        npt.assert_array_almost_equal(mat3.A, mat3_sp.A)
+        self.assertEqual(mat3.format, self.sparse_output)
+        self.assertFalse(mat3.data.flags.owndata)
+        self.assertFalse(mat3.indices.flags.owndata)
+
+        # Modifying and then dropping the MKL-owned arrays should be safe
+        mat3.data *= 2
+        npt.assert_array_almost_equal(mat3.A, mat3_sp.A * 2)
+
+        data = mat3.data
+        del mat3
+        npt.assert_array_almost_equal(np.sort(data), np.sort(mat3_sp.data * 2))
+
+    def test_zero_copy_all_zeros(self):
+        zero_mat_1 = self.sparse_func((50, 100))
+        zero_mat_2 = self.sparse_func((100, 20))
+
+        zm_mkl = dot_product_mkl(zero_mat_1, zero_mat_2, zero_copy=True)
+
+        self.assertTupleEqual((50, 20), zm_mkl.shape)
+        self.assertEqual(len(zm_mkl.data), 0)
+
+
+    def test_dense_auto(self):
+        mat3_np = np.dot(self.mat1.A, self.mat2.A)
+
+        try:
+            set_dense_threshold(1)
+            mat3 = dot_product_mkl(self.mat1, self.mat2, dense="auto")
+            self.assertTrue(_spsparse.issparse(mat3))
+            self.assertEqual(mat3.format, self.sparse_output)
+            npt.assert_array_almost_equal(mat3.A, mat3_np)
+
+            set_dense_threshold(0)
+            mat3 = dot_product_mkl(self.mat1, self.mat2, dense="auto")
+            self.assertIsInstance(mat3, np.ndarray)
+            npt.assert_array_almost_equal(mat3, mat3_np)
+
+        finally:
+            set_dense_threshold(0.5)
+
+    def test_dense_auto_all_zeros(self):
+        zero_mat_1 = self.sparse_func((50, 100))
+        zero_mat_2 = self.sparse_func((100, 20))
+
+        zm_mkl = dot_product_mkl(zero_mat_1, zero_mat_2, dense="auto")
+
+        self.assertTrue(_spsparse.issparse(zm_mkl))
+        self.assertTupleEqual((50, 20), zm_mkl.shape)
+
+    def test_dense_bad_args(self):
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, dense="dense")
+
+        with self.assertRaises(ValueError):
+            set_dense_threshold(2)
+
+
+    def test_transpose(self):
+        mat1_t = self.sparse_func(self.mat1.T, **self.sparse_args)
+        mat2_t = self.sparse_func(self.mat2.T, **self.sparse_args)
+        mat3_np = np.dot(self.mat1.A, self.mat2.A)
+
+        for mat_a, mat_b, t_a, t_b in ((mat1_t, self.mat2, True, False), (self.mat1, mat2_t, False, True),
+                                       (mat1_t, mat2_t, True, True)):
+            mat3 = dot_product_mkl(mat_a, mat_b, transpose_a=t_a, transpose_b=t_b)
+            self.assertEqual(mat3.format, self.sparse_output)
+            npt.assert_array_almost_equal(mat3.A, mat3_np)
+
+            npt.assert_array_almost_equal(dot_product_mkl(mat_a, mat_b, transpose_a=t_a, transpose_b=t_b,
+                                                          dense=True), mat3_np)
+            mat3_auto = dot_product_mkl(mat_a, mat_b, transpose_a=t_a, transpose_b=t_b, dense="auto")
+            npt.assert_array_almost_equal(mat3_auto.A if _spsparse.issparse(mat3_auto) else mat3_auto, mat3_np)
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, transpose_a=True)
+
+    def test_transpose_all_zeros(self):
+        zero_mat_1 = self.sparse_func((100, 50))
+        zero_mat_2 = self.sparse_func((20, 100))
+
+        zm_mkl = dot_product_mkl(zero_mat_1, zero_mat_2, transpose_a=True, transpose_b=True)
+        self.assertTupleEqual((50, 20), zm_mkl.shape)
+
 
 class TestMultiplicationCSC(TestMultiplicationCSR):
     sparse_func = _spsparse.csc_matrix
@@ -283,3 +372,244 @@ class TestSparseToDenseMultiplication(unittest.TestCase):
         mat3 = dot_product_mkl(d1, d2, copy=True, dense=True)
 
         npt.assert_array_almost_equal(mat3_np, mat3)
+
+
+class TestSparseToDenseOutMultiplication(unittest.TestCase):
+
+    order = "C"
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+
+    def test_out_float64(self):
+        for d1, d2 in ((self.mat1, self.mat2), (self.mat1.tocsc(), self.mat2.tocsc()),
+                       (self.mat1.tobsr(blocksize=(10, 10)), self.mat2.tobsr(blocksize=(10, 10)))):
+            mat3_np = np.dot(d1.A, d2.A)
+
+            out = np.ones(mat3_np.shape, dtype=np.float64, order=self.order)
+            mat3 = dot_product_mkl(d1, d2, out=out, out_scalar=3.)
+
+            self.assertIs(mat3, out)
+            npt.assert_array_almost_equal(mat3_np + 3., mat3)
+
+    def test_out_float32(self):
+        d1, d2 = self.mat1.astype(np.float32), self.mat2.astype(np.float32)
+        mat3_np = np.dot(d1.A, d2.A)
+
+        out = np.ones(mat3_np.shape, dtype=np.float32, order=self.order)
+        mat3 = dot_product_mkl(d1, d2, out=out, out_scalar=3.)
+
+        npt.assert_array_almost_equal(mat3_np + 3., mat3, decimal=5)
+
+    def test_scalar(self):
+        mat3_np = np.dot(self.mat1.A, self.mat2.A)
+
+        out = np.ones(mat3_np.shape, dtype=np.float64, order=self.order)
+        mat3 = dot_product_mkl(self.mat1, self.mat2, out=out, out_scalar=-1., scalar=2.)
+        npt.assert_array_almost_equal(mat3_np * 2 - 1., mat3)
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.mat2, dense=True, scalar=0.5), mat3_np * 0.5)
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.mat2, scalar=0.5).A, mat3_np * 0.5)
+
+    def test_accumulate(self):
+        mat3_np = np.dot(self.mat1.A, self.mat2.A)
+        out = np.zeros(mat3_np.shape, dtype=np.float64, order=self.order)
+
+        for _ in range(3):
+            dot_product_mkl(self.mat1, self.mat2, out=out)
+
+        npt.assert_array_almost_equal(mat3_np * 3, out)
+
+    def test_out_all_zeros(self):
+        zero_mat_1 = _spsparse.csr_matrix((50, 100))
+        zero_mat_2 = _spsparse.csr_matrix((100, 20))
+
+        out = np.ones((50, 20), dtype=np.float64, order=self.order)
+        npt.assert_array_almost_equal(dot_product_mkl(zero_mat_1, zero_mat_2, out=out, out_scalar=2.),
+                                      np.ones((50, 20)) * 2)
+
+    def test_out_errors(self):
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, out=np.ones((self.mat1.shape[0], self.mat2.shape[1]),
+                                                              dtype=np.float32, order=self.order))
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.mat2, out=np.ones((self.mat2.shape[1], self.mat1.shape[0]),
+                                                              order=self.order))
+
+        with self.assertRaises(ValueError):
+            non_contig_out = np.ones((self.mat1.shape[0] * 2, self.mat2.shape[1]), order=self.order)
+            dot_product_mkl(self.mat1, self.mat2, out=non_contig_out[::2, :])
+
+
+class TestSparseToDenseOutMultiplicationF(TestSparseToDenseOutMultiplication):
+
+    order = "F"
+
+
+class TestSparseProductPlanCSR(unittest.TestCase):
+
+    sparse_func = _spsparse.csr_matrix
+    sparse_args = {}
+    sparse_output = "csr"
+
+    def setUp(self):
+        self.mat1 = self.sparse_func(MATRIX_1, **self.sparse_args).copy()
+        self.mat2 = self.sparse_func(MATRIX_2, **self.sparse_args).copy()
+
+    def test_execute(self):
+        with SparseProductPlan(self.mat1, self.mat2) as plan:
+            self.assertTupleEqual(plan.shape, (self.mat1.shape[0], self.mat2.shape[1]))
+
+            mat3 = plan.execute()
+            self.assertEqual(mat3.format, self.sparse_output)
+            npt.assert_array_almost_equal(mat3.A, self.mat1.dot(self.mat2).A)
+
+            # Executing again should give the same answer in the same arrays
+            mat3_again = plan.execute()
+            self.assertEqual(mat3.data.ctypes.data, mat3_again.data.ctypes.data)
+            npt.assert_array_almost_equal(mat3_again.A, self.mat1.dot(self.mat2).A)
+
+    def test_execute_new_values(self):
+        mat1_new, mat2_new = self.mat1.copy(), self.mat2.copy()
+        mat1_new.data = mat1_new.data * 2 + 1
+        mat2_new.data = mat2_new.data - 3
+
+        with SparseProductPlan(self.mat1, self.mat2) as plan:
+            mat3_copy = plan.execute(copy=True)
+
+            npt.assert_array_almost_equal(plan.execute(values_a=mat1_new.data).A, mat1_new.dot(self.mat2).A)
+            npt.assert_array_almost_equal(plan.execute(values_b=mat2_new).A, mat1_new.dot(mat2_new).A)
+            npt.assert_array_almost_equal(plan.execute(self.mat1, self.mat2.data).A, self.mat1.dot(self.mat2).A)
+
+            # A copy should not be overwritten and the original matrices should not be changed
+            npt.assert_array_almost_equal(mat3_copy.A, self.mat1.dot(self.mat2).A)
+            npt.assert_array_almost_equal(self.mat1.A, self.sparse_func(MATRIX_1, **self.sparse_args).A)
+
+    def test_output_outlives_plan(self):
+        plan = SparseProductPlan(self.mat1, self.mat2)
+        mat3 = plan.execute()
+
+        plan.close()
+        self.assertTrue(plan.closed)
+
+        npt.assert_array_almost_equal(mat3.A, self.mat1.dot(self.mat2).A)
+
+        with self.assertRaises(ValueError):
+            plan.execute()
+
+    def test_float32(self):
+        mat1, mat2 = self.mat1.astype(np.float32), self.mat2.astype(np.float32)
+
+        with SparseProductPlan(mat1, mat2) as plan:
+            mat3 = plan.execute()
+            self.assertEqual(mat3.dtype, np.float32)
+            npt.assert_array_almost_equal(mat3.A, mat1.dot(mat2).A, decimal=5)
+
+    def test_all_zeros(self):
+        zero_mat_1 = self.sparse_func((50, 100))
+        zero_mat_2 = self.sparse_func((100, 20))
+
+        with SparseProductPlan(zero_mat_1, zero_mat_2) as plan:
+            zm_mkl = plan.execute()
+
+        self.assertTupleEqual((50, 20), zm_mkl.shape)
+        self.assertEqual(len(zm_mkl.data), 0)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            SparseProductPlan(self.mat1, self.mat2.T)
+
+        with self.assertRaises(ValueError):
+            SparseProductPlan(self.mat1, self.mat2.A)
+
+        with self.assertRaises(ValueError):
+            SparseProductPlan(self.mat1.tocoo(), self.mat2.tocoo())
+
+        with self.assertRaises(ValueError):
+            SparseProductPlan(self.mat1, self.mat2.astype(np.float32))
+
+        with SparseProductPlan(self.mat1, self.mat2) as plan:
+            with self.assertRaises(ValueError):
+                plan.execute(values_a=self.mat1.data[1:])
+
+            with self.assertRaises(ValueError):
+                plan.execute(values_a=self.sparse_func(MATRIX_1 * (MATRIX_1 > 0.5), **self.sparse_args))
+
+
+class TestSparseProductPlanCSC(TestSparseProductPlanCSR):
+
+    sparse_func = _spsparse.csc_matrix
+    sparse_args = {}
+    sparse_output = "csc"
+
+    def test_mixed_formats(self):
+        with self.assertRaises(ValueError):
+            SparseProductPlan(self.mat1, self.mat2.tocsr())
+
+
+class TestSparseProductPlanBSR(TestSparseProductPlanCSR):
+
+    sparse_func = _spsparse.bsr_matrix
+    sparse_args = {"blocksize": (10, 10)}
+    sparse_output = "bsr"
+
+
+class TestEstimateProductNNZ(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+
+    def test_csr(self):
+        mat3 = self.mat1.dot(self.mat2)
+        estimate = estimate_product_nnz(self.mat1, self.mat2)
+
+        self.assertEqual(estimate["nnz"], mat3.nnz)
+        self.assertTupleEqual(estimate["shape"], mat3.shape)
+        npt.assert_array_equal(estimate["row_nnz"], np.diff(mat3.indptr))
+
+        nnz, n_rows = mat3.nnz, mat3.shape[0]
+        self.assertEqual(estimate["bytes"]["csr"]["float64"]["int32"], nnz * 12 + (n_rows + 1) * 4)
+        self.assertEqual(estimate["bytes"]["csr"]["float32"]["int64"], nnz * 12 + (n_rows + 1) * 8)
+        self.assertEqual(estimate["bytes"]["dense"]["float64"], mat3.shape[0] * mat3.shape[1] * 8)
+
+    def test_csc(self):
+        mat1, mat2 = self.mat1.tocsc(), self.mat2.tocsc()
+        mat3 = mat1.dot(mat2)
+        estimate = estimate_product_nnz(mat1, mat2)
+
+        self.assertEqual(estimate["nnz"], mat3.nnz)
+        npt.assert_array_equal(estimate["col_nnz"], np.diff(mat3.indptr))
+        self.assertNotIn("row_nnz", estimate)
+
+    def test_float32_and_cast(self):
+        estimate = estimate_product_nnz(self.mat1.astype(np.float32), self.mat2.astype(np.float32))
+        self.assertEqual(estimate["nnz"], self.mat1.dot(self.mat2).nnz)
+
+        with self.assertRaises(ValueError):
+            estimate_product_nnz(self.mat1.astype(np.int64), self.mat2)
+
+        estimate = estimate_product_nnz(self.mat1.astype(np.int64), self.mat2, cast=True)
+        self.assertEqual(estimate["nnz"], self.mat1.dot(self.mat2).nnz)
+
+    def test_all_zeros(self):
+        estimate = estimate_product_nnz(_spsparse.csr_matrix((50, 100)), _spsparse.csr_matrix((100, 20)))
+
+        self.assertEqual(estimate["nnz"], 0)
+        npt.assert_array_equal(estimate["row_nnz"], np.zeros(50))
+        self.assertEqual(estimate["bytes"]["csr"]["float64"]["int32"], 51 * 4)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            estimate_product_nnz(self.mat1, self.mat2.tocsc())
+
+        with self.assertRaises(ValueError):
+            estimate_product_nnz(self.mat1, self.mat2.A)
+
+        with self.assertRaises(ValueError):
+            estimate_product_nnz(self.mat1.tobsr(blocksize=(10, 10)), self.mat2.tobsr(blocksize=(10, 10)))
+
+        with self.assertRaises(ValueError):
+            estimate_product_nnz(self.mat1, self.mat1)
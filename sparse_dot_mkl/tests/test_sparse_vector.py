@@ -35,6 +35,25 @@ class TestSparseVectorMultiplication(unittest.TestCase):
         npt.assert_array_almost_equal(mat3_np, out)
         self.assertEqual(id(mat3), id(out))
 
+    def test_mult_1d_scalar(self):
+        mat3_np = np.dot(self.mat1_d, self.mat2_d) * 3 + 2
+
+        out = np.ones(mat3_np.shape)
+        mat3 = dot_product_mkl(self.mat1, self.mat2, out=out, out_scalar=2, scalar=3.)
+
+        npt.assert_array_almost_equal(mat3_np, mat3)
+
+    def test_mult_1d_transpose(self):
+        vec_t = np.ones(self.mat1.shape[0])
+        mat1_t = self.mat1.T.asformat(self.mat1.format)
+
+        npt.assert_array_almost_equal(np.dot(self.mat1_d, self.mat2_d), dot_product_mkl(mat1_t, self.mat2,
+                                                                                          transpose_a=True))
+        npt.assert_array_almost_equal(np.dot(vec_t, self.mat1_d), dot_product_mkl(vec_t, mat1_t, transpose_b=True))
+
+        mat3 = dot_product_mkl(vec_t.reshape(-1, 1), mat1_t, transpose_a=True, transpose_b=True)
+        npt.assert_array_almost_equal(np.dot(vec_t, self.mat1_d).reshape(1, -1), mat3)
+
     def test_mult_1d_float32(self):
         d1, d2 = self.mat1.astype(np.float32), self.mat2
 
@@ -185,6 +204,15 @@ class TestVectorSparseMultiplication(TestSparseVectorMultiplication):
         npt.assert_array_almost_equal(mat3_np, mat3)
         self.assertEqual(id(out), id(mat3))
 
+    def test_mult_1d_transpose(self):
+        mat2_t = self.sparse_func(self.mat2_d.T)
+
+        npt.assert_array_almost_equal(np.dot(self.mat1_d, self.mat2_d), dot_product_mkl(self.mat1, mat2_t,
+                                                                                          transpose_b=True))
+
+        mat3 = dot_product_mkl(self.mat1.reshape(-1, 1), mat2_t, transpose_a=True, transpose_b=True)
+        npt.assert_array_almost_equal(np.dot(self.mat1_d, self.mat2_d).reshape(1, -1), mat3)
+
     def test_mult_outer_product_sd(self):
         d1, d2 = self.sparse_func(self.mat1.reshape(-1, 1)), self.mat2_d[:, 0].reshape(1, -1).copy()
 
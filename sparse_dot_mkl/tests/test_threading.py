@@ -0,0 +1,215 @@
+import threading
+import unittest
+import warnings
+import numpy as np
+import numpy.testing as npt
+from sparse_dot_mkl import (dot_product_mkl, gram_matrix_mkl, set_num_threads, get_max_threads, set_dynamic,
+                            mkl_threads, mkl_threadpool_controller, set_oversubscription_mode, set_threading_layer,
+                            get_threading_layer, get_interface_layer)
+from sparse_dot_mkl._mkl_interface import MKL, THREADING_LAYERS, INTERFACE_LAYERS, _layer_code, _layer_name, _mkl_init
+from sparse_dot_mkl._mkl_threadpool import _thread_budget, _available_cores, _ACTIVE_CALLS
+
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2, VECTOR
+
+
+class TestThreads(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat2 = MATRIX_2.copy()
+        self.vec = VECTOR.copy()
+        self.global_threads = get_max_threads()
+
+    def tearDown(self):
+        set_num_threads(self.global_threads)
+        set_dynamic(True)
+        set_oversubscription_mode("warn")
+
+    def test_set_num_threads(self):
+        # MKL will not use more threads globally than there are physical cores
+        set_num_threads(2)
+        self.assertLessEqual(get_max_threads(), 2)
+
+        set_num_threads(1)
+        self.assertEqual(get_max_threads(), 1)
+
+    def test_context_manager(self):
+        with mkl_threads(3):
+            self.assertEqual(get_max_threads(), 3)
+
+            with mkl_threads(2):
+                self.assertEqual(get_max_threads(), 2)
+
+            self.assertEqual(get_max_threads(), 3)
+
+        self.assertEqual(get_max_threads(), self.global_threads)
+
+        with mkl_threads(None):
+            self.assertEqual(get_max_threads(), self.global_threads)
+
+    def test_context_manager_exception(self):
+        with self.assertRaises(RuntimeError):
+            with mkl_threads(3):
+                raise RuntimeError
+
+        self.assertEqual(get_max_threads(), self.global_threads)
+
+    def test_context_manager_thread_local(self):
+        other_thread = {}
+
+        def _get_threads():
+            other_thread["threads"] = get_max_threads()
+
+        with mkl_threads(3):
+            worker = threading.Thread(target=_get_threads)
+            worker.start()
+            worker.join()
+
+        self.assertEqual(other_thread["threads"], self.global_threads)
+
+    def test_dynamic(self):
+        set_dynamic(False)
+        self.assertEqual(MKL._mkl_get_dynamic(), 0)
+
+        set_dynamic(True)
+        self.assertEqual(MKL._mkl_get_dynamic(), 1)
+
+    def test_threads_argument(self):
+        set_oversubscription_mode("ignore")
+
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.mat2, threads=2).A,
+                                      self.mat1.dot(self.mat2).A)
+        npt.assert_array_almost_equal(dot_product_mkl(self.mat1, self.vec, threads=2), self.mat1.dot(self.vec))
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, threads=2, dense=True),
+                                      gram_matrix_mkl(self.mat1, dense=True))
+
+        self.assertEqual(get_max_threads(), self.global_threads)
+
+    def test_bad_threads(self):
+        for bad in (0, -1, 1.5, True):
+            with self.assertRaises(ValueError):
+                set_num_threads(bad)
+
+            with self.assertRaises(ValueError):
+                with mkl_threads(bad):
+                    pass
+
+        with self.assertRaises(ValueError):
+            dot_product_mkl(self.mat1, self.vec, threads=0)
+
+
+class TestThreadpool(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.vec = VECTOR.copy()
+
+    def tearDown(self):
+        set_oversubscription_mode("warn")
+
+    @unittest.skipIf(threadpoolctl is None, "threadpoolctl is not installed")
+    def test_threadpool_controller(self):
+        controller = mkl_threadpool_controller()
+
+        self.assertEqual(len(controller.lib_controllers), 1)
+        self.assertEqual(controller.info()[0]["internal_api"], "mkl")
+
+        with controller.limit(limits=3):
+            self.assertEqual(get_max_threads(), 3)
+
+            with threadpoolctl.threadpool_limits(limits=2, user_api="blas"):
+                self.assertEqual(get_max_threads(), 2)
+
+    def test_thread_budget(self):
+        self.assertEqual(_thread_budget(2, 4, 8, "warn"), (2, False))
+        self.assertEqual(_thread_budget(4, 4, 8, "warn"), (4, True))
+        self.assertEqual(_thread_budget(4, 4, 8, "ignore"), (4, False))
+
+        # Explicit threads are never capped
+        self.assertEqual(_thread_budget(4, 4, 8, "cap"), (4, True))
+
+        with mkl_threads(8):
+            self.assertEqual(_thread_budget(None, 4, 8, "cap"), (2, False))
+            self.assertEqual(_thread_budget(None, 16, 8, "cap"), (1, False))
+            self.assertEqual(_thread_budget(None, 1, 8, "cap"), (None, False))
+
+    def test_oversubscription_warning(self):
+        too_many = _available_cores() + 1
+
+        with self.assertWarns(RuntimeWarning):
+            dot_product_mkl(self.mat1, self.vec, threads=too_many)
+
+        set_oversubscription_mode("ignore")
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            dot_product_mkl(self.mat1, self.vec, threads=too_many)
+
+        self.assertEqual(_ACTIVE_CALLS["count"], 0)
+
+    def test_oversubscription_cap(self):
+        set_oversubscription_mode("cap")
+
+        def _worker(results, barrier):
+            barrier.wait()
+            results.append(dot_product_mkl(self.mat1, self.vec))
+
+        results, barrier = [], threading.Barrier(4)
+        workers = [threading.Thread(target=_worker, args=(results, barrier)) for _ in range(4)]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+
+        self.assertEqual(len(results), 4)
+        for r in results:
+            npt.assert_array_almost_equal(r, self.mat1.dot(self.vec))
+
+        self.assertEqual(_ACTIVE_CALLS["count"], 0)
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            set_oversubscription_mode("explode")
+
+
+class TestLayers(unittest.TestCase):
+
+    def test_active_layers(self):
+        _mkl_init()
+        self.assertIn(get_threading_layer(), THREADING_LAYERS)
+        self.assertEqual(get_interface_layer(), "ILP64" if MKL.MKL_INT_NUMPY == np.int64 else "LP64")
+
+    def test_set_threading_layer(self):
+        active = get_threading_layer()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            self.assertEqual(set_threading_layer(active.lower()), active)
+
+        # MKL has already been used so the layer cannot be changed
+        other = "SEQUENTIAL" if active != "SEQUENTIAL" else "INTEL"
+
+        with self.assertWarns(RuntimeWarning):
+            self.assertEqual(set_threading_layer(other), active)
+
+        self.assertEqual(get_threading_layer(), active)
+
+    def test_layer_codes(self):
+        self.assertEqual(_layer_code(" gnu ", THREADING_LAYERS, "threading"), 3)
+        self.assertEqual(_layer_code("ILP64", INTERFACE_LAYERS, "interface"), 1)
+        self.assertEqual(_layer_name(4, THREADING_LAYERS), "TBB")
+        self.assertIsNone(_layer_name(-1, THREADING_LAYERS))
+
+        with self.assertRaises(ValueError):
+            _layer_code("PGI", THREADING_LAYERS, "threading")
+
+        with self.assertRaises(ValueError):
+            set_threading_layer("OPENMP")
@@ -0,0 +1,116 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy.sparse as _spsparse
+from sparse_dot_mkl import triple_product_mkl, gram_matrix_mkl
+from sparse_dot_mkl.tests.test_mkl import MATRIX_1, MATRIX_2
+
+
+class TestTripleProduct(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat1_d = MATRIX_1.A
+
+        # Symmetric B matrices for AT (dot) B (dot) A (200x200) and A (dot) B (dot) AT (300x300)
+        self.b = (MATRIX_1 @ MATRIX_2 @ MATRIX_2.T @ MATRIX_1.T).tocsr()
+        self.b_t = (MATRIX_2 @ MATRIX_2.T).tocsr()
+
+        self.atba = np.triu(self.mat1_d.T @ self.b.A @ self.mat1_d)
+        self.abat = np.triu(self.mat1_d @ self.b_t.A @ self.mat1_d.T)
+
+    def test_sparse(self):
+        mat3 = triple_product_mkl(self.mat1, _spsparse.triu(self.b, format="csr"), reorder_output=True)
+        self.assertTrue(_spsparse.isspmatrix_csr(mat3))
+        npt.assert_array_almost_equal(np.triu(mat3.A), self.atba)
+
+        mat3 = triple_product_mkl(self.mat1, _spsparse.triu(self.b_t, format="csr"), transpose=True, zero_copy=True)
+        npt.assert_array_almost_equal(np.triu(mat3.A), self.abat)
+
+        mat3 = triple_product_mkl(self.mat1, _spsparse.tril(self.b, format="csr"), fill_mode="lower", scalar=2.)
+        npt.assert_array_almost_equal(np.triu(mat3.A), self.atba * 2)
+
+    def test_sparse_csc(self):
+        mat3 = triple_product_mkl(self.mat1.tocsc(), _spsparse.triu(self.b, format="csc"))
+        npt.assert_array_almost_equal(np.triu(mat3.A), self.atba)
+
+        mat3 = triple_product_mkl(self.mat1.tocsc(), self.b_t.tocsc(), transpose=True)
+        npt.assert_array_almost_equal(np.triu(mat3.A), self.abat)
+
+    def test_dense(self):
+        for b in (self.b.A, np.asarray(self.b.A, order="F")):
+            npt.assert_array_almost_equal(np.triu(triple_product_mkl(self.mat1, b)), self.atba)
+            npt.assert_array_almost_equal(np.triu(triple_product_mkl(self.mat1.tocsc(), b)), self.atba)
+
+        npt.assert_array_almost_equal(np.triu(triple_product_mkl(self.mat1, self.b_t.A, transpose=True)), self.abat)
+
+        out = np.ones((300, 300), order="F")
+        mat3 = triple_product_mkl(self.mat1, self.b.A, out=out, out_scalar=2., scalar=0.5)
+        self.assertIs(mat3, out)
+        npt.assert_array_almost_equal(np.triu(mat3), self.atba * 0.5 + np.triu(np.full((300, 300), 2.)))
+
+    def test_single(self):
+        mat3 = triple_product_mkl(self.mat1.astype(np.float32), self.b.astype(np.float32).A)
+        self.assertEqual(mat3.dtype, np.float32)
+        npt.assert_array_almost_equal(np.triu(mat3), self.atba, decimal=2)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            triple_product_mkl(self.mat1_d, self.b)
+
+        with self.assertRaises(ValueError):
+            triple_product_mkl(self.mat1, self.b_t)
+
+        with self.assertRaises(ValueError):
+            triple_product_mkl(self.mat1, self.b, out=np.zeros((300, 300)))
+
+        with self.assertRaises(ValueError):
+            triple_product_mkl(self.mat1, self.b, fill_mode="full")
+
+        with self.assertRaises(ValueError):
+            triple_product_mkl(self.mat1, self.b.astype(np.float32))
+
+
+class TestWeightedGramMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.mat1 = MATRIX_1.copy()
+        self.mat1_d = MATRIX_1.A
+
+        rng = np.random.default_rng(50)
+        self.weights = rng.random(self.mat1.shape[0])
+        self.weights_t = rng.random(self.mat1.shape[1])
+
+        self.gram = self.mat1_d.T @ np.diag(self.weights) @ self.mat1_d
+        self.gram_t = self.mat1_d @ np.diag(self.weights_t) @ self.mat1_d.T
+
+    def test_sparse(self):
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, weights=self.weights).A, np.triu(self.gram))
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1.tocsc(), weights=self.weights).A, np.triu(self.gram))
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, transpose=True, weights=self.weights_t).A,
+                                      np.triu(self.gram_t))
+
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, weights=self.weights, symmetric="full").A,
+                                      self.gram)
+
+        # Negative weights are only allowed for a sparse upper triangle
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, weights=-self.weights).A, -np.triu(self.gram))
+
+    def test_dense(self):
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1, dense=True, weights=self.weights, symmetric="full"),
+                                      self.gram)
+        npt.assert_array_almost_equal(gram_matrix_mkl(self.mat1_d, weights=self.weights), np.triu(self.gram))
+        npt.assert_array_almost_equal(gram_matrix_mkl(np.asarray(self.mat1_d, order="F"), transpose=True,
+                                                      weights=self.weights_t, symmetric="lower"),
+                                      np.tril(self.gram_t))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            gram_matrix_mkl(self.mat1, weights=self.weights_t)
+
+        with self.assertRaises(ValueError):
+            gram_matrix_mkl(self.mat1, dense=True, weights=-self.weights)
+
+
+if __name__ == '__main__':
+    unittest.main()